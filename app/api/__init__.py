@@ -3,6 +3,7 @@ from .routes.warehouses import router as warehouses_router
 from .routes.products import router as products_router
 from .routes.stocks import router as stocks_router
 from .routes.tabs import router as tabs_router
+from .routes.changes import router as changes_router
 
 api_router = APIRouter()
 
@@ -31,4 +32,10 @@ api_router.include_router(
     tags=["tabs"]
 )
 
+api_router.include_router(
+    changes_router,
+    prefix="/changes",
+    tags=["changes"]
+)
+
 __all__ = ["api_router"]
@@ -0,0 +1,45 @@
+from typing import Iterable, Optional
+
+from fastapi import Request, Response
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..services import current_generations
+
+
+def generation_etag(db: Session, counters: Iterable[str]) -> str:
+    """Слабый ETag из поколений счётчиков изменений (`change_counters`) — один запрос по первичному ключу.
+
+    Поколения читаются до основного запроса: если запись закоммитится между ними, ETag окажется
+    старше тела, и следующий запрос просто получит ответ целиком.
+    """
+    generations = current_generations(db, counters)
+    return 'W/"' + "-".join(f"{name}.{value}" for name, value in generations.items()) + '"'
+
+
+def cache_headers(etag: str) -> dict:
+    return {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={settings.HTTP_CACHE_MAX_AGE_SECONDS}, must-revalidate",
+    }
+
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Слабое сравнение If-None-Match (RFC 9110): префикс W/ не учитывается, `*` совпадает с любым."""
+    if not if_none_match:
+        return False
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or (candidate[2:] if candidate.startswith("W/") else candidate) == opaque:
+            return True
+    return False
+
+
+def not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """Ответ 304, если у клиента актуальная версия; иначе ставит ETag и Cache-Control в `response` и возвращает None."""
+    headers = cache_headers(etag)
+    if _matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,128 @@
+import gzip
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Type
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+from ..core.config import settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    JSON_BACKEND = "orjson"
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+elif msgspec is not None:
+    JSON_BACKEND = "msgspec"
+    _msgspec_encoder = msgspec.json.Encoder(enc_hook=_default)
+
+    def dumps(obj: Any) -> bytes:
+        return _msgspec_encoder.encode(obj)
+else:
+    JSON_BACKEND = "json"
+
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class ColumnRows:
+    """Колонки модели по полям схемы ответа и сборка словарей из кортежей строк.
+
+    Запрос выбирает только эти колонки (`query.with_entities(*rows.columns)`), поэтому
+    ORM-объекты и `Schema.from_orm` на каждую строку не создаются. `nested` — вложенные
+    объекты схемы ({поле: (модель, схема)}): их колонки идут следом, таблицы присоединяет запрос.
+    Остальные поля схемы, которых нет в таблице, получают значение по умолчанию.
+    """
+
+    def __init__(self, model, schema: Type[BaseModel], nested: Optional[Dict[str, tuple]] = None):
+        table_columns = model.__table__.columns
+        nested = nested or {}
+        self.names = [name for name in schema.model_fields if name in table_columns]
+        self.columns = [getattr(model, name) for name in self.names]
+        self.nested = [(name, ColumnRows(*nested[name])) for name in schema.model_fields if name in nested]
+        for _, child in self.nested:
+            self.columns += child.columns
+        self.defaults = {
+            name: field.default for name, field in schema.model_fields.items()
+            if name not in table_columns and name not in nested
+        }
+
+    def dicts(self, rows: Iterable[Sequence[Any]]) -> List[Dict[str, Any]]:
+        names, nested, defaults = self.names, self.nested, self.defaults
+        if not nested and not defaults:
+            return [dict(zip(names, row)) for row in rows]
+        width = len(names)
+        items = []
+        for row in rows:
+            item = dict(zip(names, row))
+            offset = width
+            for name, child in nested:
+                item[name] = dict(zip(child.names, row[offset:offset + len(child.names)]))
+                offset += len(child.names)
+            item.update(defaults)
+            items.append(item)
+        return items
+
+
+def json_response(request: Request, payload: Any, headers: Optional[dict] = None) -> Response:
+    """Ответ с JSON-байтами из `dumps`; большие тела сжимаются gzip, если клиент его принимает."""
+    body = dumps(payload)
+    headers = dict(headers or {})
+    min_bytes = settings.FAST_JSON_GZIP_MIN_BYTES
+    if min_bytes:
+        headers["Vary"] = "Accept-Encoding"
+        if len(body) >= min_bytes and "gzip" in request.headers.get("accept-encoding", ""):
+            body = gzip.compress(body, compresslevel=settings.FAST_JSON_GZIP_LEVEL)
+            headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def api_payload(
+    data: Any,
+    count: Optional[int] = None,
+    total: Optional[int] = None,
+    next_cursor: Optional[str] = None,
+    message: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Словарь той же формы, что у `APIResponse`, без валидации Pydantic."""
+    return {
+        "success": True,
+        "data": data,
+        "message": message,
+        "count": count,
+        "total": total,
+        "next_cursor": next_cursor,
+    }
+
+
+def api_json_response(
+    request: Request,
+    data: Any,
+    count: Optional[int] = None,
+    total: Optional[int] = None,
+    next_cursor: Optional[str] = None,
+    message: Optional[str] = None,
+) -> Response:
+    """Тело той же формы, что у `APIResponse`, без валидации и сериализации Pydantic."""
+    return json_response(request, api_payload(data, count, total, next_cursor, message))
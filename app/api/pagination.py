@@ -0,0 +1,88 @@
+import base64
+import json
+from typing import Any, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, tuple_
+
+
+def encode_cursor(sort_key: str, value: Any, row_id: int) -> str:
+    """Непрозрачный курсор keyset-пагинации: ключ сортировки, значение колонки и id последней строки."""
+    payload = json.dumps({"s": sort_key, "v": value, "id": row_id}, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_key: str) -> Tuple[Any, int]:
+    """Разобрать курсор. Курсор от другой сортировки или повреждённый — 400."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        value, row_id = payload["v"], int(payload["id"])
+        cursor_sort_key = payload["s"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Некорректный cursor")
+    if cursor_sort_key != sort_key:
+        raise HTTPException(status_code=400, detail="cursor не соответствует сортировке")
+    return value, row_id
+
+
+def order_keyset(query, sort_expr, id_column, descending: bool):
+    """ORDER BY <колонка> NULLS LAST, id в том же направлении — порядок, по которому работает курсор."""
+    if sort_expr is None:
+        return query.order_by(id_column.desc() if descending else id_column.asc())
+    if descending:
+        return query.order_by(sort_expr.desc().nullslast(), id_column.desc())
+    return query.order_by(sort_expr.asc().nullslast(), id_column.asc())
+
+
+def after_cursor(query, sort_expr, id_column, descending: bool, value: Any, row_id: int):
+    """WHERE «строка после курсора» внутри сегмента, в котором стоит курсор.
+
+    Строки с непустым значением сравниваются парой `(колонка, id) > (значение, id)` — строки с NULL
+    в неё не попадают, их отдельным хвостом добирает `keyset_page`. Курсор из хвоста (значение NULL)
+    продолжает его по id.
+    """
+    id_after = id_column < row_id if descending else id_column > row_id
+    if sort_expr is None:
+        return query.filter(id_after)
+    if value is None:
+        return query.filter(and_(sort_expr.is_(None), id_after))
+    key, bound = tuple_(sort_expr, id_column), tuple_(value, row_id)
+    return query.filter(key < bound if descending else key > bound)
+
+
+def keyset_page(query, sort_expr, id_column, descending: bool, limit: int, after: Optional[Tuple[Any, int]] = None) -> list:
+    """Страница строк в порядке `order_keyset` после `after` — (значение, id) последней строки, None — с начала.
+
+    NULL-значения идут отдельным хвостовым сегментом: сначала строки с непустым значением
+    (`IS NOT NULL`, сравнение пар, ORDER BY колонка, id), и только если страница не заполнилась —
+    строки с NULL по id. В каждом сегменте условие и порядок совпадают с составным индексом
+    (колонка, id), в том числе по убыванию (обратный проход индекса), поэтому страница N стоит
+    столько же, сколько первая. Без сортировки по колонке — один запрос по id.
+    """
+    direction = (lambda column: column.desc()) if descending else (lambda column: column.asc())
+    if sort_expr is None:
+        if after is not None:
+            query = after_cursor(query, None, id_column, descending, None, after[1])
+        return query.order_by(direction(id_column)).limit(limit).all()
+
+    rows = []
+    if after is None or after[0] is not None:
+        head = query.filter(sort_expr.isnot(None))
+        if after is not None:
+            head = after_cursor(head, sort_expr, id_column, descending, *after)
+        rows = head.order_by(direction(sort_expr), direction(id_column)).limit(limit).all()
+        if len(rows) == limit:
+            return rows
+        tail = query.filter(sort_expr.is_(None))
+    else:
+        tail = after_cursor(query, sort_expr, id_column, descending, *after)
+    return rows + tail.order_by(direction(id_column)).limit(limit - len(rows)).all()
+
+
+def next_cursor(sort_key: str, rows: List[Tuple[Any, Any]], limit: int, id_of) -> Optional[str]:
+    """Курсор следующей страницы по последней строке (объект, значение сортировки); None, если страница неполная."""
+    if not rows or len(rows) < limit:
+        return None
+    last_obj, last_value = rows[-1]
+    return encode_cursor(sort_key, last_value, id_of(last_obj))
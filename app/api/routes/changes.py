@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+from ..schemas import APIResponse
+from ..pagination import decode_cursor, encode_cursor
+from ...models import get_db
+from ...services import current_generation, read_changes
+from ...services.change_feed import CHANGE_ENTITIES
+
+router = APIRouter()
+
+# Ключ сортировки в курсоре ленты: (change_gen, id) по возрастанию
+CHANGES_SORT_KEY = "change_gen:asc"
+
+
+@router.get("/", response_model=APIResponse)
+def get_changes(
+    since: int = Query(0, ge=0, description="Поколение, после которого нужны изменения (0 — все строки)"),
+    entity: str = Query("products", description="products или stocks"),
+    limit: int = Query(500, ge=1, le=5000),
+    cursor: Optional[str] = Query(None, description="Курсор из next_cursor предыдущей страницы"),
+    db: Session = Depends(get_db)
+):
+    """Лента изменений: товары или остатки, записанные после поколения `since`.
+
+    Клиент листает страницы по `next_cursor`, а после последней страницы (`next_cursor` = null)
+    запоминает `generation` и в следующий раз передаёт его как `since`. `generation` читается
+    до строк страницы: всё, что закоммичено до него, лента уже отдала.
+    """
+    if entity not in CHANGE_ENTITIES:
+        raise HTTPException(status_code=400, detail=f"entity must be one of: {', '.join(CHANGE_ENTITIES)}")
+    after = None
+    if cursor:
+        last_gen, last_id = decode_cursor(cursor, f"{entity}:{CHANGES_SORT_KEY}")
+        after = (int(last_gen), last_id)
+
+    generation = current_generation(db)
+    rows = read_changes(db, entity, since, limit, after)
+    next_page = None
+    if len(rows) == limit:
+        next_page = encode_cursor(f"{entity}:{CHANGES_SORT_KEY}", rows[-1]["change_gen"], rows[-1]["id"])
+
+    return APIResponse(
+        success=True,
+        data={"entity": entity, "since": since, "generation": generation, "items": rows},
+        count=len(rows),
+        next_cursor=next_page
+    )
@@ -1,46 +1,55 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import or_, and_, distinct
-from typing import List, Optional
-from ..schemas import ProductResponse, APIResponse, ProductFilter
-from ...models import Product, Warehouse, Stock, get_db
-from ...services import RemonlineService
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, aliased, joinedload
+from sqlalchemy import or_, and_, distinct, false, func
+from typing import Dict, List, Optional
+import csv
+import io
+import json
+from ..schemas import ProductResponse, APIResponse, ProductFilter, ProductBulkRefreshRequest
+from ..pagination import decode_cursor, keyset_page, next_cursor, order_keyset
+from ..conditional import cache_headers, generation_etag, not_modified
+from ..fast_json import ColumnRows, api_json_response, api_payload, dumps
+from ...models import Product, Warehouse, Stock, ProductStockTotal, SubTab, SubTabProduct, get_db, run_db
+from ...models.database import SessionLocal
+from ...services import RemonlineService, get_data_generation, products_cache
+from ...services.change_feed import CATALOG_COUNTER, WAREHOUSES_COUNTER
+from ...services.product_refresh import locate_good, refresh_products
+from ...services.bulk_upsert import upsert_locations
+from ...services.product_search import apply_product_search
+from ...services.catalog_index import catalog_index
 from datetime import datetime
 from loguru import logger
 
 router = APIRouter()
 
-@router.get("/filtered", response_model=APIResponse)
-async def get_products_filtered(
-    skip: int = 0,
-    limit: int = 100,
+# Колонки ProductResponse: списки товаров собираются из кортежей без ORM-объектов
+PRODUCT_ROWS = ColumnRows(Product, ProductResponse)
+
+def _build_filtered_products_query(
+    db: Session,
     name: Optional[str] = None,
     sku: Optional[str] = None,
     category: Optional[str] = None,
-    warehouse_ids: Optional[str] = Query(None, description="Comma-separated warehouse remonline IDs"),
-    remonline_ids: Optional[str] = Query(None, description="Comma-separated product remonline IDs for subtab filtering"),
+    warehouse_ids: Optional[str] = None,
+    remonline_ids: Optional[str] = None,
     price_min: Optional[float] = None,
     price_max: Optional[float] = None,
     stock_min: Optional[float] = None,
     stock_max: Optional[float] = None,
-    is_active: Optional[bool] = Query(None, description="Filter by active status"),
-    sort_by: Optional[str] = Query("name", description="Field to sort by: name, category, price, total_stock, wh_{warehouse_id}"),
-    sort_order: Optional[str] = Query("desc", description="Sort order: asc, desc"),
-    db: Session = Depends(get_db)
+    is_active: Optional[bool] = None,
 ):
-    """Получить товары с расширенными фильтрами по складам и остаткам"""
-    from sqlalchemy import func, select
-    
+    """Собрать запрос товаров с фильтрами /filtered.
+
+    Возвращает (query, выражение релевантности поиска по `name` или None);
+    query = None, если результат заведомо пуст.
+    """
     # Базовый запрос товаров
     query = db.query(Product)
     
     # Применяем текстовые фильтры
-    if name:
-        # Нечеткий поиск по названию и RemID
-        query = query.filter(or_(
-            Product.name.ilike(f"%{name}%"),
-            Product.remonline_id.ilike(f"%{name}%")
-        ))
+    # Поиск по названию и RemID — через поисковый индекс (FTS5 / pg_trgm), см. product_search
+    query, rank = apply_product_search(query, db, name)
     if sku:
         query = query.filter(Product.sku.ilike(f"%{sku}%"))
     if category:
@@ -101,48 +110,47 @@ async def get_products_filtered(
                         ).distinct()
                 else:
                     # Указанные склады не найдены
-                    return APIResponse(success=True, data=[], count=0, total=0)
+                    return None, None
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid warehouse_ids format")
     else:
         # Если склады не указаны, но есть фильтр по остаткам, применяем к общему остатку
+        # из поддерживаемого синхронизацией агрегата (индекс по total_available)
         if stock_min is not None or stock_max is not None:
-            stock_sum_cte = db.query(
-                Stock.product_id,
-                func.sum(Stock.available_quantity).label('total_stock')
-            ).group_by(Stock.product_id).cte('stock_sum')
-            
-            query = query.join(stock_sum_cte, Product.id == stock_sum_cte.c.product_id)
+            query = query.join(ProductStockTotal, ProductStockTotal.product_id == Product.id)
             if stock_min is not None:
-                query = query.filter(stock_sum_cte.c.total_stock >= stock_min)
+                query = query.filter(ProductStockTotal.total_available >= stock_min)
             if stock_max is not None:
-                query = query.filter(stock_sum_cte.c.total_stock <= stock_max)
-    
-    # Оптимизация: получаем общее количество до применения пагинации
-    # Используем count() без вложенного запроса
-    from sqlalchemy import func as sql_func
-    total_count = query.with_entities(sql_func.count(Product.id.distinct())).scalar()
-    
-    # Применяем сортировку (оптимизировано с использованием CTE)
+                query = query.filter(ProductStockTotal.total_available <= stock_max)
+
+    return query, rank
+
+
+def _products_sort_expr(query, db: Session, sort_by: Optional[str], sort_order: Optional[str], rank=None):
+    """Колонка сортировки /filtered с нужными JOIN.
+
+    Возвращает (query, выражение, ключ сортировки для курсора, по убыванию ли).
+    """
+    sort_by = sort_by or "name"
+    descending = sort_order == "desc"
+    if sort_by == "relevance" and rank is not None:
+        # Релевантность поиска по name: лучшие совпадения первыми
+        return query, rank, sort_by, True
+    if sort_by == "id":
+        # Порядок добавления товаров — как у GET /products/
+        return query, Product.id, sort_by, descending
     if sort_by == "name":
-        query = query.order_by(Product.name.desc() if sort_order == "desc" else Product.name.asc())
-    elif sort_by == "category":
-        query = query.order_by(Product.category.desc() if sort_order == "desc" else Product.category.asc())
-    elif sort_by == "price":
-        query = query.order_by(Product.price.desc() if sort_order == "desc" else Product.price.asc())
-    elif sort_by == "total_stock":
-        # Сортировка по общему остатку - используем CTE
-        stock_sum_cte = db.query(
-            Stock.product_id,
-            func.sum(Stock.available_quantity).label('total_stock')
-        ).group_by(Stock.product_id).cte('stock_sum_sort')
-        
-        query = query.outerjoin(stock_sum_cte, Product.id == stock_sum_cte.c.product_id)
-        query = query.order_by(
-            stock_sum_cte.c.total_stock.desc().nullslast() if sort_order == "desc" 
-            else stock_sum_cte.c.total_stock.asc().nullslast()
-        )
-    elif sort_by.startswith("wh_"):
+        return query, Product.name, sort_by, descending
+    if sort_by == "category":
+        return query, Product.category, sort_by, descending
+    if sort_by == "price":
+        return query, Product.price, sort_by, descending
+    if sort_by == "total_stock":
+        # Сортировка по общему остатку - по агрегату product_stock_totals без GROUP BY
+        total_sort = aliased(ProductStockTotal, name="total_sort")
+        query = query.outerjoin(total_sort, total_sort.product_id == Product.id)
+        return query, total_sort.total_available, sort_by, descending
+    if sort_by.startswith("wh_"):
         # Сортировка по остатку на конкретном складе - используем простой subquery
         try:
             wh_remonline_id = int(sort_by.split("_")[1])
@@ -153,54 +161,395 @@ async def get_products_filtered(
                     Stock.product_id,
                     Stock.available_quantity
                 ).filter(Stock.warehouse_id == wh_id).cte('wh_stock_sort')
-                
+
                 query = query.outerjoin(wh_stock_cte, Product.id == wh_stock_cte.c.product_id)
-                query = query.order_by(
-                    wh_stock_cte.c.available_quantity.desc().nullslast() if sort_order == "desc" 
-                    else wh_stock_cte.c.available_quantity.asc().nullslast()
-                )
-            else:
-                # Склад не найден, сортировка по умолчанию
-                query = query.order_by(Product.name.asc())
+                return query, wh_stock_cte.c.available_quantity, sort_by, descending
         except (ValueError, IndexError):
             # Неверный формат, используем сортировку по умолчанию
-            query = query.order_by(Product.name.asc())
+            pass
+    # Сортировка по умолчанию (и для несуществующего склада)
+    return query, Product.name, "name", False
+
+
+def _paginate_products(
+    query,
+    db: Session,
+    sort_by: Optional[str],
+    sort_order: Optional[str],
+    skip: int,
+    limit: int,
+    cursor: Optional[str] = None,
+    rank=None,
+):
+    """Отсортировать и взять страницу товаров: по `cursor` (keyset) или по `skip` (offset).
+
+    Порядок — колонка сортировки NULLS LAST, затем id. Первая страница и страницы по курсору
+    выбираются `keyset_page` (по индексу (колонка, id)), `skip` — OFFSET. Строки — кортежи колонок
+    `ProductResponse` (`PRODUCT_ROWS`), без ORM-объектов. Возвращает (словари товаров, курсор следующей страницы).
+    """
+    query, sort_expr, sort_key, descending = _products_sort_expr(query, db, sort_by, sort_order, rank)
+    sort_key = f"{sort_key}:{'desc' if descending else 'asc'}"
+    query = query.with_entities(*PRODUCT_ROWS.columns, sort_expr)
+    if cursor or not skip:
+        after = decode_cursor(cursor, sort_key) if cursor else None
+        rows = keyset_page(query, sort_expr, Product.id, descending, limit, after)
     else:
-        # Сортировка по умолчанию
-        query = query.order_by(Product.name.asc())
+        rows = order_keyset(query, sort_expr, Product.id, descending).offset(skip).limit(limit).all()
+    products = PRODUCT_ROWS.dicts(rows)
+    # Значение сортировки — последняя колонка кортежа
+    keyed = [(product, row[-1]) for product, row in zip(products, rows)]
+    return products, next_cursor(sort_key, keyed, limit, lambda product: product["id"])
+
+
+def _load_stock_matrix(db: Session, product_ids: List[int]) -> Dict[int, Dict[int, float]]:
+    """Остатки страницы товаров одним сгруппированным запросом: {product_id: {warehouse_remonline_id: available}}."""
+    matrix: Dict[int, Dict[int, float]] = {pid: {} for pid in product_ids}
+    if not product_ids:
+        return matrix
+
+    rows = db.query(
+        Stock.product_id,
+        Warehouse.remonline_id,
+        func.sum(Stock.available_quantity),
+    ).join(
+        Warehouse, Warehouse.id == Stock.warehouse_id
+    ).filter(
+        Stock.product_id.in_(product_ids)
+    ).group_by(Stock.product_id, Warehouse.remonline_id).all()
+
+    for product_id, wh_remonline_id, available in rows:
+        matrix[product_id][wh_remonline_id] = available or 0
+    return matrix
+
+
+def _normalize_ids(raw: Optional[str]) -> Optional[tuple]:
+    if not raw:
+        return None
+    ids = set()
+    for part in raw.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if not part.isdigit():
+            # Некорректный список не смешиваем с валидными: запрос сам вернёт 400
+            return (raw,)
+        ids.add(int(part))
+    return tuple(sorted(ids))
+
+
+def _filters_cache_key(endpoint: str, **params) -> tuple:
+    """Ключ кэша по нормализованным параметрам: порядок, дубли и пробелы в списках id, регистр sort_order не важны."""
+    normalized = []
+    for key, value in sorted(params.items()):
+        if key in ("warehouse_ids", "remonline_ids"):
+            value = _normalize_ids(value)
+        elif key == "sort_order" and value:
+            value = value.lower()
+        elif isinstance(value, str):
+            value = value or None
+        normalized.append((key, value))
+    return (endpoint, tuple(normalized))
+
+
+def _cached_json(payload: dict, key: tuple, generation: int, headers: Optional[dict] = None) -> Response:
+    """Закодировать ответ один раз (`fast_json.dumps`) и положить байты в кэш."""
+    body = dumps(payload)
+    products_cache.set(key, body, generation)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.get("/filtered", response_model=APIResponse)
+def get_products_filtered(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    name: Optional[str] = None,
+    sku: Optional[str] = None,
+    category: Optional[str] = None,
+    warehouse_ids: Optional[str] = Query(None, description="Comma-separated warehouse remonline IDs"),
+    remonline_ids: Optional[str] = Query(None, description="Comma-separated product remonline IDs for subtab filtering"),
+    price_min: Optional[float] = None,
+    price_max: Optional[float] = None,
+    stock_min: Optional[float] = None,
+    stock_max: Optional[float] = None,
+    is_active: Optional[bool] = Query(None, description="Filter by active status"),
+    sort_by: Optional[str] = Query("name", description="Field to sort by: name, id, category, price, total_stock, wh_{warehouse_id}, relevance (with name)"),
+    sort_order: Optional[str] = Query("desc", description="Sort order: asc, desc"),
+    cursor: Optional[str] = Query(None, description="Keyset-курсор из next_cursor предыдущей страницы (вместо skip)"),
+    db: Session = Depends(get_db)
+):
+    """Получить товары с расширенными фильтрами по складам и остаткам.
+
+    Ответ кэшируется в процессе по нормализованным параметрам до следующего коммита синхронизации.
+    С `cursor` страница выбирается по ключу (колонка сортировки, id) и общий count не считается.
+    ETag — поколения товаров/остатков и складов: без изменений клиент получает 304 без запроса к товарам.
+    """
+    etag = generation_etag(db, [CATALOG_COUNTER, WAREHOUSES_COUNTER])
+    unchanged = not_modified(request, response, etag)
+    if unchanged is not None:
+        return unchanged
+    headers = cache_headers(etag)
+    # ETag в ключе: ответ зависит и от складов, а поколение кэша — только от товаров и остатков
+    cache_key = _filters_cache_key(
+        "filtered", skip=skip, limit=limit, name=name, sku=sku, category=category,
+        warehouse_ids=warehouse_ids, remonline_ids=remonline_ids,
+        price_min=price_min, price_max=price_max, stock_min=stock_min, stock_max=stock_max,
+        is_active=is_active, sort_by=sort_by, sort_order=sort_order, cursor=cursor, etag=etag,
+    )
+    generation = get_data_generation(db)
+    cached = products_cache.get(cache_key, generation)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json", headers=headers)
+
+    query, rank = _build_filtered_products_query(
+        db, name=name, sku=sku, category=category,
+        warehouse_ids=warehouse_ids, remonline_ids=remonline_ids,
+        price_min=price_min, price_max=price_max,
+        stock_min=stock_min, stock_max=stock_max, is_active=is_active,
+    )
+    if query is None:
+        return _cached_json(api_payload([], count=0, total=0), cache_key, generation, headers)
     
-    # Применяем пагинацию
-    products = query.offset(skip).limit(limit).all()
+    # Оптимизация: получаем общее количество до применения пагинации
+    # Используем count() без вложенного запроса; для страниц по курсору total уже известен клиенту
+    total_count = None if cursor else query.with_entities(func.count(Product.id.distinct())).scalar()
     
-    return APIResponse(
-        success=True,
-        data=[ProductResponse.from_orm(product) for product in products],
+    products, next_page_cursor = _paginate_products(query, db, sort_by, sort_order, skip, limit, cursor, rank)
+    
+    return _cached_json(api_payload(
+        products,
+        count=len(products),
+        total=total_count,
+        next_cursor=next_page_cursor,
+        message=f"Found {total_count} products matching filters" if total_count is not None else None
+    ), cache_key, generation, headers)
+
+
+@router.get("/matrix", response_model=APIResponse)
+def get_products_matrix(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    name: Optional[str] = None,
+    sku: Optional[str] = None,
+    category: Optional[str] = None,
+    warehouse_ids: Optional[str] = Query(None, description="Comma-separated warehouse remonline IDs"),
+    remonline_ids: Optional[str] = Query(None, description="Comma-separated product remonline IDs for subtab filtering"),
+    price_min: Optional[float] = None,
+    price_max: Optional[float] = None,
+    stock_min: Optional[float] = None,
+    stock_max: Optional[float] = None,
+    is_active: Optional[bool] = Query(None, description="Filter by active status"),
+    sort_by: Optional[str] = Query("name", description="Field to sort by: name, id, category, price, total_stock, wh_{warehouse_id}, relevance (with name)"),
+    sort_order: Optional[str] = Query("desc", description="Sort order: asc, desc"),
+    cursor: Optional[str] = Query(None, description="Keyset-курсор из next_cursor предыдущей страницы (вместо skip)"),
+    db: Session = Depends(get_db)
+):
+    """Страница товаров вместе с остатками по складам за один запрос (вместо /stocks/product/{id} на каждый товар).
+
+    Фильтры и сортировка совпадают с /filtered. Каждый товар дополнен полем
+    `stocks` вида {warehouse_remonline_id: available_quantity}. Кэшируется и отвечает 304
+    по ETag так же, как /filtered.
+    """
+    etag = generation_etag(db, [CATALOG_COUNTER, WAREHOUSES_COUNTER])
+    unchanged = not_modified(request, response, etag)
+    if unchanged is not None:
+        return unchanged
+    headers = cache_headers(etag)
+    cache_key = _filters_cache_key(
+        "matrix", skip=skip, limit=limit, name=name, sku=sku, category=category,
+        warehouse_ids=warehouse_ids, remonline_ids=remonline_ids,
+        price_min=price_min, price_max=price_max, stock_min=stock_min, stock_max=stock_max,
+        is_active=is_active, sort_by=sort_by, sort_order=sort_order, cursor=cursor, etag=etag,
+    )
+    generation = get_data_generation(db)
+    cached = products_cache.get(cache_key, generation)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json", headers=headers)
+
+    query, rank = _build_filtered_products_query(
+        db, name=name, sku=sku, category=category,
+        warehouse_ids=warehouse_ids, remonline_ids=remonline_ids,
+        price_min=price_min, price_max=price_max,
+        stock_min=stock_min, stock_max=stock_max, is_active=is_active,
+    )
+    if query is None:
+        return _cached_json(api_payload([], count=0, total=0), cache_key, generation, headers)
+
+    total_count = None if cursor else query.with_entities(func.count(Product.id.distinct())).scalar()
+    products, next_page_cursor = _paginate_products(query, db, sort_by, sort_order, skip, limit, cursor, rank)
+
+    # Один сгруппированный запрос по stocks на всю страницу
+    matrix = _load_stock_matrix(db, [p["id"] for p in products])
+    for product in products:
+        product["stocks"] = matrix.get(product["id"], {})
+
+    return _cached_json(api_payload(
+        products,
         count=len(products),
         total=total_count,
-        message=f"Found {total_count} products matching filters"
+        next_cursor=next_page_cursor,
+        message=f"Found {total_count} products matching filters" if total_count is not None else None
+    ), cache_key, generation, headers)
+
+
+# Товаров в одной пачке выгрузки: столько строк держится в памяти одновременно
+EXPORT_BATCH_SIZE = 1000
+EXPORT_COLUMNS = ("id", "remonline_id", "name", "sku", "category", "price", "is_active", "total_stock")
+
+
+def _export_rows(db: Session, query, warehouses: List[Warehouse]):
+    """Строки выгрузки пачками: товары серверным курсором (`yield_per`), остатки пачки одним запросом."""
+    rows = query.with_entities(
+        Product.id, Product.remonline_id, Product.name, Product.sku,
+        Product.category, Product.price, Product.is_active,
+    ).order_by(Product.id).yield_per(EXPORT_BATCH_SIZE)
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield _pivot_batch(db, batch, warehouses)
+            batch = []
+    if batch:
+        yield _pivot_batch(db, batch, warehouses)
+
+
+def _pivot_batch(db: Session, batch, warehouses: List[Warehouse]) -> List[Dict]:
+    matrix = _load_stock_matrix(db, [row.id for row in batch])
+    result = []
+    for row in batch:
+        stocks = matrix.get(row.id, {})
+        item = {
+            "id": row.id,
+            "remonline_id": row.remonline_id,
+            "name": row.name,
+            "sku": row.sku,
+            "category": row.category,
+            "price": row.price,
+            "is_active": row.is_active,
+            "total_stock": sum(stocks.values()),
+        }
+        for wh in warehouses:
+            item[f"wh_{wh.remonline_id}"] = stocks.get(wh.remonline_id, 0)
+        result.append(item)
+    return result
+
+
+def _stream_export(db: Session, query, warehouses: List[Warehouse], fmt: str):
+    """Генератор тела выгрузки; закрывает сессию, когда поток дочитан или оборван."""
+    try:
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(list(EXPORT_COLUMNS) + [f"wh_{wh.remonline_id}" for wh in warehouses])
+            for items in _export_rows(db, query, warehouses):
+                writer.writerows(item.values() for item in items)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            for items in _export_rows(db, query, warehouses):
+                yield "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in items)
+    finally:
+        db.close()
+
+
+@router.get("/export")
+def export_products(
+    fmt: str = Query("ndjson", alias="format", description="Формат выгрузки: ndjson или csv"),
+    name: Optional[str] = None,
+    sku: Optional[str] = None,
+    category: Optional[str] = None,
+    warehouse_ids: Optional[str] = Query(None, description="Comma-separated warehouse remonline IDs (колонки и фильтр)"),
+    remonline_ids: Optional[str] = Query(None, description="Comma-separated product remonline IDs"),
+    price_min: Optional[float] = None,
+    price_max: Optional[float] = None,
+    stock_min: Optional[float] = None,
+    stock_max: Optional[float] = None,
+    is_active: Optional[bool] = Query(None, description="Filter by active status"),
+):
+    """Потоковая выгрузка матрицы товар × склад в NDJSON или CSV.
+
+    Фильтры как у /filtered. Колонки складов `wh_{remonline_id}` — выбранные склады
+    или все активные. Товары читаются серверным курсором пачками по EXPORT_BATCH_SIZE,
+    поэтому память не растёт с размером каталога.
+    """
+    if fmt not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format должен быть ndjson или csv")
+
+    # Сессия живёт столько же, сколько поток ответа, поэтому открываем её здесь, а не через Depends
+    db = SessionLocal()
+    try:
+        query, _rank = _build_filtered_products_query(
+            db, name=name, sku=sku, category=category,
+            warehouse_ids=warehouse_ids, remonline_ids=remonline_ids,
+            price_min=price_min, price_max=price_max,
+            stock_min=stock_min, stock_max=stock_max, is_active=is_active,
+        )
+        warehouses_query = db.query(Warehouse)
+        wh_remonline_ids = _normalize_ids(warehouse_ids)
+        if wh_remonline_ids:
+            warehouses_query = warehouses_query.filter(Warehouse.remonline_id.in_(wh_remonline_ids))
+        else:
+            warehouses_query = warehouses_query.filter(Warehouse.is_active == True)
+        warehouses = warehouses_query.order_by(Warehouse.id).all()
+        if query is None:
+            # Указанные склады не найдены — пустая выгрузка
+            query = db.query(Product).filter(false())
+    except Exception:
+        db.close()
+        raise
+
+    media_type = "text/csv; charset=utf-8" if fmt == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        _stream_export(db, query, warehouses, fmt),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=products.{fmt}"},
     )
 
 
+@router.get("/autocomplete", response_model=APIResponse)
+def autocomplete_products(
+    q: str = Query(..., min_length=1, description="Начало названия, RemID, артикула, кода или штрихкода"),
+    limit: int = Query(10, ge=1, le=50),
+    active_only: bool = False,
+    db: Session = Depends(get_db)
+):
+    """Автодополнение по in-memory индексу каталога (без запроса к БД на каждый ввод).
+
+    Каждый токен запроса ищется как префикс; регистр, «ё» и кириллица/латиница не различаются.
+    """
+    # Перечитываем только товары, изменённые коммитами после прошлого поиска
+    catalog_index.refresh(db)
+    items = catalog_index.search(q, limit=limit, active_only=active_only)
+    return APIResponse(success=True, data=items, count=len(items))
+
+
 @router.get("/", response_model=APIResponse)
-async def get_products(
+def get_products(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
     name: Optional[str] = None,
     sku: Optional[str] = None,
     category: Optional[str] = None,
     is_active: Optional[bool] = None,
+    cursor: Optional[str] = Query(None, description="Keyset-курсор из next_cursor предыдущей страницы (вместо skip)"),
     db: Session = Depends(get_db)
 ):
-    """Получить все товары с фильтрами"""
+    """Получить все товары с фильтрами (`cursor` — keyset-пагинация).
+
+    Порядок по id; при поиске по `name` — по релевантности, если доступен поисковый индекс.
+    Строки выбираются кортежами колонок `ProductResponse` и кодируются сразу в JSON (`fast_json`).
+    """
     query = db.query(Product)
 
     # Применяем фильтры
-    if name:
-        # Нечеткий поиск по названию и RemID
-        query = query.filter(or_(
-            Product.name.ilike(f"%{name}%"),
-            Product.remonline_id.ilike(f"%{name}%")
-        ))
+    query, rank = apply_product_search(query, db, name)
     if sku:
         query = query.filter(Product.sku.ilike(f"%{sku}%"))
     if category:
@@ -208,16 +557,27 @@ async def get_products(
     if is_active is not None:
         query = query.filter(Product.is_active == is_active)
 
-    products = query.offset(skip).limit(limit).all()
-
-    return APIResponse(
-        success=True,
-        data=[ProductResponse.from_orm(product) for product in products],
-        count=len(products)
+    sort_key, descending = ("relevance:desc", True) if rank is not None else ("id:asc", False)
+    columns = PRODUCT_ROWS.columns + ([rank] if rank is not None else [])
+    query = query.with_entities(*columns)
+    if cursor or not skip:
+        after = decode_cursor(cursor, sort_key) if cursor else None
+        rows = keyset_page(query, rank, Product.id, descending, limit, after)
+    else:
+        rows = order_keyset(query, rank, Product.id, descending).offset(skip).limit(limit).all()
+    products = PRODUCT_ROWS.dicts(rows)
+    # Курсор — по (объект, значение сортировки): для релевантности оно последнее в кортеже
+    keyed = [(product, row[-1] if rank is not None else None) for product, row in zip(products, rows)]
+
+    return api_json_response(
+        request,
+        data=products,
+        count=len(products),
+        next_cursor=next_cursor(sort_key, keyed, limit, lambda product: product["id"])
     )
 
 @router.get("/{product_id}", response_model=APIResponse)
-async def get_product(
+def get_product(
     product_id: int,
     db: Session = Depends(get_db)
 ):
@@ -233,198 +593,132 @@ async def get_product(
     )
 
 
-@router.post("/{product_id}/refresh", response_model=APIResponse)
-async def refresh_product(
-    product_id: int,
-    warehouse_id: Optional[int] = Query(None, description="Remonline ID склада для точечного обновления"),
+def _refresh_warehouses(db: Session, warehouse_id: Optional[int]) -> List[Warehouse]:
+    """Активные склады для принудительного обновления: все или один по Remonline ID."""
+    if warehouse_id is None:
+        return db.query(Warehouse).filter_by(is_active=True).all()
+    wh = db.query(Warehouse).filter(Warehouse.remonline_id == warehouse_id, Warehouse.is_active == True).first()
+    if not wh:
+        raise HTTPException(status_code=404, detail="Warehouse not found or inactive")
+    return [wh]
+
+
+@router.post("/refresh", response_model=APIResponse)
+async def refresh_products_bulk(
+    request: ProductBulkRefreshRequest,
     db: Session = Depends(get_db)
 ):
-    """Принудительно обновить товар и его остатки (как во flow), пройдясь по активным складам Remonline."""
+    """Принудительно обновить несколько товаров: список `product_ids` и/или все товары подвкладки `subtab_id`.
+
+    Товары пакуются в запросы `warehouse/goods/{склад}?ids[]=...` по REMONLINE_IDS_PER_REQUEST,
+    поэтому подвкладка из 300 товаров на складе — это 6 запросов, а не 300.
+    Товары подвкладки, которых ещё нет в БД, создаются.
+    """
+    if not request.product_ids and request.subtab_id is None:
+        raise HTTPException(status_code=400, detail="product_ids or subtab_id is required")
+
+    good_ids = await run_db(_bulk_refresh_good_ids, db, request)
+    warehouses = await run_db(_refresh_warehouses, db, request.warehouse_id)
+    try:
+        logger.info(f"Массовое обновление {len(good_ids)} товаров по {len(warehouses)} складам")
+        async with RemonlineService() as service:
+            result = await refresh_products(service, db, good_ids, warehouses)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    message = (
+        f"Обновлено {result['products_found']} из {result['products_requested']} товаров "
+        f"({result['requests']} запросов к API)"
+    )
+    if result["warehouses_failed"]:
+        message += f", ошибки на {len(result['warehouses_failed'])} складах"
+    return APIResponse(success=True, data=result, message=message)
+
+
+def _bulk_refresh_good_ids(db: Session, request: ProductBulkRefreshRequest) -> set:
+    """Remonline ID товаров массового обновления: из `product_ids` и активных товаров подвкладки."""
+    good_ids = set()
+    if request.product_ids:
+        good_ids.update(
+            rem_id for (rem_id,) in db.query(Product.remonline_id).filter(
+                Product.id.in_(request.product_ids), Product.remonline_id.isnot(None)
+            )
+        )
+    if request.subtab_id is not None:
+        if not db.query(SubTab.id).filter(SubTab.id == request.subtab_id).first():
+            raise HTTPException(status_code=404, detail="SubTab not found")
+        good_ids.update(
+            rem_id for (rem_id,) in db.query(SubTabProduct.product_remonline_id).filter(
+                SubTabProduct.subtab_id == request.subtab_id, SubTabProduct.is_active == True
+            )
+        )
+    if not good_ids:
+        raise HTTPException(status_code=404, detail="No products to refresh")
+    return good_ids
+
+
+def _product_remonline_id(db: Session, product_id: int) -> int:
     product = db.query(Product).filter(Product.id == product_id).first()
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     if not product.remonline_id:
         raise HTTPException(status_code=400, detail="Product has no remonline_id")
+    return product.remonline_id
 
-    good_id = product.remonline_id
-    if warehouse_id is not None:
-        wh = db.query(Warehouse).filter(Warehouse.remonline_id == warehouse_id, Warehouse.is_active == True).first()
-        if not wh:
-            raise HTTPException(status_code=404, detail="Warehouse not found or inactive")
-        warehouses: list[Warehouse] = [wh]
-    else:
-        warehouses: list[Warehouse] = db.query(Warehouse).filter_by(is_active=True).all()
+
+@router.post("/{product_id}/refresh", response_model=APIResponse)
+async def refresh_product(
+    product_id: int,
+    warehouse_id: Optional[int] = Query(None, description="Remonline ID склада для точечного обновления"),
+    db: Session = Depends(get_db)
+):
+    """Принудительно обновить товар и его остатки по всем активным складам Remonline (или одному `warehouse_id`).
+
+    Склады опрашиваются параллельно (по запросу `ids[]` на склад, темп — общий rate limiter),
+    изменения записываются одной транзакцией; в ответе — результат по каждому складу.
+    """
+    good_id = await run_db(_product_remonline_id, db, product_id)
+    warehouses = await run_db(_refresh_warehouses, db, warehouse_id)
 
     try:
         logger.info(f"Начинаем обновление товара ID {product_id} (Remonline ID: {good_id}) по {len(warehouses)} складам")
-        
         async with RemonlineService() as service:
-            # Обновление товара и остатков - ищем на первом попавшемся складе
-            updated_fields = False
-            stocks_updated = 0
-            warehouses_checked = 0
-            
-            for wh in warehouses:
-                warehouses_checked += 1
-                logger.info(f"Проверяем склад {warehouses_checked}/{len(warehouses)}: {wh.name} (ID: {wh.remonline_id})")
-                
-                try:
-                    # Используем параметр ids[] для запроса конкретного товара
-                    response = await service._make_request(
-                        f"warehouse/goods/{wh.remonline_id}",
-                        params={"ids[]": good_id}
-                    )
-                    
-                    items = response.get("data", [])
-                    if not items or not isinstance(items, list) or len(items) == 0:
-                        logger.debug(f"Товар {good_id} не найден на складе {wh.name}")
-                        continue
-                    
-                    matched = items[0]
-                    if not isinstance(matched, dict) or matched.get("id") != good_id:
-                        continue
-                    
-                    logger.info(f"✅ Товар найден на складе {wh.name}")
-
-                    # Поля товара
-                    product_name = matched.get("title", "")
-                    product_sku = matched.get("article", "")
-                    product_code = matched.get("code")
-                    barcodes_list = matched.get("barcodes", []) or []
-                    product_barcode = None
-                    if isinstance(barcodes_list, list) and barcodes_list:
-                        first_barcode = barcodes_list[0]
-                        if isinstance(first_barcode, dict):
-                            product_barcode = first_barcode.get("code")
-
-                    uom_json = matched.get("uom")
-                    images_json = matched.get("image")
-                    prices_json = matched.get("price")
-                    category_json = matched.get("category")
-                    custom_fields_json = matched.get("custom_fields")
-                    is_serial = bool(matched.get("is_serial", False))
-                    warranty = matched.get("warranty")
-                    warranty_period = matched.get("warranty_period")
-                    description = matched.get("description")
-                    quantity = matched.get("residue", 0.0) or 0.0
-
-                    price_value = None
-                    if isinstance(prices_json, dict) and prices_json:
-                        non_zero = [v for v in prices_json.values() if isinstance(v, (int, float)) and v]
-                        price_value = (non_zero[0] if non_zero else list(prices_json.values())[0])
-
-                    # Логируем найденные данные
-                    logger.info(f"📦 Обновляем поля товара:")
-                    logger.info(f"   Название: {product_name}")
-                    logger.info(f"   Артикул: {product_sku}")
-                    if prices_json:
-                        logger.info(f"   Цены: {prices_json}")
-                    logger.info(f"   Категория: {category_json.get('title') if isinstance(category_json, dict) else category_json}")
-                    
-                    # Применяем обновления полей
-                    product.name = product_name or product.name
-                    product.sku = product_sku or product.sku
-                    if product_barcode:
-                        product.barcode = product_barcode
-                    if product_code:
-                        product.code = product_code
-                    if uom_json is not None:
-                        product.uom_json = uom_json
-                    if images_json is not None:
-                        product.images_json = images_json
-                    if prices_json is not None:
-                        product.prices_json = prices_json
-                    if category_json is not None:
-                        product.category_json = category_json
-                        if isinstance(category_json, dict):
-                            title_value = category_json.get("title")
-                            if title_value:
-                                product.category = title_value
-                    if custom_fields_json is not None:
-                        product.custom_fields_json = custom_fields_json
-                    if barcodes_list is not None:
-                        product.barcodes_json = barcodes_list
-                    product.is_serial = is_serial
-                    if warranty is not None:
-                        product.warranty = warranty
-                    if warranty_period is not None:
-                        product.warranty_period = warranty_period
-                    if description is not None:
-                        product.description = description
-                    if price_value is not None:
-                        product.price = price_value
-
-                    updated_fields = True
-                    logger.info(f"✅ Поля товара обновлены")
-                    
-                    # Обновляем остатки на этом же складе
-                    logger.info(f"💰 Обновляем остатки на складе {wh.name}: {quantity}")
-                    stock = db.query(Stock).filter_by(
-                        warehouse_id=wh.id,
-                        product_id=product.id,
-                    ).first()
-                    if not stock:
-                        stock = Stock(
-                            warehouse_id=wh.id,
-                            product_id=product.id,
-                            quantity=quantity,
-                            reserved_quantity=0,
-                            available_quantity=quantity,
-                        )
-                        db.add(stock)
-                        logger.info(f"   ➕ Создана новая запись об остатках")
-                    else:
-                        old_quantity = stock.quantity
-                        stock.quantity = quantity
-                        stock.available_quantity = quantity
-                        logger.info(f"   🔄 Остатки обновлены: {old_quantity} → {quantity}")
-                    
-                    stocks_updated = 1
-                    db.commit()
-                    
-                    # Товар найден и обновлен - прекращаем поиск
-                    logger.info(f"✅ Товар полностью обновлен на складе {wh.name}")
-                    break
-                    
-                except Exception as e:
-                    logger.warning(f"Ошибка проверки на складе {wh.name}: {e}")
-                    continue
-
-        # Явно обновим timestamp, чтобы фронт отобразил актуальную дату
-        product.updated_at = datetime.utcnow()
-        db.commit()
-        
-        if updated_fields:
-            result_message = f"Товар успешно обновлен (поля и остатки) на складе"
-        else:
-            result_message = f"Товар не найден ни на одном из {len(warehouses)} складов"
-        logger.info(f"🎉 {result_message}")
-        
-        return APIResponse(
-            success=True, 
-            data={
-                "product_id": product.id,
-                "fields_updated": updated_fields,
-                "stocks_updated": stocks_updated,
-                "warehouses_total": len(warehouses)
-            }, 
-            message=result_message
-        )
+            result = await refresh_products(service, db, [good_id], warehouses)
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+    found_on = sum(1 for r in result["warehouses"] if r["status"] == "found")
+    if result["products_found"]:
+        result_message = f"Товар обновлен: найден на {found_on} из {len(warehouses)} складов"
+    else:
+        result_message = f"Товар не найден ни на одном из {len(warehouses)} складов"
+    if result["warehouses_failed"]:
+        result_message += f", ошибки на {len(result['warehouses_failed'])} складах"
+    logger.info(f"🎉 {result_message}")
+
+    return APIResponse(
+        success=True,
+        data={
+            "product_id": product_id,
+            "fields_updated": bool(result["products_found"]),
+            "stocks_updated": result["stocks_changed"] + result["stocks_zeroed"],
+            "warehouses_total": len(warehouses),
+            "warehouses_failed": result["warehouses_failed"],
+            "warehouses": result["warehouses"],
+        },
+        message=result_message
+    )
+
 @router.post("/create-from-remonline/{remonline_id}", response_model=APIResponse)
 async def create_product_from_remonline(
     remonline_id: int,
     db: Session = Depends(get_db)
 ):
-    """Создать товар в локальной БД из Remonline по ID"""
-    import asyncio
+    """Создать товар в локальной БД из Remonline по ID (поиск по всем активным складам, известные — первыми)"""
     from loguru import logger
     
     # Проверяем, нет ли уже такого товара
-    existing_product = db.query(Product).filter(Product.remonline_id == remonline_id).first()
+    existing_product = await run_db(lambda: db.query(Product).filter(Product.remonline_id == remonline_id).first())
     if existing_product:
         return APIResponse(
             success=True,
@@ -432,56 +726,22 @@ async def create_product_from_remonline(
             message="Product already exists in database"
         )
 
-    # Получаем активные склады (ограничиваем до 3 для параллельного поиска)
-    warehouses = db.query(Warehouse).filter_by(is_active=True).limit(3).all()
+    warehouses = await run_db(lambda: db.query(Warehouse).filter_by(is_active=True).all())
     if not warehouses:
         raise HTTPException(status_code=400, detail="No active warehouses found")
 
     try:
         async with RemonlineService() as service:
             logger.info(f"Поиск товара {remonline_id} по {len(warehouses)} складам")
-            
-            # Функция для поиска товара на конкретном складе через параметр ids[]
-            async def search_product_on_warehouse(wh: Warehouse):
-                try:
-                    logger.info(f"Запрос товара {remonline_id} со склада {wh.name} (ID: {wh.remonline_id})")
-                    
-                    # Используем параметр ids[] для запроса конкретного товара
-                    response = await service._make_request(
-                        f"warehouse/goods/{wh.remonline_id}",
-                        params={"ids[]": remonline_id}
-                    )
-                    
-                    # Проверяем, есть ли товар в ответе
-                    items = response.get("data", [])
-                    if items and isinstance(items, list) and len(items) > 0:
-                        item = items[0]
-                        if isinstance(item, dict) and item.get("id") == remonline_id:
-                            logger.info(f"✓ Товар {remonline_id} найден на складе {wh.name}")
-                            return item
-                    
-                    logger.info(f"Товар {remonline_id} не найден на складе {wh.name}")
-                    return None
-                except Exception as e:
-                    logger.warning(f"Ошибка поиска на складе {wh.name} (ID: {wh.remonline_id}): {e}")
-                    return None
-            
-            # Запускаем параллельный поиск по всем складам
-            search_tasks = [search_product_on_warehouse(wh) for wh in warehouses]
-            results = await asyncio.gather(*search_tasks, return_exceptions=True)
-            
-            # Находим первый успешный результат
-            found_product_data = None
-            for result in results:
-                if isinstance(result, dict) and result:
-                    found_product_data = result
-                    break
-
-            if not found_product_data:
+
+            # Сначала склады из индекса расположения (product_locations), затем остальные
+            located = await locate_good(service, db, remonline_id, warehouses)
+            if not located:
                 raise HTTPException(
                     status_code=404, 
                     detail=f"Product with Remonline ID {remonline_id} not found on any active warehouse"
                 )
+            found_warehouse, found_product_data = located
 
             # Создаём товар в БД
             product_name = found_product_data.get("title", "")
@@ -524,9 +784,13 @@ async def create_product_from_remonline(
                 is_active=True
             )
 
-            db.add(new_product)
-            db.commit()
-            db.refresh(new_product)
+            def save_product():
+                db.add(new_product)
+                upsert_locations(db, [(remonline_id, found_warehouse.id)])
+                db.commit()
+                db.refresh(new_product)
+
+            await run_db(save_product)
 
             logger.info(f"Создан товар {new_product.name} (ID: {new_product.id}, Remonline ID: {remonline_id})")
 
@@ -540,12 +804,12 @@ async def create_product_from_remonline(
         raise
     except Exception as e:
         logger.error(f"Ошибка создания товара из Remonline: {e}")
-        db.rollback()
+        await run_db(db.rollback)
         raise HTTPException(status_code=500, detail=f"Error creating product: {str(e)}")
 
 
 @router.put("/{product_id}/activate", response_model=APIResponse)
-async def activate_product(
+def activate_product(
     product_id: int,
     db: Session = Depends(get_db)
 ):
@@ -577,7 +841,7 @@ async def activate_product(
 
 
 @router.get("/remonline/{remonline_id}", response_model=APIResponse)
-async def get_product_by_remonline_id(
+def get_product_by_remonline_id(
     remonline_id: int,
     db: Session = Depends(get_db)
 ):
@@ -1,13 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import and_, func
 from sqlalchemy.orm import Session, selectinload
-from typing import List
+from typing import List, Optional
 from loguru import logger
 
-from ...models import get_db, Tab, SubTab, SubTabProduct
+from ...models import get_db, Tab, SubTab, SubTabProduct, Product
+from ...services.change_feed import TABS_COUNTER
+from ...services.product_search import apply_product_search
+from ..conditional import generation_etag, not_modified
 from ..schemas import (
     TabResponse, TabCreate, TabUpdate, TabReorder, TabListResponse,
     SubTabResponse, SubTabCreate, SubTabUpdate, SubTabListResponse,
-    SubTabProductResponse, SubTabProductCreate, SubTabProductUpdate
+    SubTabProductResponse, SubTabProductCreate, SubTabProductUpdate,
+    SubTabPickerProductResponse, APIResponse
 )
 
 router = APIRouter()
@@ -15,7 +20,9 @@ router = APIRouter()
 
 # Роуты для вкладок
 @router.get("/list", response_model=List[TabListResponse])
-async def get_tabs_list(
+def get_tabs_list(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     active_only: bool = True,
@@ -23,6 +30,9 @@ async def get_tabs_list(
     db: Session = Depends(get_db)
 ):
     """Быстрая загрузка списка вкладок БЕЗ подвкладок и товаров (для производительности)"""
+    unchanged = not_modified(request, response, generation_etag(db, [TABS_COUNTER]))
+    if unchanged is not None:
+        return unchanged
     try:
         query = db.query(Tab)
         
@@ -40,7 +50,9 @@ async def get_tabs_list(
 
 
 @router.get("/", response_model=List[TabResponse])
-async def get_tabs(
+def get_tabs(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     active_only: bool = True,
@@ -49,6 +61,9 @@ async def get_tabs(
     db: Session = Depends(get_db)
 ):
     """Получить список всех вкладок с оптимизированной загрузкой связанных данных"""
+    unchanged = not_modified(request, response, generation_etag(db, [TABS_COUNTER]))
+    if unchanged is not None:
+        return unchanged
     try:
         query = db.query(Tab)
         
@@ -72,7 +87,7 @@ async def get_tabs(
 
 
 @router.post("/", response_model=TabResponse)
-async def create_tab(tab: TabCreate, db: Session = Depends(get_db)):
+def create_tab(tab: TabCreate, db: Session = Depends(get_db)):
     """Создать новую вкладку"""
     try:
         # Получаем максимальный order_index для размещения новой вкладки справа
@@ -97,7 +112,7 @@ async def create_tab(tab: TabCreate, db: Session = Depends(get_db)):
 
 
 @router.get("/{tab_id}", response_model=TabResponse)
-async def get_tab(tab_id: int, db: Session = Depends(get_db)):
+def get_tab(tab_id: int, db: Session = Depends(get_db)):
     """Получить вкладку по ID"""
     tab = db.query(Tab).filter(Tab.id == tab_id).first()
     if not tab:
@@ -106,7 +121,7 @@ async def get_tab(tab_id: int, db: Session = Depends(get_db)):
 
 
 @router.put("/{tab_id}", response_model=TabResponse)
-async def update_tab(tab_id: int, tab_update: TabUpdate, db: Session = Depends(get_db)):
+def update_tab(tab_id: int, tab_update: TabUpdate, db: Session = Depends(get_db)):
     """Обновить вкладку"""
     try:
         db_tab = db.query(Tab).filter(Tab.id == tab_id).first()
@@ -131,7 +146,7 @@ async def update_tab(tab_id: int, tab_update: TabUpdate, db: Session = Depends(g
 
 
 @router.delete("/{tab_id}")
-async def delete_tab(tab_id: int, db: Session = Depends(get_db)):
+def delete_tab(tab_id: int, db: Session = Depends(get_db)):
     """Удалить вкладку"""
     try:
         db_tab = db.query(Tab).filter(Tab.id == tab_id).first()
@@ -152,7 +167,7 @@ async def delete_tab(tab_id: int, db: Session = Depends(get_db)):
 
 
 @router.post("/{tab_id}/reorder")
-async def reorder_tabs(tab_id: int, reorder_data: TabReorder, db: Session = Depends(get_db)):
+def reorder_tabs(tab_id: int, reorder_data: TabReorder, db: Session = Depends(get_db)):
     """Изменить порядок вкладки"""
     try:
         db_tab = db.query(Tab).filter(Tab.id == tab_id).first()
@@ -193,7 +208,7 @@ async def reorder_tabs(tab_id: int, reorder_data: TabReorder, db: Session = Depe
 
 # Роуты для подвкладок
 @router.get("/{tab_id}/subtabs", response_model=List[SubTabResponse])
-async def get_subtabs(
+def get_subtabs(
     tab_id: int,
     skip: int = 0,
     limit: int = 100,
@@ -227,7 +242,7 @@ async def get_subtabs(
 
 
 @router.post("/{tab_id}/subtabs", response_model=SubTabResponse)
-async def create_subtab(tab_id: int, subtab: SubTabCreate, db: Session = Depends(get_db)):
+def create_subtab(tab_id: int, subtab: SubTabCreate, db: Session = Depends(get_db)):
     """Создать подвкладку"""
     try:
         # Проверяем существование вкладки
@@ -260,7 +275,7 @@ async def create_subtab(tab_id: int, subtab: SubTabCreate, db: Session = Depends
 
 
 @router.put("/subtabs/{subtab_id}", response_model=SubTabResponse)
-async def update_subtab(subtab_id: int, subtab_update: SubTabUpdate, db: Session = Depends(get_db)):
+def update_subtab(subtab_id: int, subtab_update: SubTabUpdate, db: Session = Depends(get_db)):
     """Обновить подвкладку"""
     try:
         db_subtab = db.query(SubTab).filter(SubTab.id == subtab_id).first()
@@ -285,7 +300,7 @@ async def update_subtab(subtab_id: int, subtab_update: SubTabUpdate, db: Session
 
 
 @router.get("/subtabs/{subtab_id}", response_model=SubTabResponse)
-async def get_subtab(subtab_id: int, db: Session = Depends(get_db)):
+def get_subtab(subtab_id: int, db: Session = Depends(get_db)):
     """Получить подвкладку по ID с оптимизированной загрузкой товаров"""
     try:
         # Используем selectinload для предзагрузки товаров одним запросом
@@ -305,7 +320,7 @@ async def get_subtab(subtab_id: int, db: Session = Depends(get_db)):
 
 
 @router.post("/subtabs/{subtab_id}/reorder")
-async def reorder_subtab(subtab_id: int, reorder_data: dict, db: Session = Depends(get_db)):
+def reorder_subtab(subtab_id: int, reorder_data: dict, db: Session = Depends(get_db)):
     """Изменить порядок подвкладки"""
     try:
         db_subtab = db.query(SubTab).filter(SubTab.id == subtab_id).first()
@@ -345,7 +360,7 @@ async def reorder_subtab(subtab_id: int, reorder_data: dict, db: Session = Depen
 
 
 @router.delete("/subtabs/{subtab_id}")
-async def delete_subtab(subtab_id: int, db: Session = Depends(get_db)):
+def delete_subtab(subtab_id: int, db: Session = Depends(get_db)):
     """Удалить подвкладку"""
     try:
         db_subtab = db.query(SubTab).filter(SubTab.id == subtab_id).first()
@@ -367,7 +382,7 @@ async def delete_subtab(subtab_id: int, db: Session = Depends(get_db)):
 
 # Роуты для товаров в подвкладках
 @router.get("/subtabs/{subtab_id}/products", response_model=List[SubTabProductResponse])
-async def get_subtab_products(
+def get_subtab_products(
     subtab_id: int,
     skip: int = 0,
     limit: int = 100,
@@ -394,8 +409,67 @@ async def get_subtab_products(
         raise HTTPException(status_code=500, detail="Ошибка получения товаров")
 
 
+@router.get("/subtabs/{subtab_id}/picker", response_model=APIResponse)
+def get_subtab_product_picker(
+    subtab_id: int,
+    q: Optional[str] = Query(None, description="Поиск по названию или RemID"),
+    in_subtab: Optional[bool] = Query(None, description="true — только товары листа, false — только доступные"),
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    """Страница кандидатов для модального окна подвкладки.
+
+    Признак «уже на листе» считается одним LEFT JOIN с subtab_products,
+    поэтому клиенту не нужно загружать весь каталог и сопоставлять его с листом.
+    """
+    try:
+        if not db.query(SubTab.id).filter(SubTab.id == subtab_id).first():
+            raise HTTPException(status_code=404, detail="Подвкладка не найдена")
+
+        query = db.query(Product, SubTabProduct).outerjoin(
+            SubTabProduct,
+            and_(
+                SubTabProduct.subtab_id == subtab_id,
+                SubTabProduct.product_remonline_id == Product.remonline_id,
+            ),
+        )
+        query, rank = apply_product_search(query, db, q.strip() if q else None)
+        if in_subtab is True:
+            query = query.filter(SubTabProduct.id.isnot(None))
+        elif in_subtab is False:
+            query = query.filter(SubTabProduct.id.is_(None))
+
+        total = query.with_entities(func.count(Product.id)).scalar()
+
+        if in_subtab:
+            query = query.order_by(SubTabProduct.order_index, SubTabProduct.id)
+        elif rank is not None:
+            query = query.order_by(rank.desc(), Product.id)
+        else:
+            query = query.order_by(Product.name, Product.id)
+        rows = query.offset(skip).limit(limit).all()
+
+        items = []
+        for product, subtab_product in rows:
+            item = SubTabPickerProductResponse.from_orm(product)
+            if subtab_product is not None:
+                item.in_subtab = True
+                item.subtab_product_id = subtab_product.id
+                item.custom_name = subtab_product.custom_name
+                item.custom_category = subtab_product.custom_category
+                item.order_index = subtab_product.order_index
+            items.append(item)
+        return APIResponse(success=True, data=items, count=len(items), total=total)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка получения кандидатов для подвкладки: {e}")
+        raise HTTPException(status_code=500, detail="Ошибка получения товаров")
+
+
 @router.post("/subtabs/{subtab_id}/products", response_model=List[SubTabProductResponse])
-async def add_products_to_subtab(subtab_id: int, request: dict, db: Session = Depends(get_db)):
+def add_products_to_subtab(subtab_id: int, request: dict, db: Session = Depends(get_db)):
     """Добавить товары в подвкладку"""
     try:
         # Проверяем существование подвкладки
@@ -463,7 +537,7 @@ async def add_products_to_subtab(subtab_id: int, request: dict, db: Session = De
 
 
 @router.post("/subtabs/{subtab_id}/products/single", response_model=SubTabProductResponse)
-async def add_single_product_to_subtab(subtab_id: int, product: SubTabProductCreate, db: Session = Depends(get_db)):
+def add_single_product_to_subtab(subtab_id: int, product: SubTabProductCreate, db: Session = Depends(get_db)):
     """Добавить один товар в подвкладку"""
     try:
         # Проверяем существование подвкладки
@@ -524,7 +598,7 @@ async def add_single_product_to_subtab(subtab_id: int, product: SubTabProductCre
 
 
 @router.put("/subtabs/products/{product_id}", response_model=SubTabProductResponse)
-async def update_subtab_product(product_id: int, product_update: SubTabProductUpdate, db: Session = Depends(get_db)):
+def update_subtab_product(product_id: int, product_update: SubTabProductUpdate, db: Session = Depends(get_db)):
     """Обновить товар в подвкладке"""
     try:
         db_product = db.query(SubTabProduct).filter(SubTabProduct.id == product_id).first()
@@ -549,7 +623,7 @@ async def update_subtab_product(product_id: int, product_update: SubTabProductUp
 
 
 @router.delete("/subtabs/{subtab_id}/products/{product_remonline_id}")
-async def remove_product_from_subtab(subtab_id: int, product_remonline_id: int, db: Session = Depends(get_db)):
+def remove_product_from_subtab(subtab_id: int, product_remonline_id: int, db: Session = Depends(get_db)):
     """Удалить товар из подвкладки по Remonline ID"""
     try:
         db_product = db.query(SubTabProduct).filter(
@@ -574,7 +648,7 @@ async def remove_product_from_subtab(subtab_id: int, product_remonline_id: int,
 
 
 @router.delete("/subtabs/products/{product_id}")
-async def remove_product_from_subtab_by_id(product_id: int, db: Session = Depends(get_db)):
+def remove_product_from_subtab_by_id(product_id: int, db: Session = Depends(get_db)):
     """Удалить товар из подвкладки по ID записи (для обратной совместимости)"""
     try:
         db_product = db.query(SubTabProduct).filter(SubTabProduct.id == product_id).first()
@@ -594,7 +668,7 @@ async def remove_product_from_subtab_by_id(product_id: int, db: Session = Depend
         raise HTTPException(status_code=500, detail="Ошибка удаления товара")
 
 @router.post("/subtabs/{subtab_id}/products/reorder")
-async def reorder_subtab_products(subtab_id: int, request: dict, db: Session = Depends(get_db)):
+def reorder_subtab_products(subtab_id: int, request: dict, db: Session = Depends(get_db)):
     """Изменить порядок товаров в подвкладке"""
     try:
         # Проверяем существование подвкладки
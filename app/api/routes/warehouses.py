@@ -1,19 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from ..schemas import WarehouseResponse, APIResponse
+from ..conditional import generation_etag, not_modified
 from ...models import Warehouse, get_db
+from ...services.change_feed import WAREHOUSES_COUNTER
 
 router = APIRouter()
 
 @router.get("/", response_model=APIResponse)
-async def get_warehouses(
+def get_warehouses(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     active_only: bool = True,
     db: Session = Depends(get_db)
 ):
-    """Получить все склады"""
+    """Получить все склады (ETag по поколению складов: без изменений — 304 без запроса списка)"""
+    unchanged = not_modified(request, response, generation_etag(db, [WAREHOUSES_COUNTER]))
+    if unchanged is not None:
+        return unchanged
     query = db.query(Warehouse)
 
     if active_only:
@@ -28,7 +35,7 @@ async def get_warehouses(
     )
 
 @router.get("/{warehouse_id}", response_model=APIResponse)
-async def get_warehouse(
+def get_warehouse(
     warehouse_id: int,
     db: Session = Depends(get_db)
 ):
@@ -44,7 +51,7 @@ async def get_warehouse(
     )
 
 @router.get("/remonline/{remonline_id}", response_model=APIResponse)
-async def get_warehouse_by_remonline_id(
+def get_warehouse_by_remonline_id(
     remonline_id: int,
     db: Session = Depends(get_db)
 ):
@@ -131,6 +131,15 @@ class SubTabProductResponse(BaseModel):
         from_attributes = True
 
 
+class SubTabPickerProductResponse(ProductResponse):
+    """Кандидат для подвкладки с признаком, что товар уже на листе"""
+    in_subtab: bool = False
+    subtab_product_id: Optional[int] = None
+    custom_name: Optional[str] = None
+    custom_category: Optional[str] = None
+    order_index: Optional[int] = None
+
+
 class SubTabResponse(BaseModel):
     id: int
     tab_id: int
@@ -193,6 +202,8 @@ class APIResponse(BaseModel):
     data: Optional[Any] = None
     message: Optional[str] = None
     count: Optional[int] = None
+    total: Optional[int] = None
+    next_cursor: Optional[str] = None  # Курсор следующей страницы для keyset-пагинации
 
 
 # Схемы для фильтрации
@@ -208,4 +219,11 @@ class ProductFilter(BaseModel):
     sort_by: Optional[str] = None
     sort_order: Optional[str] = "asc"
     skip: int = 0
-    limit: int = 50
\ No newline at end of file
+    limit: int = 50
+
+
+# Схема массового обновления товаров из Remonline
+class ProductBulkRefreshRequest(BaseModel):
+    product_ids: Optional[List[int]] = None  # ID товаров в локальной БД
+    subtab_id: Optional[int] = None  # Все товары подвкладки (в т.ч. ещё не загруженные в БД)
+    warehouse_id: Optional[int] = None  # Remonline ID склада; по умолчанию — все активные
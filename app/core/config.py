@@ -31,9 +31,64 @@ class Settings(BaseSettings):
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
     PORT: int = int(os.getenv("PORT", 8000))
 
+    # Потоки для работы с БД: обработчики маршрутов и блокирующие запросы не выполняются на event loop
+    DB_THREADPOOL_SIZE: int = int(os.getenv("DB_THREADPOOL_SIZE", "40"))
+
     # Настройки обновления данных
     UPDATE_INTERVAL_MINUTES: int = int(os.getenv("UPDATE_INTERVAL_MINUTES", "30"))
 
+    # Лимит запросов к API Remonline (общий token bucket на процесс)
+    REMONLINE_RATE_LIMIT_RPS: float = float(os.getenv("REMONLINE_RATE_LIMIT_RPS", "3"))
+    REMONLINE_RATE_LIMIT_BURST: int = int(os.getenv("REMONLINE_RATE_LIMIT_BURST", "3"))
+    # AIMD-подстройка темпа: RPS выше — стартовое значение, растёт при быстрых ответах, падает на 429/5xx
+    REMONLINE_RATE_ADAPTIVE: bool = os.getenv("REMONLINE_RATE_ADAPTIVE", "true").lower() in ("1", "true", "yes")
+    REMONLINE_RATE_LIMIT_MIN_RPS: float = float(os.getenv("REMONLINE_RATE_LIMIT_MIN_RPS", "0.5"))
+    REMONLINE_RATE_LIMIT_MAX_RPS: float = float(os.getenv("REMONLINE_RATE_LIMIT_MAX_RPS", "10"))
+    REMONLINE_RATE_INCREASE_STEP: float = float(os.getenv("REMONLINE_RATE_INCREASE_STEP", "0.05"))
+    REMONLINE_LATENCY_TARGET_SECONDS: float = float(os.getenv("REMONLINE_LATENCY_TARGET_SECONDS", "1.0"))
+    # Повторы запросов к API: попытки и границы экспоненциальной задержки с jitter
+    REMONLINE_RETRY_ATTEMPTS: int = int(os.getenv("REMONLINE_RETRY_ATTEMPTS", "5"))
+    REMONLINE_RETRY_BASE_DELAY: float = float(os.getenv("REMONLINE_RETRY_BASE_DELAY", "0.5"))
+    REMONLINE_RETRY_MAX_DELAY: float = float(os.getenv("REMONLINE_RETRY_MAX_DELAY", "30"))
+    # Товаров в одном запросе `warehouse/goods/{id}?ids[]=...`: ответ API не длиннее страницы (50 элементов)
+    REMONLINE_IDS_PER_REQUEST: int = int(os.getenv("REMONLINE_IDS_PER_REQUEST", "50"))
+    # Общий HTTP-клиент Remonline: пул соединений, keep-alive и HTTP/2 (нужен пакет h2: httpx[http2])
+    REMONLINE_HTTP_MAX_CONNECTIONS: int = int(os.getenv("REMONLINE_HTTP_MAX_CONNECTIONS", "20"))
+    REMONLINE_HTTP_MAX_KEEPALIVE: int = int(os.getenv("REMONLINE_HTTP_MAX_KEEPALIVE", "10"))
+    REMONLINE_HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("REMONLINE_HTTP_KEEPALIVE_EXPIRY", "60"))
+    REMONLINE_HTTP_TIMEOUT: float = float(os.getenv("REMONLINE_HTTP_TIMEOUT", "30"))
+    REMONLINE_HTTP2: bool = os.getenv("REMONLINE_HTTP2", "false").lower() in ("1", "true", "yes")
+    # Количество воркеров конвейера синхронизации (одновременно обрабатываемых складов)
+    SYNC_WORKERS: int = int(os.getenv("SYNC_WORKERS", "6"))
+    # Инкрементальная автосинхронизация: склады опрашиваются по курсорам, а не все подряд
+    SYNC_INCREMENTAL: bool = os.getenv("SYNC_INCREMENTAL", "true").lower() in ("1", "true", "yes")
+    # Потолок интервала для «холодных» складов (интервал удваивается после каждого прогона без изменений)
+    SYNC_COLD_MAX_INTERVAL_MINUTES: int = int(os.getenv("SYNC_COLD_MAX_INTERVAL_MINUTES", "360"))
+    # Интервал для пустых складов
+    SYNC_EMPTY_INTERVAL_MINUTES: int = int(os.getenv("SYNC_EMPTY_INTERVAL_MINUTES", "720"))
+    # Продолжать прерванную полную синхронизацию с чекпоинтов при старте приложения
+    SYNC_RESUME_ON_STARTUP: bool = os.getenv("SYNC_RESUME_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+    # Очередь заданий синхронизации: аренда задания воркером, heartbeat и опрос очереди
+    SYNC_JOB_LEASE_SECONDS: float = float(os.getenv("SYNC_JOB_LEASE_SECONDS", "60"))
+    SYNC_JOB_HEARTBEAT_SECONDS: float = float(os.getenv("SYNC_JOB_HEARTBEAT_SECONDS", "10"))
+    SYNC_JOB_MAX_ATTEMPTS: int = int(os.getenv("SYNC_JOB_MAX_ATTEMPTS", "3"))
+    SYNC_WORKER_POLL_SECONDS: float = float(os.getenv("SYNC_WORKER_POLL_SECONDS", "2"))
+    # Встроенный воркер в API-процессе (для запуска одним процессом); при отдельном `flow.py worker` — false
+    SYNC_WORKER_EMBEDDED: bool = os.getenv("SYNC_WORKER_EMBEDDED", "true").lower() in ("1", "true", "yes")
+    # Поток событий синхронизации (SSE): очередь кадров на клиента, опрос прогресса, keep-alive
+    SSE_CLIENT_QUEUE_SIZE: int = int(os.getenv("SSE_CLIENT_QUEUE_SIZE", "256"))
+    SSE_PROGRESS_INTERVAL_SECONDS: float = float(os.getenv("SSE_PROGRESS_INTERVAL_SECONDS", "1"))
+    SSE_KEEPALIVE_SECONDS: float = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+
+    # In-process кэш ответов /products/filtered (сбрасывается коммитами синхронизации)
+    PRODUCTS_CACHE_SIZE: int = int(os.getenv("PRODUCTS_CACHE_SIZE", "256"))
+    PRODUCTS_CACHE_TTL_SECONDS: float = float(os.getenv("PRODUCTS_CACHE_TTL_SECONDS", "60"))
+    # Условные GET (ETag / If-None-Match): max-age в Cache-Control; 0 — браузер и прокси сверяют ETag на каждый запрос
+    HTTP_CACHE_MAX_AGE_SECONDS: int = int(os.getenv("HTTP_CACHE_MAX_AGE_SECONDS", "0"))
+    # Быстрые JSON-ответы списков (fast_json): gzip для тел от этого размера (0 — без сжатия) и уровень сжатия
+    FAST_JSON_GZIP_MIN_BYTES: int = int(os.getenv("FAST_JSON_GZIP_MIN_BYTES", "16384"))
+    FAST_JSON_GZIP_LEVEL: int = int(os.getenv("FAST_JSON_GZIP_LEVEL", "1"))
+
     model_config = {
         "env_file": ".env",
         "case_sensitive": True,
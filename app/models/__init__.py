@@ -1,8 +1,15 @@
-from .database import Base, get_db, engine
+from .database import Base, get_db, engine, run_db, run_sync_write, configure_db_threadpool
 from .warehouse import Warehouse
 from .product import Product
 from .stock import Stock
+from .stock_total import ProductStockTotal
 from .last_update import LastUpdate
 from .tab import Tab, SubTab, SubTabProduct
+from .sync_cursor import WarehouseSyncCursor
+from .sync_run import SyncRun
+from .product_location import ProductLocation
+from .sync_job import SyncJob
+from .service_lock import ServiceLock
+from .change_counter import ChangeCounter
 
-__all__ = ["Base", "get_db", "engine", "Warehouse", "Product", "Stock", "LastUpdate", "Tab", "SubTab", "SubTabProduct"]
+__all__ = ["Base", "get_db", "engine", "run_db", "run_sync_write", "configure_db_threadpool", "Warehouse", "Product", "Stock", "ProductStockTotal", "LastUpdate", "Tab", "SubTab", "SubTabProduct", "WarehouseSyncCursor", "SyncRun", "ProductLocation", "SyncJob", "ServiceLock", "ChangeCounter"]
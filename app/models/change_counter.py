@@ -0,0 +1,13 @@
+from sqlalchemy import Column, String, BigInteger
+from .database import Base
+
+class ChangeCounter(Base):
+    """Именованный счётчик поколений изменений (ленты `/changes`).
+
+    Транзакция, пишущая товары или остатки, один раз увеличивает `value` и помечает
+    записанные строки полученным поколением (`change_gen`).
+    """
+    __tablename__ = "change_counters"
+
+    name = Column(String, primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
@@ -1,7 +1,12 @@
-from sqlalchemy import create_engine
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import anyio
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-from typing import Generator
+from typing import Any, Callable, Generator, TypeVar
 from app.core.config import settings
 
 # Используем DATABASE_URL из настроек
@@ -24,6 +29,17 @@ elif "sqlite" in DATABASE_URL:
     engine_kwargs["connect_args"] = {"check_same_thread": False}
 
 engine = create_engine(DATABASE_URL, **engine_kwargs)
+
+if "sqlite" in DATABASE_URL:
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL: чтение UI не ждёт коммитов синхронизации, писатель не ждёт читателей
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -34,3 +50,26 @@ def get_db() -> Generator[Session, None, None]:
         yield db
     finally:
         db.close()
+
+
+T = TypeVar("T")
+
+# Записи синхронизации — в своём потоке: они не занимают потоки, которыми обслуживаются запросы UI,
+# и идут строго по очереди в одной сессии
+_sync_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-sync-write")
+
+
+def configure_db_threadpool(size: int) -> None:
+    """Размер общего пула потоков anyio: в нём FastAPI выполняет `def`-маршруты и `get_db`, и `run_db`."""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = max(1, size)
+
+
+async def run_db(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Выполнить блокирующую работу с БД в пуле потоков, не останавливая event loop."""
+    return await anyio.to_thread.run_sync(functools.partial(fn, *args, **kwargs))
+
+
+async def run_sync_write(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Выполнить запись синхронизации в выделенном потоке писателя."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_sync_write_executor, functools.partial(fn, *args, **kwargs))
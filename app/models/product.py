@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Boolean, JSON, Index
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, Text, Boolean, JSON, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -32,9 +32,18 @@ class Product(Base):
     is_serial = Column(Boolean, default=False)
     warranty = Column(Integer)
     warranty_period = Column(Integer)
+    # Отпечаток нормализованных данных Remonline: sync пропускает UPDATE, если он не изменился
+    content_hash = Column(String(64))
+    # Поколение последнего изменения (лента `/changes`); NULL — строка записана до появления ленты
+    change_gen = Column(BigInteger)
     
     # Составные индексы для оптимизации запросов
     __table_args__ = (
         Index('idx_product_active_category', 'is_active', 'category'),
         Index('idx_product_active_price', 'is_active', 'price'),
+        Index('idx_product_change_gen', 'change_gen', 'id'),
+        # Keyset-пагинация по сортировкам /filtered: (колонка, id)
+        Index('idx_product_name_id', 'name', 'id'),
+        Index('idx_product_price_id', 'price', 'id'),
+        Index('idx_product_category_id', 'category', 'id'),
     )
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, Index
+from datetime import datetime
+from .database import Base
+
+class ProductLocation(Base):
+    """Склады, на которых товар Remonline видели последний раз.
+
+    Ключ — `remonline_id`, а не products.id: индексом пользуется и создание товара,
+    которого ещё нет в БД. Поддерживается апсертом синхронизации (`bulk_upsert.upsert_goods`)
+    и принудительным обновлением товаров.
+    """
+    __tablename__ = "product_locations"
+
+    remonline_id = Column(Integer, primary_key=True)
+    warehouse_id = Column(Integer, ForeignKey("warehouses.id"), primary_key=True)
+    last_seen_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('idx_product_locations_warehouse', 'warehouse_id'),
+    )
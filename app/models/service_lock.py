@@ -0,0 +1,14 @@
+from sqlalchemy import Column, String, DateTime
+from .database import Base
+
+class ServiceLock(Base):
+    """Именованная блокировка с арендой — запасной вариант advisory-блокировок PostgreSQL (SQLite).
+
+    Владелец продлевает `expires_at`; блокировку с истёкшей арендой может забрать другой узел.
+    """
+    __tablename__ = "service_locks"
+
+    name = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)
+    acquired_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey, Index, UniqueConstraint
+from sqlalchemy import Column, Integer, BigInteger, Float, DateTime, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -14,6 +14,8 @@ class Stock(Base):
     available_quantity = Column(Float, nullable=False, default=0, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Поколение последнего изменения (лента `/changes`)
+    change_gen = Column(BigInteger)
 
     # Связи
     warehouse = relationship("Warehouse", back_populates="stocks")
@@ -24,4 +26,5 @@ class Stock(Base):
         UniqueConstraint('warehouse_id', 'product_id', name='uq_stock_warehouse_product'),
         Index('idx_stock_warehouse_product', 'warehouse_id', 'product_id'),
         Index('idx_stock_product_quantity', 'product_id', 'available_quantity'),
+        Index('idx_stock_change_gen', 'change_gen', 'id'),
     )
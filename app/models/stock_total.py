@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from .database import Base
+
+class ProductStockTotal(Base):
+    """Поддерживаемый синхронизацией агрегат остатков товара по всем складам.
+
+    Пересчитывается для затронутых товаров в той же транзакции, что и запись stocks,
+    поэтому фильтр и сортировка по общему остатку идут по индексу, а не через GROUP BY.
+    """
+    __tablename__ = "product_stock_totals"
+
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    total_available = Column(Float, nullable=False, default=0, index=True)
+    total_quantity = Column(Float, nullable=False, default=0)
+    warehouses_in_stock = Column(Integer, nullable=False, default=0)  # Складов с available > 0
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from .database import Base
+
+class WarehouseSyncCursor(Base):
+    """Курсор синхронизации склада: итог последнего прогона и время следующего."""
+    __tablename__ = "warehouse_sync_cursors"
+
+    id = Column(Integer, primary_key=True, index=True)
+    warehouse_id = Column(Integer, ForeignKey("warehouses.id"), unique=True, nullable=False, index=True)
+    last_synced_at = Column(DateTime(timezone=True))
+    # Когда контрольная сумма остатков склада последний раз изменилась
+    last_changed_at = Column(DateTime(timezone=True))
+    next_sync_at = Column(DateTime(timezone=True), index=True)
+    pages = Column(Integer, default=0)
+    items = Column(Integer, default=0)
+    checksum = Column(String(64))  # sha256 по (id товара, остаток) всех страниц склада
+    unchanged_runs = Column(Integer, default=0)  # Прогонов подряд без изменений
+    status = Column(String, default="success")  # 'success', 'error'
+    error_message = Column(String)
+
+    # Чекпоинт прогона полной синхронизации: последняя закоммиченная страница и накопители
+    run_id = Column(Integer, ForeignKey("sync_runs.id"), index=True)
+    run_page = Column(Integer, default=0)
+    run_pages = Column(Integer, default=0)
+    run_items = Column(Integer, default=0)
+    run_checksum = Column(String(64))
+    run_finished = Column(Boolean, default=False)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    warehouse = relationship("Warehouse")
@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON
+from datetime import datetime
+from .database import Base
+
+class SyncJob(Base):
+    """Задание синхронизации в очереди: API ставит задание, воркер забирает его под аренду.
+
+    Воркер продлевает аренду heartbeat'ом; если он умер, аренда истекает и задание
+    забирает другой воркер, продолжая прогон `SyncRun` с чекпоинтов складов.
+    """
+    __tablename__ = "sync_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False, default="full")  # 'full', 'incremental'
+    status = Column(String, nullable=False, default="queued", index=True)  # 'queued', 'running', 'finished', 'failed'
+    run_id = Column(Integer, ForeignKey("sync_runs.id"))
+    lease_owner = Column(String)  # Идентификатор воркера: host:pid:случайный суффикс
+    lease_expires_at = Column(DateTime, index=True)
+    heartbeat_at = Column(DateTime)
+    attempts = Column(Integer, nullable=False, default=0)  # Сколько раз задание забирали воркеры
+    processed = Column(Integer, default=0)  # Завершённых складов (по heartbeat)
+    total = Column(Integer, default=0)
+    message = Column(String)
+    stats = Column(JSON)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy.sql import func
+from .database import Base
+
+class SyncRun(Base):
+    """Прогон полной синхронизации: переживает рестарт процесса и продолжается с чекпоинтов складов."""
+    __tablename__ = "sync_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String, default="running", index=True)  # 'running', 'finished', 'failed'
+    warehouses_total = Column(Integer, default=0)
+    started_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True))
+    message = Column(String)
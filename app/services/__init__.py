@@ -1,4 +1,21 @@
+from .http_client import RemonlineHTTPClient, remonline_http
 from .remonline_service import RemonlineService
 from .background_service import BackgroundService
+from .rate_limiter import TokenBucket, get_remonline_rate_limiter
+from .sync_engine import StockSyncEngine
+from .data_generation import get_data_generation
+from .response_cache import GenerationalLRUCache, products_cache
+from .catalog_index import CatalogIndex, catalog_index
+from .product_search import apply_product_search, ensure_search_index
+from .product_refresh import refresh_products
+from .sync_jobs import enqueue_sync_job, claim_next_job, heartbeat, finish_job, latest_job, job_state
+from .sync_worker import SyncWorker
+from .sync_events import SyncEventBroadcaster, sync_events
+from .change_feed import change_generation, current_generation, current_generations, read_changes
 
-__all__ = ["RemonlineService", "BackgroundService"]
+__all__ = ["RemonlineService", "BackgroundService", "TokenBucket", "get_remonline_rate_limiter", "StockSyncEngine",
+           "get_data_generation", "GenerationalLRUCache", "products_cache",
+           "apply_product_search", "ensure_search_index", "CatalogIndex", "catalog_index",
+           "RemonlineHTTPClient", "remonline_http", "refresh_products",
+           "enqueue_sync_job", "claim_next_job", "heartbeat", "finish_job", "latest_job", "job_state", "SyncWorker",
+           "SyncEventBroadcaster", "sync_events", "change_generation", "current_generation", "current_generations", "read_changes"]
@@ -1,14 +1,17 @@
 import asyncio
 from datetime import datetime, timedelta
 from loguru import logger
-from ..models import get_db
-from ..services.remonline_service import RemonlineService
+from ..models import get_db, run_db
+from .locks import SYNC_SCHEDULER_LOCK, service_lock
+from .sync_jobs import enqueue_if_due, enqueue_sync_job
 from ..core.config import settings
 
 class BackgroundService:
     def __init__(self):
         self.is_running = False
         self.update_interval = timedelta(minutes=settings.UPDATE_INTERVAL_MINUTES)
+        # Расписание ведёт один процесс из всех: тот, кто держит блокировку планировщика
+        self.leadership = service_lock(SYNC_SCHEDULER_LOCK, ttl_seconds=settings.SYNC_JOB_LEASE_SECONDS)
 
     async def start_background_tasks(self):
         """Запустить фоновые задачи"""
@@ -25,42 +28,51 @@ class BackgroundService:
     async def stop_background_tasks(self):
         """Остановить фоновые задачи"""
         self.is_running = False
+        if self.leadership.held:
+            await run_db(self.leadership.release)
         logger.info("Background tasks stopped")
 
     async def _data_update_loop(self):
-        """Цикл обновления данных"""
+        """Цикл планировщика: лидер ставит задание синхронизации раз в UPDATE_INTERVAL_MINUTES.
+
+        Остальные процессы только пытаются перехватить лидерство — если лидер умер, расписание
+        продолжит один из них (время последнего задания хранится в очереди).
+        """
         while self.is_running:
             try:
-                await self._update_all_data()
-                logger.info(f"Data update completed. Next update in {settings.UPDATE_INTERVAL_MINUTES} minutes")
+                if await run_db(self.leadership.acquire):
+                    # Горячие склады — каждый цикл, холодные и пустые — по своим курсорам
+                    await self._enqueue_due(incremental=settings.SYNC_INCREMENTAL)
             except Exception as e:
-                logger.error(f"Data update failed: {str(e)}")
-
-            # Ждем до следующего обновления
-            await asyncio.sleep(self.update_interval.total_seconds())
+                logger.error(f"Data update scheduling failed: {str(e)}")
 
-    async def _update_all_data(self):
-        """Обновить все данные из API"""
-        async with RemonlineService() as service:
-            for db in get_db():
-                try:
-                    logger.info("Starting warehouses sync...")
-                    await service.sync_warehouses(db)
+            # Лидерство продлевается чаще, чем истекает его аренда
+            await asyncio.sleep(settings.SYNC_JOB_HEARTBEAT_SECONDS)
 
-                    logger.info("Starting products and stocks sync...")
-                    await service.sync_products_and_stocks(db)
+    async def _enqueue_due(self, incremental: bool):
+        kind = "incremental" if incremental else "full"
+        for db in get_db():
+            try:
+                job = await run_db(enqueue_if_due, db, kind, self.update_interval)
+                if job is not None:
+                    logger.info(f"Sync job {job.id} ({kind}) queued. Next update in {settings.UPDATE_INTERVAL_MINUTES} minutes")
+            finally:
+                db.close()
 
-                    logger.info("Data sync completed successfully")
-                    break
+    async def _update_all_data(self, incremental: bool = False):
+        """Поставить синхронизацию в очередь заданий (incremental — только склады, которым пора по курсорам).
 
-                except Exception as e:
-                    logger.error(f"Database sync failed: {str(e)}")
-                    continue
-                finally:
-                    db.close()
+        Выполняет её воркер синхронизации; задание того же вида, уже стоящее в очереди, не дублируется.
+        """
+        kind = "incremental" if incremental else "full"
+        for db in get_db():
+            try:
+                job, created = await run_db(enqueue_sync_job, db, kind)
+                logger.info(f"Sync job {job.id} ({kind}) " + ("queued" if created else "is already queued or running"))
+            finally:
+                db.close()
 
     async def update_data_now(self):
-        """Принудительно обновить данные"""
+        """Принудительно обновить данные (полная синхронизация через очередь заданий)"""
         logger.info("Manual data update requested")
         await self._update_all_data()
-        logger.info("Manual data update completed")
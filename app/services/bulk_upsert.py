@@ -0,0 +1,299 @@
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Tuple
+
+from sqlalchemy import JSON, case, func, null, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from ..models import Product, Stock, ProductStockTotal, ProductLocation
+from .change_feed import change_generation
+
+# Строк в одном INSERT: держим число bind-параметров ниже лимитов PostgreSQL/SQLite
+CHUNK_SIZE = 500
+
+# Колонки Product, которые перезаписываются данными из API при конфликте по remonline_id
+PRODUCT_UPDATE_COLUMNS = (
+    "name", "sku", "barcode", "code", "uom_json", "images_json", "prices_json",
+    "category_json", "category", "custom_fields_json", "barcodes_json",
+    "is_serial", "warranty", "warranty_period", "description", "price",
+    "content_hash", "change_gen",
+)
+# Пустое значение из API не затирает сохранённое (как прежнее `product.name = product_name or product.name`):
+# строковые поля сохраняются при NULL и пустой строке, остальные — при NULL
+PRODUCT_KEEP_IF_EMPTY = ("name", "sku", "barcode", "code")
+PRODUCT_KEEP_IF_NULL = (
+    "uom_json", "images_json", "prices_json", "category_json", "category",
+    "custom_fields_json", "warranty", "warranty_period", "description", "price",
+)
+# JSON-колонки: Python None пишется как JSON 'null', а COALESCE различает только SQL NULL
+PRODUCT_JSON_COLUMNS = tuple(c.name for c in Product.__table__.columns if isinstance(c.type, JSON))
+
+# Отметка «товар видели на складе» переписывается не чаще: повторная синхронизация не обновляет все строки
+LOCATION_TOUCH_INTERVAL = timedelta(hours=1)
+
+
+def map_good_to_product(good_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Поля Product из элемента `warehouse/goods/{id}` API Remonline."""
+    barcodes_list = good_data.get("barcodes", []) or []
+    product_barcode = None
+    if isinstance(barcodes_list, list) and barcodes_list:
+        first_barcode = barcodes_list[0]
+        if isinstance(first_barcode, dict):
+            product_barcode = first_barcode.get("code")
+
+    prices_json = good_data.get("price")
+    price_value = None
+    if isinstance(prices_json, dict) and prices_json:
+        non_zero = [v for v in prices_json.values() if isinstance(v, (int, float)) and v]
+        price_value = (non_zero[0] if non_zero else list(prices_json.values())[0])
+
+    category_json = good_data.get("category")
+    category_title = category_json.get("title") if isinstance(category_json, dict) else None
+
+    return {
+        "remonline_id": good_data.get("id"),
+        "name": good_data.get("title", ""),
+        "sku": good_data.get("article", ""),
+        "barcode": product_barcode,
+        "code": good_data.get("code"),
+        "uom_json": good_data.get("uom"),
+        "images_json": good_data.get("image"),
+        "prices_json": prices_json,
+        "category_json": category_json,
+        "category": category_title,
+        "custom_fields_json": good_data.get("custom_fields"),
+        "barcodes_json": barcodes_list,
+        "is_serial": bool(good_data.get("is_serial", False)),
+        "warranty": good_data.get("warranty"),
+        "warranty_period": good_data.get("warranty_period"),
+        "description": good_data.get("description"),
+        "price": price_value,
+    }
+
+
+def compute_content_hash(product_data: Dict[str, Any]) -> str:
+    """sha256 нормализованных полей товара (ключи отсортированы, без служебного content_hash)."""
+    payload = {k: v for k, v in product_data.items() if k != "content_hash"}
+    normalized = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def _insert_for(db: Session):
+    """Диалектный INSERT с поддержкой ON CONFLICT для текущего подключения."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return pg_insert
+    if dialect == "sqlite":
+        return sqlite_insert
+    raise NotImplementedError(f"Bulk upsert is not supported for dialect {dialect}")
+
+
+def _chunks(rows: List[Any]) -> Iterable[List[Any]]:
+    for i in range(0, len(rows), CHUNK_SIZE):
+        yield rows[i:i + CHUNK_SIZE]
+
+
+def _product_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Строка для INSERT: отсутствующие JSON-значения — SQL NULL."""
+    return {k: null() if v is None and k in PRODUCT_JSON_COLUMNS else v for k, v in row.items()}
+
+
+def _product_update_set(excluded) -> Dict[str, Any]:
+    """SET для ON CONFLICT DO UPDATE: поля, которых нет в ответе API, остаются прежними."""
+    table = Product.__table__
+    set_ = {}
+    for col in PRODUCT_UPDATE_COLUMNS:
+        if col in PRODUCT_KEEP_IF_EMPTY:
+            set_[col] = func.coalesce(func.nullif(excluded[col], ""), table.c[col])
+        elif col in PRODUCT_KEEP_IF_NULL:
+            set_[col] = func.coalesce(excluded[col], table.c[col])
+        else:
+            set_[col] = excluded[col]
+    set_["updated_at"] = func.now()
+    return set_
+
+
+def upsert_products(db: Session, products: List[Dict[str, Any]]) -> Tuple[Dict[int, int], Dict[str, int]]:
+    """INSERT ... ON CONFLICT (remonline_id) DO UPDATE для товаров с пропуском неизменённых.
+
+    Товары, у которых `content_hash` совпадает с сохранённым, не перезаписываются
+    (нет лишних версий строк и WAL на PostgreSQL); пустые поля неполного ответа API
+    не затирают сохранённые значения. Возвращает
+    ({remonline_id: products.id}, {"changed": n, "unchanged": m}).
+    """
+    # В одном INSERT ключ конфликта не должен повторяться — последний вариант побеждает
+    by_rem_id = {}
+    for p in products:
+        if p.get("remonline_id"):
+            by_rem_id[p["remonline_id"]] = {**p, "content_hash": compute_content_hash(p)}
+    if not by_rem_id:
+        return {}, {"changed": 0, "unchanged": 0}
+
+    # Один SELECT: id и отпечатки уже сохранённых товаров страницы
+    ids: Dict[int, int] = {}
+    for remonline_id, product_id, content_hash in db.query(
+        Product.remonline_id, Product.id, Product.content_hash
+    ).filter(Product.remonline_id.in_(list(by_rem_id.keys()))):
+        ids[remonline_id] = product_id
+        if content_hash == by_rem_id[remonline_id]["content_hash"]:
+            by_rem_id.pop(remonline_id)
+    unchanged = len(ids) - sum(1 for rem_id in by_rem_id if rem_id in ids)
+    rows = list(by_rem_id.values())
+    if rows:
+        # Записанные строки попадают в ленту `/changes` под поколением транзакции
+        generation = change_generation(db)
+        for row in rows:
+            row["change_gen"] = generation
+
+    insert = _insert_for(db)
+    for chunk in _chunks(rows):
+        stmt = insert(Product).values([_product_row(row) for row in chunk])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Product.remonline_id],
+            set_=_product_update_set(stmt.excluded),
+            # Защита от гонки: строку могли обновить между SELECT и INSERT
+            where=Product.content_hash.is_distinct_from(stmt.excluded.content_hash),
+        ).returning(Product.remonline_id, Product.id)
+        for remonline_id, product_id in db.execute(stmt):
+            ids[remonline_id] = product_id
+    return ids, {"changed": len(rows), "unchanged": unchanged}
+
+
+def upsert_stocks(db: Session, stocks: List[Dict[str, Any]]) -> List[int]:
+    """INSERT ... ON CONFLICT (warehouse_id, product_id) DO UPDATE для остатков (uq_stock_warehouse_product).
+
+    Строки с неизменившимся количеством не трогаются. Возвращает product_id вставленных/изменённых строк.
+    """
+    by_key = {(s["warehouse_id"], s["product_id"]): s for s in stocks}
+    rows = list(by_key.values())
+    if not rows:
+        return []
+    generation = change_generation(db)
+    rows = [{**row, "change_gen": generation} for row in rows]
+
+    insert = _insert_for(db)
+    changed: List[int] = []
+    for chunk in _chunks(rows):
+        stmt = insert(Stock).values(chunk)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Stock.warehouse_id, Stock.product_id],
+            set_={
+                "quantity": stmt.excluded.quantity,
+                "reserved_quantity": stmt.excluded.reserved_quantity,
+                "available_quantity": stmt.excluded.available_quantity,
+                "updated_at": func.now(),
+                "change_gen": stmt.excluded.change_gen,
+            },
+            where=or_(
+                Stock.quantity.is_distinct_from(stmt.excluded.quantity),
+                Stock.available_quantity.is_distinct_from(stmt.excluded.available_quantity),
+            ),
+        ).returning(Stock.product_id)
+        changed.extend(product_id for (product_id,) in db.execute(stmt))
+    return changed
+
+
+def refresh_stock_totals(db: Session, product_ids: Iterable[int]) -> int:
+    """Пересчитать `product_stock_totals` для указанных товаров одним INSERT ... SELECT ... ON CONFLICT.
+
+    Вызывается после любой записи в stocks в той же транзакции. Коммит за вызывающим.
+    """
+    ids = sorted(set(product_ids))
+    if not ids:
+        return 0
+
+    insert = _insert_for(db)
+    for chunk in _chunks(ids):
+        totals = db.query(
+            Stock.product_id,
+            func.sum(Stock.available_quantity),
+            func.sum(Stock.quantity),
+            func.sum(case((Stock.available_quantity > 0, 1), else_=0)),
+        ).filter(Stock.product_id.in_(chunk)).group_by(Stock.product_id)
+        stmt = insert(ProductStockTotal).from_select(
+            ["product_id", "total_available", "total_quantity", "warehouses_in_stock"],
+            totals.statement,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ProductStockTotal.product_id],
+            set_={
+                "total_available": stmt.excluded.total_available,
+                "total_quantity": stmt.excluded.total_quantity,
+                "warehouses_in_stock": stmt.excluded.warehouses_in_stock,
+                "updated_at": func.now(),
+            },
+        )
+        db.execute(stmt)
+    return len(ids)
+
+
+def upsert_locations(db: Session, locations: Iterable[Tuple[int, int]]) -> int:
+    """Отметить пары (remonline_id, warehouses.id) в `product_locations` как увиденные сейчас.
+
+    Отметки моложе LOCATION_TOUCH_INTERVAL не переписываются. Коммит за вызывающим.
+    """
+    now = datetime.utcnow()
+    rows = [
+        {"remonline_id": remonline_id, "warehouse_id": warehouse_id, "last_seen_at": now}
+        for remonline_id, warehouse_id in sorted(set(locations))
+    ]
+    insert = _insert_for(db)
+    for chunk in _chunks(rows):
+        stmt = insert(ProductLocation).values(chunk)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ProductLocation.remonline_id, ProductLocation.warehouse_id],
+            set_={"last_seen_at": stmt.excluded.last_seen_at},
+            where=ProductLocation.last_seen_at < now - LOCATION_TOUCH_INTERVAL,
+        )
+        db.execute(stmt)
+    return len(rows)
+
+
+def upsert_goods(db: Session, warehouse_goods: Iterable[Tuple[int, List[Dict[str, Any]]]]) -> Dict[str, Any]:
+    """Апсерт страниц `warehouse/goods` в products и stocks несколькими set-based запросами.
+
+    `warehouse_goods` — пары (warehouses.id, список элементов API). Коммит остаётся за вызывающим.
+    """
+    products: List[Dict[str, Any]] = []
+    residues: List[Tuple[int, int, float]] = []
+    for warehouse_id, goods in warehouse_goods:
+        for good_data in goods:
+            if not isinstance(good_data, dict):
+                continue
+            good_id = good_data.get("id")
+            if not good_id:
+                continue
+            products.append(map_good_to_product(good_data))
+            residues.append((warehouse_id, good_id, good_data.get("residue", 0.0) or 0.0))
+
+    product_ids, product_stats = upsert_products(db, products)
+
+    stocks = []
+    for warehouse_id, good_id, quantity in residues:
+        product_id = product_ids.get(good_id)
+        if product_id is None:
+            continue
+        stocks.append({
+            "warehouse_id": warehouse_id,
+            "product_id": product_id,
+            "quantity": quantity,
+            "reserved_quantity": 0,  # В API нет этого поля
+            "available_quantity": quantity,
+        })
+    changed_product_ids = upsert_stocks(db, stocks)
+    # Агрегаты только для товаров, у которых изменился хотя бы один остаток
+    refresh_stock_totals(db, changed_product_ids)
+    # Индекс расположения: на каких складах товар есть (для поиска товара без перебора всех складов)
+    upsert_locations(db, ((good_id, warehouse_id) for warehouse_id, good_id, _ in residues))
+
+    return {
+        "products": len(product_ids),
+        "products_changed": product_stats["changed"],
+        "products_unchanged": product_stats["unchanged"],
+        "stocks": len(stocks),
+        "stocks_changed": len(changed_product_ids),
+        "product_ids": product_ids,
+    }
@@ -0,0 +1,256 @@
+import bisect
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from loguru import logger
+from sqlalchemy.orm import Session
+
+from ..models import Product
+from .change_feed import CATALOG_COUNTER, current_generation
+
+# Префиксы до этой длины хранятся готовыми posting-списками; длиннее — диапазон по отсортированному словарю
+PREFIX_POSTINGS_LENGTH = 3
+# Больше кандидатов не сортируем, а отбираем проходом по товарам в порядке ранга
+SORT_CANDIDATES_LIMIT = 2000
+
+_TRANSLIT = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ж": "zh", "з": "z",
+    "и": "i", "й": "i", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p",
+    "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "h", "ц": "ts", "ч": "ch",
+    "ш": "sh", "щ": "sch", "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+    "і": "i", "ї": "i", "є": "e", "ґ": "g",
+}
+_TRANSLIT_TABLE = str.maketrans(_TRANSLIT)
+_TOKEN_RE = re.compile(r"[0-9a-z]+")
+
+
+def normalize(value: str) -> str:
+    """Нормализовать текст для поиска: casefold, ё→е и транслитерация кириллицы в латиницу.
+
+    Кириллица и латиница приводятся к одному алфавиту, поэтому «самсунг» находит «Samsung».
+    """
+    return value.casefold().replace("ё", "е").translate(_TRANSLIT_TABLE)
+
+
+def tokenize(value: Optional[str]) -> List[str]:
+    if not value:
+        return []
+    return _TOKEN_RE.findall(normalize(str(value)))
+
+
+def _code_tokens(value: Any) -> List[str]:
+    """Токены артикула/кода/штрихкода: части и значение целиком без разделителей («ART-12» → art, 12, art12)."""
+    tokens = tokenize(value)
+    if len(tokens) > 1:
+        tokens.append("".join(tokens))
+    return tokens
+
+
+class CatalogIndex:
+    """In-memory инвертированный индекс каталога товаров для автодополнения.
+
+    Индексирует название, RemID, `sku`, `code` и штрихкоды нормализованными токенами.
+    Префиксы до PREFIX_POSTINGS_LENGTH символов хранят готовые posting-множества,
+    длинные префиксы ищутся диапазоном по отсортированному словарю токенов.
+
+    Индекс строится из БД при первом поиске, а затем обновляется точечно по ленте изменений:
+    поиск сверяет поколение счётчика `catalog` и перечитывает только товары с `change_gen`
+    новее последнего увиденного. Так индекс видит и записи другого процесса (отдельного воркера).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._docs: Dict[int, Dict[str, Any]] = {}
+        self._doc_tokens: Dict[int, Set[str]] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        self._prefixes: Dict[str, Set[int]] = {}
+        self._vocabulary: List[str] = []
+        self._vocabulary_dirty = False
+        self._inactive: Set[int] = set()
+        # Статический ранг товара (длина названия, id) и id в этом порядке
+        self._order: Dict[int, tuple] = {}
+        self._ranked_ids: List[int] = []
+        self._ranked_dirty = False
+        # Последнее поколение каталога, отражённое в индексе
+        self._generation = 0
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    @staticmethod
+    def _document_tokens(row) -> Set[str]:
+        tokens = set(tokenize(row.name))
+        tokens.add(str(row.remonline_id))
+        for value in (row.sku, row.code, row.barcode):
+            tokens.update(_code_tokens(value))
+        if isinstance(row.barcodes_json, list):
+            for item in row.barcodes_json:
+                if isinstance(item, dict):
+                    tokens.update(_code_tokens(item.get("code")))
+        return tokens
+
+    def _add(self, row) -> None:
+        tokens = self._document_tokens(row)
+        self._docs[row.id] = {
+            "id": row.id,
+            "remonline_id": row.remonline_id,
+            "name": row.name,
+            "sku": row.sku,
+            "code": row.code,
+            "is_active": row.is_active,
+        }
+        self._doc_tokens[row.id] = tokens
+        self._order[row.id] = (len(row.name or ""), row.id)
+        self._ranked_dirty = True
+        if not row.is_active:
+            self._inactive.add(row.id)
+        for token in tokens:
+            posting = self._postings.get(token)
+            if posting is None:
+                self._postings[token] = posting = set()
+                self._vocabulary_dirty = True
+            posting.add(row.id)
+            for length in range(1, min(len(token), PREFIX_POSTINGS_LENGTH) + 1):
+                self._prefixes.setdefault(token[:length], set()).add(row.id)
+
+    def _remove(self, product_id: int) -> None:
+        tokens = self._doc_tokens.pop(product_id, set())
+        self._docs.pop(product_id, None)
+        self._order.pop(product_id, None)
+        self._inactive.discard(product_id)
+        self._ranked_dirty = True
+        for token in tokens:
+            posting = self._postings.get(token)
+            if posting is not None:
+                posting.discard(product_id)
+                if not posting:
+                    del self._postings[token]
+                    self._vocabulary_dirty = True
+            for length in range(1, min(len(token), PREFIX_POSTINGS_LENGTH) + 1):
+                prefix_posting = self._prefixes.get(token[:length])
+                if prefix_posting is not None:
+                    prefix_posting.discard(product_id)
+                    if not prefix_posting:
+                        del self._prefixes[token[:length]]
+
+    def load(self, rows: Iterable[Any]) -> None:
+        """Добавить или заменить товары (строки с полями id, remonline_id, name, sku, code, barcode,
+        barcodes_json, is_active) и подготовить отсортированные структуры для поиска."""
+        with self._lock:
+            for row in rows:
+                if row.id in self._docs:
+                    self._remove(row.id)
+                self._add(row)
+            self._built = True
+            self._prepare()
+
+    def _prepare(self) -> None:
+        # Сортировки выполняются при обновлении индекса, а не в первом поиске после него
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        if self._ranked_dirty:
+            self._ranked_ids = sorted(self._order, key=self._order.__getitem__)
+            self._ranked_dirty = False
+
+    @staticmethod
+    def _rows(db: Session, since: Optional[int] = None):
+        query = db.query(
+            Product.id, Product.remonline_id, Product.name, Product.sku, Product.code,
+            Product.barcode, Product.barcodes_json, Product.is_active,
+        )
+        if since is not None:
+            # По индексу (change_gen, id), как лента /changes
+            query = query.filter(Product.change_gen > since)
+        return query.yield_per(5000)
+
+    def rebuild(self, db: Session) -> None:
+        """Полностью перестроить индекс из таблицы products."""
+        started = time.perf_counter()
+        with self._lock:
+            self._docs.clear()
+            self._doc_tokens.clear()
+            self._postings.clear()
+            self._prefixes.clear()
+            self._inactive.clear()
+            self._order.clear()
+            self._vocabulary_dirty = True
+            # Поколение снимается до чтения строк: запись между ними просто перечитается следующим refresh
+            self._generation = current_generation(db, CATALOG_COUNTER)
+            self.load(self._rows(db))
+        logger.info(f"Catalog index built: {len(self._docs)} products in {time.perf_counter() - started:.2f}s")
+
+    def refresh(self, db: Session) -> int:
+        """Построить индекс при первом обращении или перечитать товары, изменённые после последнего
+        увиденного поколения каталога. Возвращает число перечитанных."""
+        if not self._built:
+            self.rebuild(db)
+            return len(self._docs)
+        generation = current_generation(db, CATALOG_COUNTER)
+        with self._lock:
+            if generation == self._generation:
+                return 0
+            rows = self._rows(db, since=self._generation).all()
+            self._generation = generation
+            # Поколение общее для товаров и остатков: коммит одних остатков не вернёт ни одной строки
+            self.load(rows)
+            return len(rows)
+
+    def _prefix_ids(self, term: str) -> Set[int]:
+        if len(term) <= PREFIX_POSTINGS_LENGTH:
+            return self._prefixes.get(term, set())
+        self._prepare()
+        start = bisect.bisect_left(self._vocabulary, term)
+        end = bisect.bisect_left(self._vocabulary, term + "\uffff")
+        if end - start == 1:
+            return self._postings[self._vocabulary[start]]
+        ids: Set[int] = set()
+        for token in self._vocabulary[start:end]:
+            ids |= self._postings[token]
+        return ids
+
+    def _top(self, ids: Set[int], limit: int, *excluded: Set[int]) -> List[int]:
+        """Первые `limit` товаров из `ids` (кроме `excluded`) по статическому рангу: короче название — выше."""
+        if len(ids) <= SORT_CANDIDATES_LIMIT:
+            found = (i for i in ids if not any(i in skip for skip in excluded))
+            return sorted(found, key=self._order.__getitem__)[:limit]
+        self._prepare()
+        # Для широкого запроса проход по рангу останавливается почти сразу
+        top = []
+        for product_id in self._ranked_ids:
+            if product_id in ids and not any(product_id in skip for skip in excluded):
+                top.append(product_id)
+                if len(top) == limit:
+                    break
+        return top
+
+    def search(self, query: str, limit: int = 10, active_only: bool = False) -> List[Dict[str, Any]]:
+        """Товары, у которых каждый токен запроса — префикс какого-либо токена товара.
+
+        Сначала товары, где все токены совпали целиком, затем остальные; внутри — с более коротким названием.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            candidate_sets = sorted((self._prefix_ids(term) for term in terms), key=len)
+            if not candidate_sets[0]:
+                return []
+            candidates = candidate_sets[0]
+            if len(candidate_sets) > 1:
+                candidates = candidates.intersection(*candidate_sets[1:])
+            inactive = self._inactive if active_only else set()
+
+            exact_sets = sorted((self._postings.get(term, set()) for term in terms), key=len)
+            exact = exact_sets[0].intersection(candidates, *exact_sets[1:])
+            best = self._top(exact, limit, inactive)
+            if len(best) < limit:
+                best += self._top(candidates, limit - len(best), exact, inactive)
+            return [dict(self._docs[product_id]) for product_id in best]
+
+
+catalog_index = CatalogIndex()
+
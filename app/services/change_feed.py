@@ -0,0 +1,151 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, event, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from ..models import ChangeCounter, Product, Stock, Warehouse
+
+# Счётчики поколений: `catalog` — товары и остатки (лента `/changes`), остальные — для ETag ответов API
+CATALOG_COUNTER = "catalog"
+WAREHOUSES_COUNTER = "warehouses"
+TABS_COUNTER = "tabs"
+# Таблица → счётчик, который увеличивает транзакция, записавшая в неё
+TABLE_COUNTERS = {
+    "products": CATALOG_COUNTER,
+    "stocks": CATALOG_COUNTER,
+    "warehouses": WAREHOUSES_COUNTER,
+    "tabs": TABS_COUNTER,
+    "subtabs": TABS_COUNTER,
+    "subtab_products": TABS_COUNTER,
+}
+
+# Поля строк ленты `/changes` по сущностям
+PRODUCT_CHANGE_COLUMNS = (
+    Product.id, Product.remonline_id, Product.name, Product.sku, Product.barcode, Product.code,
+    Product.category, Product.price, Product.is_active, Product.updated_at, Product.change_gen,
+)
+STOCK_CHANGE_COLUMNS = (
+    Stock.id, Stock.product_id, Product.remonline_id.label("product_remonline_id"),
+    Stock.warehouse_id, Warehouse.remonline_id.label("warehouse_remonline_id"),
+    Stock.quantity, Stock.reserved_quantity, Stock.available_quantity, Stock.updated_at, Stock.change_gen,
+)
+CHANGE_ENTITIES = {"products": Product, "stocks": Stock}
+
+
+def _next_generation(conn: Connection, counter: str) -> int:
+    """Увеличить счётчик в текущей транзакции и вернуть новое значение (строка создаётся при первом вызове)."""
+    bump = (
+        update(ChangeCounter.__table__)
+        .where(ChangeCounter.name == counter)
+        .values(value=ChangeCounter.value + 1)
+        .returning(ChangeCounter.value)
+    )
+    value = conn.execute(bump).scalar()
+    if value is None:
+        insert = pg_insert if conn.dialect.name == "postgresql" else sqlite_insert
+        conn.execute(
+            insert(ChangeCounter.__table__)
+            .values(name=counter, value=0)
+            .on_conflict_do_nothing(index_elements=["name"])
+        )
+        value = conn.execute(bump).scalar()
+    return value
+
+
+def change_generation(db: Session, counter: str = CATALOG_COUNTER) -> int:
+    """Поколение изменений текущей транзакции: выделяется при первой записи и общее для всех её строк.
+
+    UPDATE строки счётчика держит её блокировку до коммита, поэтому пишущие транзакции получают
+    поколения в порядке своих коммитов: если читатель видит поколение N, все поколения меньше N
+    уже закоммичены и лента их не пропустит. Поколение откаченной транзакции просто пропадает.
+    """
+    generations = db.info.setdefault("change_gens", {})
+    if counter not in generations:
+        generations[counter] = _next_generation(db.connection(), counter)
+    return generations[counter]
+
+
+def current_generation(db: Session, counter: str = CATALOG_COUNTER) -> int:
+    """Последнее закоммиченное поколение счётчика (0 — изменений ещё не было)."""
+    return current_generations(db, [counter])[counter]
+
+
+def current_generations(db: Session, counters: Iterable[str]) -> Dict[str, int]:
+    """Поколения нескольких счётчиков одним запросом по первичному ключу."""
+    names = list(counters)
+    found = dict(db.execute(
+        select(ChangeCounter.name, ChangeCounter.value).where(ChangeCounter.name.in_(names))
+    ).all())
+    return {name: found.get(name) or 0 for name in names}
+
+
+def read_changes(
+    db: Session,
+    entity: str,
+    since: int,
+    limit: int,
+    after: Optional[Tuple[int, int]] = None,
+) -> List[Dict[str, Any]]:
+    """Строки `entity`, изменённые после поколения `since`, в порядке (change_gen, id).
+
+    `after` — (change_gen, id) последней строки предыдущей страницы. Запрос идёт по индексу
+    (change_gen, id): страница стоит одинаково при любой глубине ленты.
+    """
+    model = CHANGE_ENTITIES[entity]
+    if entity == "stocks":
+        query = (
+            db.query(*STOCK_CHANGE_COLUMNS)
+            .select_from(Stock)
+            .join(Product, Product.id == Stock.product_id)
+            .join(Warehouse, Warehouse.id == Stock.warehouse_id)
+        )
+    else:
+        query = db.query(*PRODUCT_CHANGE_COLUMNS)
+    query = query.filter(model.change_gen > since)
+    if after is not None:
+        last_gen, last_id = after
+        query = query.filter(or_(
+            model.change_gen > last_gen,
+            and_(model.change_gen == last_gen, model.id > last_id),
+        ))
+    rows = query.order_by(model.change_gen.asc(), model.id.asc()).limit(limit).all()
+    return [dict(row._mapping) for row in rows]
+
+
+@event.listens_for(Session, "before_flush")
+def _stamp_flushed_changes(session: Session, flush_context, instances) -> None:
+    # ORM-записи (создание товара из API, правка вкладок, склады синхронизации);
+    # set-based апсерты товаров и остатков ставят change_gen сами
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        counter = TABLE_COUNTERS.get(getattr(obj, "__tablename__", None))
+        if counter is None:
+            continue
+        if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+            continue
+        generation = change_generation(session, counter)
+        if isinstance(obj, (Product, Stock)) and obj not in session.deleted:
+            obj.change_gen = generation
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _count_bulk_changes(orm_execute_state) -> None:
+    # Set-based INSERT / UPDATE / DELETE через session.execute минуют flush
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    table = getattr(orm_execute_state.statement, "table", None)
+    counter = TABLE_COUNTERS.get(getattr(table, "name", None))
+    if counter is not None:
+        change_generation(orm_execute_state.session, counter)
+
+
+@event.listens_for(Session, "after_commit")
+def _reset_generation_on_commit(session: Session) -> None:
+    session.info.pop("change_gens", None)
+
+
+@event.listens_for(Session, "after_rollback")
+def _reset_generation_on_rollback(session: Session) -> None:
+    session.info.pop("change_gens", None)
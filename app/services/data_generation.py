@@ -0,0 +1,13 @@
+from sqlalchemy.orm import Session
+
+from .change_feed import CATALOG_COUNTER, current_generation
+
+
+def get_data_generation(db: Session) -> int:
+    """Поколение данных товаров и остатков — закоммиченное значение счётчика `catalog` в БД.
+
+    Счётчик увеличивает любая транзакция, записавшая товары или остатки, в каком бы процессе
+    она ни шла (API или отдельный воркер синхронизации), поэтому кэши всех API-процессов
+    видят одно и то же поколение.
+    """
+    return current_generation(db, CATALOG_COUNTER)
@@ -0,0 +1,138 @@
+import asyncio
+from typing import Optional
+
+import httpx
+from loguru import logger
+from prometheus_client import Counter, Gauge
+
+from ..core.config import settings
+
+HTTP_REQUESTS = Counter(
+    "remonline_http_requests_total",
+    "Запросы к API Remonline через общий HTTP-клиент",
+)
+HTTP_CONNECTIONS_OPENED = Counter(
+    "remonline_http_connections_opened_total",
+    "Новые TCP-соединения к API Remonline (остальные запросы переиспользуют соединения пула)",
+)
+HTTP_POOL_CONNECTIONS = Gauge(
+    "remonline_http_pool_connections",
+    "Соединения в пуле общего HTTP-клиента Remonline",
+    ["state"],
+)
+HTTP_CONNECTION_REUSE_RATIO = Gauge(
+    "remonline_http_connection_reuse_ratio",
+    "Доля запросов к API Remonline, выполненных на уже открытом соединении",
+)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class RemonlineHTTPClient:
+    """Общий на приложение `httpx.AsyncClient` для API Remonline.
+
+    Запускается и останавливается вместе с приложением (startup/shutdown в main.py),
+    поэтому пул keep-alive соединений и TLS-сессии переживают отдельные запросы
+    пользователя и прогоны синхронизации. CLI (flow.py) и тесты получают клиент лениво;
+    клиент привязан к event loop и пересоздаётся, если loop сменился.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._requests = 0
+        self._connections_opened = 0
+
+    def _create_client(self) -> httpx.AsyncClient:
+        http2 = settings.REMONLINE_HTTP2
+        if http2 and not _http2_available():
+            logger.warning("REMONLINE_HTTP2 is enabled but the 'h2' package is missing; using HTTP/1.1")
+            http2 = False
+        headers = {}
+        if settings.REMONLINE_API_KEY:
+            headers["Authorization"] = f"Bearer {settings.REMONLINE_API_KEY}"
+        limits = httpx.Limits(
+            max_connections=settings.REMONLINE_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.REMONLINE_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=settings.REMONLINE_HTTP_KEEPALIVE_EXPIRY,
+        )
+        logger.info(
+            f"Starting shared Remonline HTTP client: max_connections={limits.max_connections}, "
+            f"keepalive={limits.max_keepalive_connections}, http2={http2}"
+        )
+        return httpx.AsyncClient(
+            timeout=settings.REMONLINE_HTTP_TIMEOUT,
+            headers=headers,
+            verify=False,
+            limits=limits,
+            http2=http2,
+            event_hooks={"request": [self._on_request], "response": [self._on_response]},
+        )
+
+    async def _on_request(self, request: httpx.Request) -> None:
+        self._requests += 1
+        HTTP_REQUESTS.inc()
+        request.extensions["trace"] = self._trace
+        self._update_reuse_ratio()
+
+    async def _on_response(self, response: httpx.Response) -> None:
+        self._update_pool_gauges()
+
+    async def _trace(self, event_name: str, info: dict) -> None:
+        # httpcore сообщает о каждом новом соединении; запросы без этого события шли по открытому
+        if event_name == "connection.connect_tcp.complete":
+            self._connections_opened += 1
+            HTTP_CONNECTIONS_OPENED.inc()
+            self._update_reuse_ratio()
+
+    def _update_reuse_ratio(self) -> None:
+        if self._requests:
+            HTTP_CONNECTION_REUSE_RATIO.set(max(0.0, 1 - self._connections_opened / self._requests))
+
+    def pool_stats(self) -> dict:
+        """Соединения пула: всего, занятых и простаивающих (по данным httpcore)."""
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        idle = sum(1 for c in connections if c.is_idle())
+        return {
+            "connections": len(connections),
+            "active": len(connections) - idle,
+            "idle": idle,
+            "requests": self._requests,
+            "connections_opened": self._connections_opened,
+        }
+
+    def _update_pool_gauges(self) -> None:
+        stats = self.pool_stats()
+        HTTP_POOL_CONNECTIONS.labels("active").set(stats["active"])
+        HTTP_POOL_CONNECTIONS.labels("idle").set(stats["idle"])
+
+    async def start(self) -> httpx.AsyncClient:
+        return self.get()
+
+    def get(self) -> httpx.AsyncClient:
+        """Клиент текущего event loop (создаётся при первом обращении)."""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            # Клиент чужого (завершённого) loop'а закрыть уже нельзя — соединения уйдут вместе с ним
+            self._client = self._create_client()
+            self._loop = loop
+        self._update_pool_gauges()
+        return self._client
+
+    async def stop(self) -> None:
+        if self._client is not None and not self._client.is_closed and self._loop is asyncio.get_running_loop():
+            await self._client.aclose()
+            logger.info("Shared Remonline HTTP client closed")
+        self._client = None
+        self._loop = None
+        self._update_pool_gauges()
+
+
+remonline_http = RemonlineHTTPClient()
@@ -0,0 +1,209 @@
+import hashlib
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Iterator, Optional
+
+from loguru import logger
+from sqlalchemy import or_, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection, Engine
+
+from ..core.config import settings
+from ..models import ServiceLock, engine
+
+# Лидер синхронизации: только он выполняет задания и тратит лимит запросов Remonline
+SYNC_LEADER_LOCK = "remonline-sync-leader"
+# Планировщик фоновой синхронизации: ставит задания в очередь по расписанию
+SYNC_SCHEDULER_LOCK = "remonline-sync-scheduler"
+# Короткая критическая секция постановки задания (проверка дубликата и вставка)
+SYNC_ENQUEUE_LOCK = "remonline-sync-enqueue"
+
+
+def default_owner() -> str:
+    """Идентификатор владельца блокировки: host:pid:случайный суффикс."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def advisory_key(name: str) -> int:
+    """64-битный ключ advisory-блокировки PostgreSQL по имени блокировки."""
+    return int.from_bytes(hashlib.sha256(name.encode("utf-8")).digest()[:8], "big", signed=True)
+
+
+class AdvisoryLock:
+    """Сессионная advisory-блокировка PostgreSQL (`pg_try_advisory_lock`).
+
+    Блокировку держит отдельное соединение: если процесс-владелец умер или соединение
+    оборвалось, PostgreSQL снимает её сам, и её сразу может взять другой узел.
+    """
+
+    def __init__(self, name: str, owner: Optional[str] = None, bind: Optional[Engine] = None):
+        self.name = name
+        self.owner = owner or default_owner()
+        self.bind = bind or engine
+        self.key = advisory_key(name)
+        self._conn: Optional[Connection] = None
+        self._mutex = threading.Lock()
+
+    @property
+    def held(self) -> bool:
+        return self._conn is not None
+
+    def acquire(self) -> bool:
+        """Взять блокировку без ожидания (или подтвердить, что она всё ещё у нас)."""
+        with self._mutex:
+            if self._conn is not None:
+                return self._check()
+            conn = self.bind.connect()
+            try:
+                got = bool(conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key}).scalar())
+                conn.commit()
+            except Exception:
+                conn.close()
+                raise
+            if not got:
+                conn.close()
+                return False
+            self._conn = conn
+            return True
+
+    def renew(self) -> bool:
+        """Проверить, что соединение с блокировкой живо. False — блокировка потеряна."""
+        with self._mutex:
+            return self._conn is not None and self._check()
+
+    def _check(self) -> bool:
+        try:
+            self._conn.execute(text("SELECT 1"))
+            self._conn.commit()
+            return True
+        except Exception as e:
+            logger.warning(f"Advisory lock {self.name} lost: {e}")
+            self._drop()
+            return False
+
+    def release(self) -> None:
+        with self._mutex:
+            if self._conn is None:
+                return
+            try:
+                self._conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+                self._conn.commit()
+            except Exception as e:
+                logger.warning(f"Failed to release advisory lock {self.name}: {e}")
+            self._drop()
+
+    def _drop(self) -> None:
+        try:
+            self._conn.invalidate()
+            self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+
+class TableLock:
+    """Блокировка с арендой в таблице `service_locks` — для БД без advisory-блокировок (SQLite).
+
+    Владелец продлевает аренду через `renew()`; если он умер, после `ttl_seconds` блокировку
+    забирает другой узел. Захват и продление — условные запросы, поэтому блокировку получает один.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        owner: Optional[str] = None,
+        ttl_seconds: Optional[float] = None,
+        bind: Optional[Engine] = None,
+    ):
+        self.name = name
+        self.owner = owner or default_owner()
+        self.ttl = timedelta(seconds=ttl_seconds or settings.SYNC_JOB_LEASE_SECONDS)
+        self.bind = bind or engine
+        self.held = False
+
+    def _insert(self):
+        return pg_insert if self.bind.dialect.name == "postgresql" else sqlite_insert
+
+    def acquire(self) -> bool:
+        """Взять блокировку без ожидания: свободную, с истёкшей арендой или уже нашу (продление)."""
+        now = datetime.utcnow()
+        with self.bind.begin() as conn:
+            inserted = conn.execute(
+                self._insert()(ServiceLock.__table__)
+                .values(name=self.name, owner=self.owner, acquired_at=now, expires_at=now + self.ttl)
+                .on_conflict_do_nothing(index_elements=["name"])
+            ).rowcount
+            if not inserted:
+                updated = conn.execute(
+                    update(ServiceLock.__table__)
+                    .where(
+                        ServiceLock.name == self.name,
+                        or_(ServiceLock.owner == self.owner, ServiceLock.expires_at < now),
+                    )
+                    .values(owner=self.owner, expires_at=now + self.ttl)
+                ).rowcount
+                inserted = updated
+        got = inserted == 1
+        if got and not self.held:
+            logger.info(f"Lock {self.name} acquired by {self.owner}")
+        self.held = got
+        return got
+
+    def renew(self) -> bool:
+        """Продлить аренду. False — блокировку забрал другой узел (наша аренда истекла)."""
+        now = datetime.utcnow()
+        with self.bind.begin() as conn:
+            updated = conn.execute(
+                update(ServiceLock.__table__)
+                .where(ServiceLock.name == self.name, ServiceLock.owner == self.owner)
+                .values(expires_at=now + self.ttl)
+            ).rowcount
+        if not updated and self.held:
+            logger.warning(f"Lock {self.name} lost by {self.owner}")
+        self.held = updated == 1
+        return self.held
+
+    def release(self) -> None:
+        with self.bind.begin() as conn:
+            conn.execute(
+                ServiceLock.__table__.delete()
+                .where(ServiceLock.name == self.name, ServiceLock.owner == self.owner)
+            )
+        self.held = False
+
+
+def service_lock(
+    name: str,
+    owner: Optional[str] = None,
+    ttl_seconds: Optional[float] = None,
+    bind: Optional[Engine] = None,
+):
+    """Блокировка между процессами и узлами: advisory-блокировка в PostgreSQL, таблица `service_locks` иначе."""
+    bind = bind or engine
+    if bind.dialect.name == "postgresql":
+        return AdvisoryLock(name, owner=owner, bind=bind)
+    return TableLock(name, owner=owner, ttl_seconds=ttl_seconds, bind=bind)
+
+
+@contextmanager
+def exclusive(name: str, timeout: float = 10.0, bind: Optional[Engine] = None) -> Iterator[None]:
+    """Короткая критическая секция между процессами: ждать блокировку до `timeout` секунд.
+
+    Аренда табличной блокировки равна `timeout`: упавший посреди секции процесс не держит её дольше.
+    """
+    lock = service_lock(name, ttl_seconds=timeout, bind=bind)
+    deadline = time.monotonic() + timeout
+    while not lock.acquire():
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"Lock {name} is busy")
+        time.sleep(0.05)
+    try:
+        yield
+    finally:
+        lock.release()
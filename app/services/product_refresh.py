@@ -0,0 +1,220 @@
+import asyncio
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from loguru import logger
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..models import Product, ProductLocation, Stock, Warehouse, run_db
+from .bulk_upsert import refresh_stock_totals, upsert_goods
+from .change_feed import change_generation
+
+
+def id_batches(good_ids: Sequence[int], size: Optional[int] = None) -> List[List[int]]:
+    """Разбить id товаров на пачки для одного запроса `ids[]` (не больше REMONLINE_IDS_PER_REQUEST)."""
+    size = max(1, size or settings.REMONLINE_IDS_PER_REQUEST)
+    return [list(good_ids[i:i + size]) for i in range(0, len(good_ids), size)]
+
+
+async def fetch_goods_across_warehouses(
+    service, warehouses: Sequence[Warehouse], good_ids: List[int]
+) -> List[Tuple[Warehouse, List[int], Optional[List[Dict[str, Any]]], Optional[str]]]:
+    """Запросить товары `good_ids` сразу на всех складах: по запросу `ids[]` на склад и пачку id.
+
+    Запросы идут параллельно, темп задаёт общий rate limiter сервиса. Возвращает четвёрки
+    (склад, пачка id, элементы API или None, текст ошибки или None).
+    """
+    async def fetch(wh: Warehouse, batch: List[int]):
+        try:
+            return wh, batch, await service.fetch_goods_by_ids(wh.remonline_id, batch), None
+        except Exception as e:
+            logger.warning(f"Ошибка запроса товаров на складе {wh.name} (ID: {wh.remonline_id}): {e}")
+            return wh, batch, None, str(e)
+
+    batches = id_batches(good_ids)
+    return await asyncio.gather(*(fetch(wh, batch) for wh in warehouses for batch in batches))
+
+
+def known_locations(db: Session, good_ids: Iterable[int]) -> Set[int]:
+    """warehouses.id складов, на которых товары `good_ids` видели последний раз (`product_locations`)."""
+    ids = list(good_ids)
+    if not ids:
+        return set()
+    return {
+        warehouse_id for (warehouse_id,) in db.query(ProductLocation.warehouse_id)
+        .filter(ProductLocation.remonline_id.in_(ids)).distinct()
+    }
+
+
+def order_by_location(db: Session, warehouses: Sequence[Warehouse], good_ids: Iterable[int]) -> List[Warehouse]:
+    """Склады, где товары уже видели, — первыми: их запросы раньше получают токены rate limiter'а."""
+    known = known_locations(db, good_ids)
+    return sorted(warehouses, key=lambda wh: wh.id not in known)
+
+
+async def _first_found(service, warehouses: Sequence[Warehouse], good_id: int) -> Optional[Tuple[Warehouse, Dict[str, Any]]]:
+    """Параллельно опросить склады; вернуть первый, где нашёлся товар, и отменить остальные запросы."""
+    async def probe(wh: Warehouse):
+        try:
+            items = await service.fetch_goods_by_ids(wh.remonline_id, [good_id])
+        except Exception as e:
+            logger.warning(f"Ошибка поиска на складе {wh.name} (ID: {wh.remonline_id}): {e}")
+            return None
+        for item in items:
+            if isinstance(item, dict) and item.get("id") == good_id:
+                return wh, item
+        return None
+
+    tasks = [asyncio.create_task(probe(wh)) for wh in warehouses]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            found = await next_done
+            if found is not None:
+                return found
+        return None
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def locate_good(
+    service, db: Session, good_id: int, warehouses: Sequence[Warehouse]
+) -> Optional[Tuple[Warehouse, Dict[str, Any]]]:
+    """Найти товар Remonline на складах: сначала известные по `product_locations`, затем остальные.
+
+    Обе волны идут параллельно под общим rate limiter и останавливаются на первой находке.
+    Возвращает (склад, элемент API) или None, если товара нет ни на одном складе.
+    """
+    known = await run_db(known_locations, db, [good_id])
+    waves = (
+        ("known", [wh for wh in warehouses if wh.id in known]),
+        ("sweep", [wh for wh in warehouses if wh.id not in known]),
+    )
+    for wave, group in waves:
+        if not group:
+            continue
+        found = await _first_found(service, group, good_id)
+        if found is not None:
+            logger.info(f"Товар {good_id} найден на складе {found[0].name} ({wave}, складов в волне: {len(group)})")
+            return found
+    return None
+
+
+def _forget_locations(db: Session, warehouse_id: int, good_ids: Iterable[int]) -> None:
+    ids = list(good_ids)
+    if ids:
+        db.query(ProductLocation).filter(
+            ProductLocation.warehouse_id == warehouse_id,
+            ProductLocation.remonline_id.in_(ids),
+        ).delete(synchronize_session=False)
+
+
+def _zero_missing_stocks(db: Session, warehouse_id: int, product_ids: Iterable[int]) -> int:
+    """Обнулить остатки товаров, которых склад больше не вернул."""
+    ids = list(product_ids)
+    if not ids:
+        return 0
+    return db.query(Stock).filter(
+        Stock.warehouse_id == warehouse_id,
+        Stock.product_id.in_(ids),
+        Stock.quantity != 0,
+    ).update(
+        {"quantity": 0, "available_quantity": 0, "updated_at": func.now(), "change_gen": change_generation(db)},
+        synchronize_session=False,
+    )
+
+
+def _apply_refresh(
+    db: Session,
+    wanted: List[int],
+    warehouse_goods: List[Tuple[int, List[Dict[str, Any]]]],
+    checked: Dict[int, set],
+    returned: Dict[int, set],
+) -> Tuple[Dict[str, Any], int, set]:
+    """Записать итоги опроса складов одной транзакцией. Возвращает (статистику апсерта, обнулённых остатков, найденные id)."""
+    try:
+        stats = upsert_goods(db, warehouse_goods)
+        product_ids = dict(
+            db.query(Product.remonline_id, Product.id).filter(Product.remonline_id.in_(wanted))
+        )
+        stocks_zeroed = 0
+        for warehouse_id, rem_ids in checked.items():
+            missing = rem_ids - returned[warehouse_id]
+            _forget_locations(db, warehouse_id, missing)
+            stocks_zeroed += _zero_missing_stocks(
+                db, warehouse_id, (product_ids[rem_id] for rem_id in missing if rem_id in product_ids)
+            )
+        refresh_stock_totals(db, product_ids.values())
+
+        found = set().union(*returned.values()) if returned else set()
+        found_ids = [product_ids[rem_id] for rem_id in found if rem_id in product_ids]
+        if found_ids:
+            # Неизменённые товары апсерт пропускает; отметка времени показывает, что товар сверен с API
+            db.query(Product).filter(Product.id.in_(found_ids)).update(
+                {"updated_at": func.now()}, synchronize_session=False
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return stats, stocks_zeroed, found
+
+
+async def refresh_products(service, db: Session, good_ids: Iterable[int], warehouses: Sequence[Warehouse]) -> Dict[str, Any]:
+    """Принудительно обновить товары (по Remonline ID) и их остатки на указанных складах.
+
+    На каждый склад уходит по запросу `ids[]` на пачку до REMONLINE_IDS_PER_REQUEST товаров;
+    все запросы идут параллельно, затем поля товаров и остатки записываются одной транзакцией
+    через `upsert_goods`. Склад ответил, но товара не вернул — остаток на нём обнуляется;
+    товары из пачек с ошибкой запроса на этом складе не трогаются. Возвращает сводку и
+    результат по каждому складу. Склады, где товары уже видели, опрашиваются первыми;
+    `product_locations` обновляется по итогам опроса.
+    """
+    wanted = sorted(set(good_ids))
+    warehouses = await run_db(order_by_location, db, warehouses, wanted)
+    fetched = await fetch_goods_across_warehouses(service, warehouses, wanted)
+
+    warehouse_goods: List[Tuple[int, List[Dict[str, Any]]]] = []
+    # Для каждого склада: id из успешно запрошенных пачек и id, которые склад вернул
+    checked: Dict[int, set] = {}
+    returned: Dict[int, set] = {}
+    results: Dict[int, Dict[str, Any]] = {}
+    for wh in warehouses:
+        results[wh.id] = {"warehouse_id": wh.remonline_id, "name": wh.name, "found": 0, "quantity": 0.0}
+    for wh, batch, items, error in fetched:
+        result = results[wh.id]
+        if error is not None:
+            result["error"] = error
+            continue
+        batch_ids = set(batch)
+        goods = [g for g in items if isinstance(g, dict) and g.get("id") in batch_ids]
+        warehouse_goods.append((wh.id, goods))
+        checked.setdefault(wh.id, set()).update(batch_ids)
+        returned.setdefault(wh.id, set()).update(g["id"] for g in goods)
+        result["found"] += len(goods)
+        result["quantity"] += sum(g.get("residue", 0.0) or 0.0 for g in goods)
+    for result in results.values():
+        result["status"] = "error" if "error" in result else ("found" if result["found"] else "absent")
+    results = list(results.values())
+
+    # Запись — в пуле потоков БД: event loop не ждёт коммита
+    stats, stocks_zeroed, found = await run_db(_apply_refresh, db, wanted, warehouse_goods, checked, returned)
+
+    failed = [r["warehouse_id"] for r in results if r["status"] == "error"]
+    logger.info(
+        f"Refreshed {len(found)}/{len(wanted)} products on {len(warehouses)} warehouses "
+        f"with {len(fetched)} requests: "
+        f"stocks_changed={stats['stocks_changed']}, stocks_zeroed={stocks_zeroed}, failed={failed}"
+    )
+    return {
+        "products_requested": len(wanted),
+        "products_found": len(found),
+        "products_changed": stats["products_changed"],
+        "stocks_changed": stats["stocks_changed"],
+        "stocks_zeroed": stocks_zeroed,
+        "requests": len(fetched),
+        "warehouses_total": len(warehouses),
+        "warehouses_failed": failed,
+        "warehouses": results,
+    }
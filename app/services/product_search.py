@@ -0,0 +1,144 @@
+from typing import Dict, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import Column, Integer, MetaData, String, Table, cast, func, literal_column, or_, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from ..models import Product
+
+# FTS5 с токенайзером trigram ищет подстроки от 3 символов; короче — обычный ilike
+MIN_INDEXED_QUERY = 3
+
+# Теневая FTS5-таблица SQLite: rowid = products.id. Не входит в Base.metadata — создаётся ensure_search_index,
+# синхронизируется триггерами на products при любой записи (апсерт синхронизации, ORM, SQL)
+products_fts = Table(
+    "products_fts",
+    MetaData(),
+    Column("rowid", Integer),
+    Column("name", String),
+    Column("remonline_id", String),
+)
+
+_SQLITE_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts (rowid, name, remonline_id) VALUES (new.id, new.name, CAST(new.remonline_id AS TEXT));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+        DELETE FROM products_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, remonline_id ON products BEGIN
+        DELETE FROM products_fts WHERE rowid = old.id;
+        INSERT INTO products_fts (rowid, name, remonline_id) VALUES (new.id, new.name, CAST(new.remonline_id AS TEXT));
+    END""",
+)
+
+# Доступный бэкенд по движку: "fts5", "pg_trgm" или "ilike"
+_backends: Dict[int, str] = {}
+
+
+def _detect_backend(bind) -> str:
+    engine = bind.engine if hasattr(bind, "engine") else bind
+    key = id(engine)
+    if key not in _backends:
+        backend = "ilike"
+        with engine.connect() as conn:
+            if engine.dialect.name == "sqlite":
+                exists = conn.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+                )).first()
+                backend = "fts5" if exists else "ilike"
+            elif engine.dialect.name == "postgresql":
+                exists = conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first()
+                backend = "pg_trgm" if exists else "ilike"
+        _backends[key] = backend
+    return _backends[key]
+
+
+def search_backend(db: Session) -> str:
+    """Бэкенд поиска товаров для текущего подключения."""
+    return _detect_backend(db.get_bind())
+
+
+def ensure_search_index(engine: Engine) -> str:
+    """Создать поисковый индекс, если его нет (вызывается при старте после create_all).
+
+    - SQLite: FTS5-таблица `products_fts` (tokenize=trigram) и триггеры на products;
+      при расхождении с products — перестройка.
+    - PostgreSQL: расширение pg_trgm и GIN-индексы по name и remonline_id::text
+      (см. migrations/008_product_search_index.sql). Индексы PostgreSQL поддерживает сам.
+    """
+    _backends.pop(id(engine), None)
+    try:
+        with engine.begin() as conn:
+            if engine.dialect.name == "sqlite":
+                conn.execute(text(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts "
+                    "USING fts5(name, remonline_id, tokenize = 'trigram')"
+                ))
+                for statement in _SQLITE_TRIGGERS:
+                    conn.execute(text(statement))
+                indexed = conn.execute(text("SELECT count(*) FROM products_fts")).scalar()
+                total = conn.execute(text("SELECT count(*) FROM products")).scalar()
+                if indexed != total:
+                    logger.info(f"Rebuilding products_fts: {indexed} indexed of {total} products")
+                    conn.execute(text("DELETE FROM products_fts"))
+                    conn.execute(text(
+                        "INSERT INTO products_fts (rowid, name, remonline_id) "
+                        "SELECT id, name, CAST(remonline_id AS TEXT) FROM products"
+                    ))
+            elif engine.dialect.name == "postgresql":
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS idx_products_name_trgm ON products USING gin (name gin_trgm_ops)"
+                ))
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS idx_products_remonline_id_trgm "
+                    "ON products USING gin ((CAST(remonline_id AS TEXT)) gin_trgm_ops)"
+                ))
+    except Exception as e:
+        logger.warning(f"Search index is not available, falling back to ilike: {e}")
+    return _detect_backend(engine)
+
+
+def _fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def apply_product_search(query, db: Session, term: Optional[str]) -> Tuple[object, Optional[object]]:
+    """Отфильтровать товары по подстроке в названии или RemID.
+
+    Возвращает (query, выражение релевантности «больше — лучше») или (query, None),
+    если ранжирование недоступно (ilike-путь).
+    """
+    if not term:
+        return query, None
+    backend = search_backend(db)
+    if backend == "fts5" and len(term.strip()) >= MIN_INDEXED_QUERY:
+        matches = (
+            select(
+                products_fts.c.rowid.label("product_id"),
+                (-func.bm25(literal_column("products_fts"))).label("rank"),
+            )
+            .where(literal_column("products_fts").op("MATCH")(_fts_phrase(term.strip())))
+            .subquery("search_matches")
+        )
+        query = query.join(matches, matches.c.product_id == Product.id)
+        return query, matches.c.rank
+    if backend == "pg_trgm":
+        # ILIKE по выражениям GIN-индексов gin_trgm_ops; ранжирование — similarity()
+        pattern = f"%{term}%"
+        query = query.filter(or_(
+            Product.name.ilike(pattern),
+            cast(Product.remonline_id, String).ilike(pattern),
+        ))
+        return query, func.similarity(Product.name, term)
+    return apply_ilike_search(query, term), None
+
+
+def apply_ilike_search(query, term: str):
+    """Исходный путь поиска: ilike по названию и RemID (полный просмотр таблицы)."""
+    return query.filter(or_(
+        Product.name.ilike(f"%{term}%"),
+        cast(Product.remonline_id, String).ilike(f"%{term}%")
+    ))
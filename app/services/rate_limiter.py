@@ -0,0 +1,151 @@
+import asyncio
+import time
+from typing import Optional
+
+from loguru import logger
+from prometheus_client import Gauge
+
+from ..core.config import settings
+
+RATE_LIMIT_RPS = Gauge(
+    "remonline_rate_limit_rps",
+    "Текущий темп запросов к API Remonline (подстраивается AIMD)",
+)
+
+# Одна волна отказов (запросы, отправленные до первого 429) снижает темп один раз
+DECREASE_COOLDOWN_SECONDS = 1.0
+
+
+class TokenBucket:
+    """Асинхронный token bucket: не больше `rate` запросов в секунду с допустимым всплеском `capacity`.
+
+    Ожидающие получают токены строго по очереди (FIFO), поэтому общий лимит
+    делится между всеми корутинами процесса без простоев и без превышения.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = float(rate)
+        self.capacity = max(1, int(capacity))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_lock(self) -> asyncio.Lock:
+        # asyncio.Lock привязывается к event loop; flow.py и тесты запускают несколько loop'ов
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """Дождаться и забрать один токен."""
+        if self.rate <= 0:
+            return
+        async with self._get_lock():
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def on_success(self, latency: float) -> None:
+        """Ответ получен успешно за `latency` секунд (фиксированный лимит не подстраивается)."""
+
+    def on_throttle(self, retry_after: Optional[float] = None) -> None:
+        """API сообщил о перегрузке: 429, 5xx или таймаут."""
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """Token bucket с AIMD-подстройкой темпа под то, что выдерживает API.
+
+    - Additive increase: каждый успешный ответ быстрее `latency_target` прибавляет `increase_step` RPS
+      (до `max_rate`); медленные ответы темп не меняют.
+    - Multiplicative decrease: 429/5xx/таймаут умножают темп на `decrease_factor` (не ниже `min_rate`),
+      не чаще раза в DECREASE_COOLDOWN_SECONDS.
+    - `Retry-After` приостанавливает выдачу токенов всем корутинам до указанного момента.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: int = 1,
+        min_rate: float = 0.5,
+        max_rate: float = 10.0,
+        increase_step: float = 0.05,
+        latency_target: float = 1.0,
+        decrease_factor: float = 0.5,
+    ):
+        super().__init__(rate, capacity)
+        self.min_rate = min(min_rate, self.rate)
+        self.max_rate = max(max_rate, self.rate)
+        self.increase_step = increase_step
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        RATE_LIMIT_RPS.set(self.rate)
+
+    def _set_rate(self, rate: float) -> None:
+        self._refill()
+        self.rate = rate
+        RATE_LIMIT_RPS.set(rate)
+
+    async def acquire(self) -> None:
+        while True:
+            delay = self._paused_until - time.monotonic()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        await super().acquire()
+
+    def on_success(self, latency: float) -> None:
+        if latency <= self.latency_target and self.rate < self.max_rate:
+            self._set_rate(min(self.max_rate, self.rate + self.increase_step))
+
+    def on_throttle(self, retry_after: Optional[float] = None) -> None:
+        now = time.monotonic()
+        if retry_after:
+            self._paused_until = max(self._paused_until, now + retry_after)
+        if now - self._last_decrease < DECREASE_COOLDOWN_SECONDS:
+            return
+        self._last_decrease = now
+        new_rate = max(self.min_rate, self.rate * self.decrease_factor)
+        if new_rate < self.rate:
+            logger.warning(f"Remonline API throttling: rate {self.rate:.2f} -> {new_rate:.2f} RPS")
+            self._set_rate(new_rate)
+
+
+_remonline_rate_limiter: Optional[TokenBucket] = None
+
+
+def get_remonline_rate_limiter() -> TokenBucket:
+    """Общий на процесс лимитер запросов к API Remonline (настраивается через settings).
+
+    При REMONLINE_RATE_ADAPTIVE темп стартует с REMONLINE_RATE_LIMIT_RPS и подстраивается AIMD
+    в пределах REMONLINE_RATE_LIMIT_MIN_RPS..REMONLINE_RATE_LIMIT_MAX_RPS.
+    """
+    global _remonline_rate_limiter
+    if _remonline_rate_limiter is None:
+        if settings.REMONLINE_RATE_ADAPTIVE:
+            _remonline_rate_limiter = AdaptiveTokenBucket(
+                rate=settings.REMONLINE_RATE_LIMIT_RPS,
+                capacity=settings.REMONLINE_RATE_LIMIT_BURST,
+                min_rate=settings.REMONLINE_RATE_LIMIT_MIN_RPS,
+                max_rate=settings.REMONLINE_RATE_LIMIT_MAX_RPS,
+                increase_step=settings.REMONLINE_RATE_INCREASE_STEP,
+                latency_target=settings.REMONLINE_LATENCY_TARGET_SECONDS,
+            )
+        else:
+            _remonline_rate_limiter = TokenBucket(
+                rate=settings.REMONLINE_RATE_LIMIT_RPS,
+                capacity=settings.REMONLINE_RATE_LIMIT_BURST,
+            )
+    return _remonline_rate_limiter
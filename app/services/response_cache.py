@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from prometheus_client import Counter
+
+from ..core.config import settings
+
+CACHE_HITS = Counter(
+    "response_cache_hits_total",
+    "Ответы, отданные из in-process кэша",
+    ["cache"],
+)
+CACHE_MISSES = Counter(
+    "response_cache_misses_total",
+    "Промахи in-process кэша (нет записи, истёк TTL или сменилось поколение данных)",
+    ["cache"],
+)
+
+
+class GenerationalLRUCache:
+    """LRU-кэш с TTL, привязанный к поколению данных.
+
+    Запись действительна, пока не истёк `ttl_seconds` и не изменилось поколение данных
+    (`get_data_generation(db)` — счётчик в БД, его увеличивает каждый коммит, затронувший товары
+    или остатки, в любом процессе). Поколение передаёт вызывающий, сняв его до запроса к БД.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl_seconds: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, generation: int) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                entry_generation, expires_at, value = entry
+                if entry_generation == generation and expires_at > now:
+                    self._data.move_to_end(key)
+                    CACHE_HITS.labels(self.name).inc()
+                    return value
+                del self._data[key]
+        CACHE_MISSES.labels(self.name).inc()
+        return None
+
+    def set(self, key: Hashable, value: Any, generation: int) -> None:
+        """Сохранить значение, посчитанное на поколении `generation` (снятом до запроса к БД)."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (generation, time.monotonic() + self.ttl_seconds, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# Кэш ответов /products/filtered и /products/matrix
+products_cache = GenerationalLRUCache(
+    "products_filtered",
+    maxsize=settings.PRODUCTS_CACHE_SIZE,
+    ttl_seconds=settings.PRODUCTS_CACHE_TTL_SECONDS,
+)
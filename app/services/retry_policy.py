@@ -0,0 +1,59 @@
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import httpx
+from prometheus_client import Counter
+
+from ..core.config import settings
+
+# Статусы, после которых запрос имеет смысл повторить
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+REQUEST_RETRIES = Counter(
+    "remonline_http_retries_total",
+    "Повторы запросов к API Remonline",
+    ["reason"],
+)
+
+
+def retry_reason(error: Exception) -> Optional[str]:
+    """Причина повтора для ошибки запроса или None, если ошибка не временная (4xx, ошибки разбора)."""
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return str(status) if status in RETRYABLE_STATUS else None
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, httpx.TransportError):
+        return "transport"
+    return None
+
+
+def parse_retry_after(response: Optional[httpx.Response]) -> Optional[float]:
+    """Секунды из заголовка Retry-After (число секунд или HTTP-дата)."""
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return max(0.0, (moment - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Экспоненциальная задержка с full jitter перед попыткой `attempt + 1`; не меньше Retry-After."""
+    ceiling = min(settings.REMONLINE_RETRY_MAX_DELAY, settings.REMONLINE_RETRY_BASE_DELAY * (2 ** (attempt - 1)))
+    delay = random.uniform(0, ceiling)
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, settings.REMONLINE_RETRY_MAX_DELAY))
+    return delay
@@ -0,0 +1,292 @@
+import asyncio
+import hashlib
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..models import Warehouse, LastUpdate, run_sync_write
+from .bulk_upsert import upsert_goods
+from .sync_scheduler import (
+    load_run_checkpoints,
+    record_page_checkpoint,
+    record_warehouse_failure,
+    record_warehouse_sync,
+)
+
+# Размер страницы API Remonline: страница короче — последняя
+PAGE_SIZE = 50
+# Сколько готовых страниц писатель сливает в одну транзакцию
+MAX_PAGES_PER_COMMIT = 20
+# Контрольная сумма склада без товаров
+EMPTY_CHECKSUM = hashlib.sha256(b"").hexdigest()
+
+
+def chain_checksum(previous: Optional[str], items: List[Dict[str, Any]]) -> str:
+    """Цепочка sha256 по страницам: sha256(предыдущая сумма + (id, residue) товаров страницы).
+
+    Состояние — одна hex-строка, поэтому его можно сохранить в чекпоинт и продолжить после рестарта.
+    """
+    page_payload = json.dumps([(item.get("id"), item.get("residue")) for item in items], default=str)
+    return hashlib.sha256(((previous or "") + page_payload).encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class WarehouseRef:
+    """Снимок склада для конвейера: ORM-объект истекает после коммита в потоке писателя."""
+    id: int
+    remonline_id: int
+
+
+class StockSyncEngine:
+    """Конвейер синхронизации товаров и остатков по многим складам сразу.
+
+    - Пул из `workers` корутин забирает задания (склад, страница) из общей очереди.
+      У каждого склада в работе не больше одной страницы, поэтому параллельно
+      обрабатываются до `workers` складов.
+    - Темп запросов задаёт общий token bucket `RemonlineService`, а не паузы в коде:
+      API загружен ровно на разрешённый RPS.
+    - В БД пишет один писатель: сливает накопившиеся страницы и коммитит их одной транзакцией
+      в выделенном потоке (`run_sync_write`), не блокируя event loop.
+    - По завершении склада его курсор (`WarehouseSyncCursor`) получает число страниц и товаров
+      и контрольную сумму остатков — по ним планируется следующая инкрементальная синхронизация.
+    - С `run_id` (прогон `SyncRun`) вместе с каждой страницей коммитится чекпоинт склада;
+      повторный запуск с тем же `run_id` пропускает завершённые склады и продолжает
+      остальные со следующей страницы.
+    """
+
+    def __init__(
+        self,
+        service,
+        db: Session,
+        workers: Optional[int] = None,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+        run_id: Optional[int] = None,
+    ):
+        self.service = service
+        self.db = db
+        self.workers = max(1, workers or settings.SYNC_WORKERS)
+        self.on_progress = on_progress
+        self.run_id = run_id
+        self.stats: Dict[str, Any] = {}
+        # Накопители по складам: страницы, товары, цепочка контрольной суммы, ошибка
+        self._cursors: Dict[int, Dict[str, Any]] = {}
+        # Склады, чей пакет не записался: их последующие страницы не пишутся
+        self._write_failed: Set[int] = set()
+
+    async def run(self, warehouses: List[Warehouse]) -> Dict[str, Any]:
+        """Синхронизировать указанные склады. Возвращает статистику прогона."""
+        total = len(warehouses)
+        self.stats = {
+            "warehouses_total": total,
+            "warehouses_finished": 0,
+            "warehouses_failed": [],
+            "warehouses_unchanged": 0,
+            "warehouses_resumed": 0,
+            "pages": 0,
+            "items": 0,
+            "products_changed": 0,
+            "products_skipped": 0,
+            "stocks_changed": 0,
+            "stocks_skipped": 0,
+            "started_at": datetime.utcnow().isoformat(),
+            "finished_at": None,
+        }
+
+        warehouses = [WarehouseRef(wh.id, wh.remonline_id) for wh in warehouses]
+        checkpoints = await run_sync_write(load_run_checkpoints, self.db, self.run_id) if self.run_id is not None else {}
+        self._cursors = {}
+        self._write_failed = set()
+        pending: List[Tuple[WarehouseRef, int]] = []
+        for wh in warehouses:
+            checkpoint = checkpoints.get(wh.id)
+            if checkpoint is not None and checkpoint.run_finished:
+                self.stats["warehouses_finished"] += 1
+                continue
+            state = {"pages": 0, "items": 0, "checksum": None, "error": None}
+            start_page = 1
+            if checkpoint is not None and checkpoint.run_page:
+                state.update(pages=checkpoint.run_pages or 0, items=checkpoint.run_items or 0, checksum=checkpoint.run_checksum)
+                start_page = checkpoint.run_page + 1
+                self.stats["warehouses_resumed"] += 1
+            self._cursors[wh.remonline_id] = state
+            pending.append((wh, start_page))
+
+        self._report_progress()
+        if not pending:
+            self.stats["finished_at"] = datetime.utcnow().isoformat()
+            return self.stats
+
+        pages_queue: asyncio.Queue = asyncio.Queue()
+        results_queue: asyncio.Queue = asyncio.Queue()
+        # После возобновления дедупликация работает только по новым страницам
+        seen_ids: Dict[int, Set[Any]] = {wh.remonline_id: set() for wh, _page in pending}
+
+        for wh, start_page in pending:
+            pages_queue.put_nowait((wh, start_page))
+
+        workers = [
+            asyncio.create_task(self._worker(pages_queue, results_queue, seen_ids))
+            for _ in range(min(self.workers, len(pending)))
+        ]
+        writer = asyncio.create_task(self._writer(results_queue))
+
+        try:
+            # Все страницы получены, затем все результаты записаны
+            await pages_queue.join()
+            await results_queue.join()
+        finally:
+            for task in workers + [writer]:
+                task.cancel()
+            await asyncio.gather(*workers, writer, return_exceptions=True)
+
+        self.stats["finished_at"] = datetime.utcnow().isoformat()
+        logger.info(f"Stock sync engine finished: {self.stats}")
+        return self.stats
+
+    def _report_progress(self) -> None:
+        if self.on_progress:
+            self.on_progress(self.stats["warehouses_finished"], self.stats["warehouses_total"])
+
+    async def _worker(self, pages_queue: asyncio.Queue, results_queue: asyncio.Queue, seen_ids: Dict[int, Set[Any]]) -> None:
+        while True:
+            wh, page = await pages_queue.get()
+            try:
+                cursor = self._cursors[wh.remonline_id]
+                if cursor["error"]:
+                    # Запись склада уже упала: дальнейшие страницы всё равно не будут записаны
+                    continue
+                try:
+                    items = await self.service.fetch_goods_page(wh.remonline_id, page)
+                except Exception as e:
+                    # Повторы временных ошибок уже исчерпаны в RemonlineService._make_request
+                    logger.warning(f"Fetch failed wh={wh.remonline_id} page={page}: {e}")
+                    self._mark_failed(wh.remonline_id, str(e))
+                    results_queue.put_nowait((wh, page, [], True, dict(cursor)))
+                    continue
+
+                # Дедупликация по id: защита от API, который игнорирует номер страницы
+                seen = seen_ids[wh.remonline_id]
+                new_items = []
+                for item in items:
+                    if not isinstance(item, dict):
+                        continue
+                    item_id = item.get("id")
+                    if item_id is not None and item_id in seen:
+                        continue
+                    if item_id is not None:
+                        seen.add(item_id)
+                    new_items.append(item)
+
+                if new_items:
+                    cursor["pages"] += 1
+                    cursor["items"] += len(new_items)
+                    cursor["checksum"] = chain_checksum(cursor["checksum"], new_items)
+
+                is_last = len(items) < PAGE_SIZE or not new_items
+                if not is_last:
+                    # Следующая страница склада встаёт в очередь до task_done(): join() её дождётся
+                    pages_queue.put_nowait((wh, page + 1))
+                # Снимок накопителей: к записи страницы воркер может уже взять следующую
+                results_queue.put_nowait((wh, page, new_items, is_last, dict(cursor)))
+            finally:
+                pages_queue.task_done()
+
+    def _mark_failed(self, warehouse_rem_id: int, error: str) -> None:
+        self._cursors[warehouse_rem_id]["error"] = error
+        if warehouse_rem_id not in self.stats["warehouses_failed"]:
+            self.stats["warehouses_failed"].append(warehouse_rem_id)
+
+    async def _writer(self, results_queue: asyncio.Queue) -> None:
+        while True:
+            batch = [await results_queue.get()]
+            while len(batch) < MAX_PAGES_PER_COMMIT and not results_queue.empty():
+                batch.append(results_queue.get_nowait())
+            # Страницы после потерянного пакета не пишутся: иначе чекпоинт ушёл бы дальше несохранённых страниц
+            batch_to_write = [entry for entry in batch if entry[0].remonline_id not in self._write_failed]
+            finished = 0
+            try:
+                if batch_to_write:
+                    # Апсерт и коммит — в потоке писателя: event loop продолжает обслуживать запросы UI
+                    await run_sync_write(self._write_batch, batch_to_write)
+                pages = [items for _wh, _page, items, _last, _state in batch_to_write if items]
+                self.stats["pages"] += len(pages)
+                self.stats["items"] += sum(len(items) for items in pages)
+                # Склад с упавшей страницей не завершён: его данные неполные, прогон продолжит его с чекпоинта
+                finished = sum(1 for _wh, _page, _items, is_last, state in batch_to_write if is_last and not state["error"])
+            except Exception as e:
+                logger.exception(f"Batch upsert failed: {e}")
+                await self._fail_batch(batch_to_write, f"Batch upsert failed: {e}")
+            finally:
+                if finished:
+                    self.stats["warehouses_finished"] += finished
+                    self._report_progress()
+                for _ in batch:
+                    results_queue.task_done()
+
+    async def _fail_batch(self, batch: List[Tuple[WarehouseRef, int, List[Dict[str, Any]], bool, Dict[str, Any]]], error: str) -> None:
+        """Склады незаписанного пакета — с ошибкой: их чекпоинты остаются на последней закоммиченной
+        странице, и повторный запуск прогона перечитает потерянные страницы."""
+        warehouses = {wh.remonline_id: wh for wh, _page, _items, _last, _state in batch}
+        self._write_failed.update(warehouses)
+        for warehouse_rem_id in warehouses:
+            self._mark_failed(warehouse_rem_id, error)
+        try:
+            await run_sync_write(self._record_failures, list(warehouses.values()), error)
+        except Exception as e:
+            logger.exception(f"Failed to record warehouse errors: {e}")
+
+    def _record_failures(self, warehouses: List[WarehouseRef], error: str) -> None:
+        db = self.db
+        db.rollback()
+        try:
+            for wh in warehouses:
+                record_warehouse_failure(db, wh.id, error)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    def _write_batch(self, batch: List[Tuple[WarehouseRef, int, List[Dict[str, Any]], bool, Dict[str, Any]]]) -> None:
+        """Пакетный апсерт страниц, чекпоинтов и курсоров завершённых складов одной транзакцией."""
+        db = self.db
+        pages = [(wh.id, items) for wh, _page, items, _last, _state in batch if items]
+        result = None
+        if pages:
+            result = upsert_goods(db, pages)
+
+            last_update = db.query(LastUpdate).filter_by(entity_type="products_stocks").first()
+            if not last_update:
+                db.add(LastUpdate(entity_type="products_stocks"))
+            else:
+                last_update.last_updated = datetime.utcnow()
+                last_update.status = "success"
+
+        unchanged = 0
+        for wh, page, items, is_last, state in batch:
+            if state["error"]:
+                record_warehouse_failure(db, wh.id, state["error"])
+                continue
+            if self.run_id is not None and items and not is_last:
+                record_page_checkpoint(db, wh.id, self.run_id, page, state["pages"], state["items"], state["checksum"])
+            if is_last:
+                checksum = state["checksum"] or EMPTY_CHECKSUM
+                saved = record_warehouse_sync(db, wh.id, state["pages"], state["items"], checksum, run_id=self.run_id)
+                if saved.unchanged_runs:
+                    unchanged += 1
+
+        db.commit()
+
+        self.stats["warehouses_unchanged"] += unchanged
+        if result is None:
+            return
+
+        # Счётчики только после успешного коммита: неизменённые строки не перезаписывались
+        self.stats["products_changed"] += result["products_changed"]
+        self.stats["products_skipped"] += result["products_unchanged"]
+        self.stats["stocks_changed"] += result["stocks_changed"]
+        self.stats["stocks_skipped"] += result["stocks"] - result["stocks_changed"]
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+from prometheus_client import Counter, Gauge
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..models import run_db
+from .change_feed import CATALOG_COUNTER, current_generation, read_changes
+
+SSE_CLIENTS = Gauge("sse_clients", "Подключённые клиенты потока событий синхронизации")
+SSE_EVENTS = Counter("sse_events_total", "События, разосланные клиентам SSE", ["event"])
+SSE_RESYNCS = Counter("sse_client_resyncs_total", "Клиенты SSE, отставшие от потока и получившие resync")
+
+# Больше изменённых остатков за один опрос не рассылаем дельтами — клиенты получают resync
+STOCK_DELTAS_LIMIT = 5000
+
+
+def format_sse(event_name: str, data: Any) -> str:
+    """Кадр Server-Sent Events: `event:` и однострочный JSON в `data:`."""
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+    return f"event: {event_name}\ndata: {payload}\n\n"
+
+
+class SyncEventBroadcaster:
+    """Рассылка событий синхронизации клиентам SSE внутри API-процесса.
+
+    У каждого клиента своя ограниченная очередь готовых кадров; кадр форматируется один раз
+    на событие, а не на клиента. Публиковать можно из любого потока (коммиты идут в пуле
+    потоков БД) — доставка выполняется на event loop. Отставшему клиенту очередь
+    очищается и отправляется `resync`: он перечитывает страницу целиком.
+
+    Прогресс синхронизации и изменённые остатки (лента `change_gen`) читает из БД один
+    опросчик на процесс (пока есть клиенты), а не каждый браузер — поэтому видны прогресс
+    и записи отдельного процесса-воркера.
+    """
+
+    def __init__(self, queue_size: Optional[int] = None):
+        self.queue_size = queue_size or settings.SSE_CLIENT_QUEUE_SIZE
+        self._clients: Set[asyncio.Queue] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._progress_task: Optional[asyncio.Task] = None
+        self.last_progress: Optional[str] = None
+        self._progress_frame: Optional[str] = None
+        self._stocks_generation: Optional[int] = None
+
+    @property
+    def clients(self) -> int:
+        return len(self._clients)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._clients.add(queue)
+        SSE_CLIENTS.set(len(self._clients))
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        with self._lock:
+            self._clients.discard(queue)
+        SSE_CLIENTS.set(len(self._clients))
+
+    def publish(self, event_name: str, data: Any) -> None:
+        """Отправить событие всем клиентам (потокобезопасно; без клиентов — ничего не делает)."""
+        with self._lock:
+            loop = self._loop
+            if not self._clients or loop is None or loop.is_closed():
+                return
+        frame = format_sse(event_name, data)
+        try:
+            loop.call_soon_threadsafe(self._deliver, event_name, frame)
+        except RuntimeError:
+            # Event loop уже остановлен
+            pass
+
+    def _deliver(self, event_name: str, frame: str) -> None:
+        SSE_EVENTS.labels(event_name).inc()
+        for queue in list(self._clients):
+            try:
+                queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(format_sse("resync", {"reason": "client is behind"}))
+                SSE_RESYNCS.inc()
+
+    def progress_frame(self) -> Optional[str]:
+        """Последний разосланный кадр `progress` — новый клиент получает его сразу, без запроса к БД."""
+        return self._progress_frame
+
+    def ensure_progress_poller(
+        self,
+        read_progress: Callable[[], Dict[str, Any]],
+        read_stocks: Callable[[Optional[int]], Tuple[int, Optional[List[List[Any]]]]],
+    ) -> None:
+        """Запустить опросчик процесса, если он ещё не запущен.
+
+        `read_progress` возвращает прогресс синхронизации, `read_stocks(since)` — поколение и дельты
+        остатков после него (см. `read_stock_deltas`).
+        """
+        if self._progress_task is None or self._progress_task.done():
+            self._progress_task = asyncio.create_task(self._poll_progress(read_progress, read_stocks))
+
+    async def _poll_progress(self, read_progress, read_stocks) -> None:
+        while self._clients:
+            try:
+                progress = await run_db(read_progress)
+                encoded = json.dumps(progress, sort_keys=True, default=str)
+                if encoded != self.last_progress:
+                    self.last_progress = encoded
+                    self._progress_frame = format_sse("progress", progress)
+                    self.publish("progress", progress)
+                generation, deltas = await run_db(read_stocks, self._stocks_generation)
+                if deltas is None:
+                    self.publish("resync", {"reason": "too many stock changes"})
+                elif deltas:
+                    self.publish("stocks", {"deltas": deltas})
+                self._stocks_generation = generation
+            except Exception as e:
+                logger.warning(f"Sync progress poll failed: {e}")
+            await asyncio.sleep(settings.SSE_PROGRESS_INTERVAL_SECONDS)
+        self.last_progress = None
+        self._progress_frame = None
+        self._stocks_generation = None
+
+
+sync_events = SyncEventBroadcaster()
+
+
+def read_stock_deltas(db: Session, since: Optional[int]) -> Tuple[int, Optional[List[List[Any]]]]:
+    """Дельты остатков по ленте изменений: строки `stocks` с change_gen новее `since`.
+
+    Возвращает (поколение, до которого прочитано, тройки [remonline_id товара, remonline_id
+    склада, доступно]). `since=None` — первый опрос: только текущее поколение, без истории.
+    Вместо троек None, если изменений больше STOCK_DELTAS_LIMIT — клиентам дешевле перечитать страницу.
+    """
+    generation = current_generation(db, CATALOG_COUNTER)
+    if since is None or generation <= since:
+        return generation, []
+    rows = read_changes(db, "stocks", since, STOCK_DELTAS_LIMIT + 1)
+    if len(rows) > STOCK_DELTAS_LIMIT:
+        return generation, None
+    # Строки могут быть новее снятого поколения: их коммиты уже видны, повторно они не придут
+    generation = max([generation] + [row["change_gen"] for row in rows])
+    return generation, [
+        [row["product_remonline_id"], row["warehouse_remonline_id"], row["available_quantity"]] for row in rows
+    ]
@@ -0,0 +1,301 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..models import SyncJob, SyncRun, Warehouse, WarehouseSyncCursor
+from .locks import SYNC_ENQUEUE_LOCK, exclusive
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def _now() -> datetime:
+    return datetime.utcnow()
+
+
+def active_job(db: Session, kind: Optional[str] = None) -> Optional[SyncJob]:
+    """Поставленное или выполняемое задание (самое старое)."""
+    query = db.query(SyncJob).filter(SyncJob.status.in_(ACTIVE_STATUSES))
+    if kind is not None:
+        query = query.filter(SyncJob.kind == kind)
+    return query.order_by(SyncJob.id).first()
+
+
+def _orphan_run(db: Session) -> Optional[SyncRun]:
+    """Последний прогон в статусе running, за которым не стоит активное задание."""
+    attached = db.query(SyncJob.run_id).filter(SyncJob.status.in_(ACTIVE_STATUSES), SyncJob.run_id.isnot(None))
+    return (
+        db.query(SyncRun)
+        .filter(SyncRun.status == "running", SyncRun.id.notin_(attached))
+        .order_by(SyncRun.id.desc())
+        .first()
+    )
+
+
+def enqueue_sync_job(db: Session, kind: str = "full") -> Tuple[SyncJob, bool]:
+    """Поставить задание синхронизации в очередь. Возвращает (задание, создано ли новое).
+
+    Задание того же вида в очереди или в работе не дублируется — возвращается оно.
+    Полное задание продолжает прогон `SyncRun`, оставшийся в статусе running без задания
+    (прерванный до появления очереди): воркер начнёт с чекпоинтов складов.
+    Проверка и вставка идут под межпроцессной блокировкой: одновременные вызовы из разных
+    API-процессов не создадут два задания.
+    """
+    with exclusive(SYNC_ENQUEUE_LOCK, bind=db.get_bind()):
+        existing = active_job(db, kind)
+        if existing is not None:
+            return existing, False
+        job = SyncJob(kind=kind, status="queued")
+        if kind == "full":
+            orphan = _orphan_run(db)
+            if orphan is not None:
+                job.run_id = orphan.id
+                job.message = "Resumed"
+        db.add(job)
+        db.commit()
+    logger.info(f"Sync job {job.id} ({kind}) queued" + (f", resuming run {job.run_id}" if job.run_id else ""))
+    return job, True
+
+
+def resume_orphan_run(db: Session) -> Optional[SyncJob]:
+    """Поставить в очередь продолжение прогона, оставшегося running без задания (при старте приложения)."""
+    if _orphan_run(db) is None:
+        return None
+    job, _created = enqueue_sync_job(db, "full")
+    return job
+
+
+def enqueue_if_due(db: Session, kind: str, interval: timedelta) -> Optional[SyncJob]:
+    """Поставить задание, если с постановки последнего задания этого вида прошло `interval`.
+
+    Время берётся из очереди, а не из памяти процесса: новый лидер-планировщик после
+    переключения продолжает то же расписание.
+    """
+    last = db.query(SyncJob.created_at).filter(SyncJob.kind == kind).order_by(SyncJob.id.desc()).first()
+    if last is not None and last.created_at is not None and last.created_at + interval > _now():
+        return None
+    job, created = enqueue_sync_job(db, kind)
+    return job if created else None
+
+
+def claim_next_job(db: Session, owner: str, lease_seconds: Optional[float] = None) -> Optional[SyncJob]:
+    """Забрать задание под аренду `owner`: из очереди или с истёкшей арендой (воркер умер).
+
+    Захват — условный UPDATE по id и прежнему состоянию аренды: из нескольких воркеров,
+    выбравших одно задание, строку обновит только один. Задание, которое забирали больше
+    SYNC_JOB_MAX_ATTEMPTS раз, помечается failed.
+    """
+    lease = timedelta(seconds=lease_seconds or settings.SYNC_JOB_LEASE_SECONDS)
+    while True:
+        now = _now()
+        candidate = (
+            db.query(SyncJob)
+            .filter(or_(
+                SyncJob.status == "queued",
+                and_(SyncJob.status == "running", SyncJob.lease_expires_at < now),
+            ))
+            .order_by(SyncJob.id)
+            .first()
+        )
+        if candidate is None:
+            return None
+        job_id, expected_owner, expected_expiry = candidate.id, candidate.lease_owner, candidate.lease_expires_at
+        attempts = (candidate.attempts or 0) + 1
+        if candidate.status == "running" and attempts > settings.SYNC_JOB_MAX_ATTEMPTS:
+            finish_job(db, job_id, expected_owner, "failed", f"Lease expired {candidate.attempts} times, giving up")
+            continue
+
+        claimed = db.query(SyncJob).filter(
+            SyncJob.id == job_id,
+            SyncJob.status == candidate.status,
+            SyncJob.lease_owner.is_(None) if expected_owner is None else SyncJob.lease_owner == expected_owner,
+            SyncJob.lease_expires_at.is_(None) if expected_expiry is None else SyncJob.lease_expires_at == expected_expiry,
+        ).update({
+            "status": "running",
+            "lease_owner": owner,
+            "lease_expires_at": now + lease,
+            "heartbeat_at": now,
+            "attempts": attempts,
+            "started_at": candidate.started_at or now,
+        }, synchronize_session=False)
+        db.commit()
+        if claimed != 1:
+            # Задание перехватил другой воркер — пробуем следующее
+            continue
+        if expected_owner is not None:
+            logger.warning(f"Sync job {job_id}: lease of {expected_owner} expired, taken over by {owner}")
+        db.expire_all()
+        return db.get(SyncJob, job_id)
+
+
+def heartbeat(
+    db: Session,
+    job_id: int,
+    owner: str,
+    lease_seconds: Optional[float] = None,
+    processed: Optional[int] = None,
+    total: Optional[int] = None,
+) -> bool:
+    """Продлить аренду задания и записать прогресс. False — аренда потеряна (её забрал другой воркер)."""
+    now = _now()
+    values: Dict[str, Any] = {
+        "heartbeat_at": now,
+        "lease_expires_at": now + timedelta(seconds=lease_seconds or settings.SYNC_JOB_LEASE_SECONDS),
+    }
+    if processed is not None:
+        values["processed"] = processed
+    if total is not None:
+        values["total"] = total
+    updated = db.query(SyncJob).filter(
+        SyncJob.id == job_id, SyncJob.status == "running", SyncJob.lease_owner == owner
+    ).update(values, synchronize_session=False)
+    db.commit()
+    return updated == 1
+
+
+def attach_run(db: Session, job_id: int, owner: str, run_id: int) -> bool:
+    """Запомнить прогон `SyncRun` задания: воркер, забравший задание после сбоя, продолжит его."""
+    updated = db.query(SyncJob).filter(SyncJob.id == job_id, SyncJob.lease_owner == owner).update(
+        {"run_id": run_id}, synchronize_session=False
+    )
+    db.commit()
+    return updated == 1
+
+
+def finish_job(
+    db: Session,
+    job_id: int,
+    owner: Optional[str],
+    status: str,
+    message: Optional[str] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    processed: Optional[int] = None,
+) -> bool:
+    """Завершить задание (finished/failed), если аренда всё ещё у `owner`."""
+    values: Dict[str, Any] = {
+        "status": status,
+        "finished_at": _now(),
+        "lease_expires_at": None,
+        "message": message,
+    }
+    if stats is not None:
+        values["stats"] = stats
+    if processed is not None:
+        values["processed"] = processed
+    updated = db.query(SyncJob).filter(
+        SyncJob.id == job_id,
+        SyncJob.status == "running",
+        SyncJob.lease_owner.is_(None) if owner is None else SyncJob.lease_owner == owner,
+    ).update(values, synchronize_session=False)
+    db.commit()
+    return updated == 1
+
+
+def release_job(db: Session, job_id: int, owner: str) -> bool:
+    """Вернуть задание в очередь при остановке воркера: следующий воркер заберёт его сразу, не дожидаясь
+    истечения аренды, и продолжит прогон с чекпоинтов."""
+    updated = db.query(SyncJob).filter(
+        SyncJob.id == job_id, SyncJob.status == "running", SyncJob.lease_owner == owner
+    ).update({"status": "queued", "lease_owner": None, "lease_expires_at": None}, synchronize_session=False)
+    db.commit()
+    return updated == 1
+
+
+def latest_job(db: Session, kind: Optional[str] = None) -> Optional[SyncJob]:
+    """Активное задание, а если его нет — последнее завершённое."""
+    job = active_job(db, kind)
+    if job is not None:
+        return job
+    query = db.query(SyncJob)
+    if kind is not None:
+        query = query.filter(SyncJob.kind == kind)
+    return query.order_by(SyncJob.id.desc()).first()
+
+
+def job_state(job: Optional[SyncJob]) -> Dict[str, Any]:
+    """Состояние задания в формате прогресса `/stocks/sync_progress`."""
+    if job is None:
+        return {
+            "status": "idle", "processed": 0, "total": 0, "started_at": None,
+            "finished_at": None, "message": None, "active": False, "run_id": None, "job": None,
+        }
+    return {
+        "status": job.status,
+        "processed": job.processed or 0,
+        "total": job.total or 0,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "message": job.message,
+        "active": job.status in ACTIVE_STATUSES,
+        "run_id": job.run_id,
+        "stats": job.stats,
+        "job": {
+            "id": job.id,
+            "kind": job.kind,
+            "attempts": job.attempts,
+            "lease_owner": job.lease_owner,
+            "lease_expires_at": job.lease_expires_at.isoformat() if job.lease_expires_at else None,
+            "heartbeat_at": job.heartbeat_at.isoformat() if job.heartbeat_at else None,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+        },
+    }
+
+
+def warehouse_progress(db: Session, run_id: Optional[int]) -> List[Dict[str, Any]]:
+    """Прогресс прогона по складам из чекпоинтов (одним запросом)."""
+    rows = (
+        db.query(Warehouse, WarehouseSyncCursor)
+        .outerjoin(WarehouseSyncCursor, WarehouseSyncCursor.warehouse_id == Warehouse.id)
+        .filter(Warehouse.is_active == True)
+        .order_by(Warehouse.id)
+        .all()
+    )
+    result = []
+    for wh, cursor in rows:
+        in_run = cursor is not None and run_id is not None and cursor.run_id == run_id
+        result.append({
+            "warehouse_id": wh.id,
+            "remonline_id": wh.remonline_id,
+            "name": wh.name,
+            "finished": bool(in_run and cursor.run_finished),
+            "page": (cursor.run_page or 0) if in_run else 0,
+            "pages": (cursor.run_pages or 0) if in_run else 0,
+            "items": (cursor.run_items or 0) if in_run else 0,
+            "status": cursor.status if cursor is not None else None,
+            "error": cursor.error_message if cursor is not None else None,
+            "last_synced_at": cursor.last_synced_at.isoformat() if cursor is not None and cursor.last_synced_at else None,
+        })
+    return result
+
+
+def sync_progress(db: Session, with_warehouses: bool = True) -> Dict[str, Any]:
+    """Прогресс полной синхронизации: задание из очереди, прогон `SyncRun` и (по желанию) склады.
+
+    Пока задание выполняется, число завершённых складов берётся из чекпоинтов — они свежее
+    прогресса, который воркер пишет heartbeat'ом.
+    """
+    data = job_state(latest_job(db, "full"))
+    run_id = data["run_id"]
+    run = db.get(SyncRun, run_id) if run_id else db.query(SyncRun).order_by(SyncRun.id.desc()).first()
+    data["run"] = {
+        "id": run.id,
+        "status": run.status,
+        "warehouses_total": run.warehouses_total,
+        "started_at": run.started_at.isoformat() if run.started_at else None,
+        "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+        "message": run.message,
+    } if run else None
+    if data["status"] == "running" and run is not None:
+        finished = (
+            db.query(WarehouseSyncCursor)
+            .filter(WarehouseSyncCursor.run_id == run.id, WarehouseSyncCursor.run_finished == True)
+            .count()
+        )
+        data["processed"] = max(data["processed"], finished)
+        data["total"] = data["total"] or run.warehouses_total or 0
+    if with_warehouses:
+        data["warehouses"] = warehouse_progress(db, run.id if run else None)
+    return data
@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..models import Warehouse, WarehouseSyncCursor
+
+
+def next_sync_interval(cursor: WarehouseSyncCursor) -> timedelta:
+    """Интервал до следующей синхронизации склада по истории его изменений.
+
+    - Склад изменился в последнем прогоне («горячий») — базовый `UPDATE_INTERVAL_MINUTES`.
+    - Каждый прогон без изменений удваивает интервал до `SYNC_COLD_MAX_INTERVAL_MINUTES`.
+    - Пустой склад — `SYNC_EMPTY_INTERVAL_MINUTES`.
+    """
+    if not cursor.items:
+        return timedelta(minutes=settings.SYNC_EMPTY_INTERVAL_MINUTES)
+    base = settings.UPDATE_INTERVAL_MINUTES
+    minutes = base * (2 ** min(cursor.unchanged_runs or 0, 16))
+    return timedelta(minutes=min(minutes, max(base, settings.SYNC_COLD_MAX_INTERVAL_MINUTES)))
+
+
+def select_due_warehouses(db: Session, now: Optional[datetime] = None) -> List[Warehouse]:
+    """Активные склады, которым пора синхронизироваться: без курсора, с ошибкой или с наступившим next_sync_at.
+
+    Сначала склады, менявшиеся последними.
+    """
+    now = now or datetime.utcnow()
+    return (
+        db.query(Warehouse)
+        .outerjoin(WarehouseSyncCursor, WarehouseSyncCursor.warehouse_id == Warehouse.id)
+        .filter(Warehouse.is_active == True)
+        .filter(or_(
+            WarehouseSyncCursor.id.is_(None),
+            WarehouseSyncCursor.status != "success",
+            WarehouseSyncCursor.next_sync_at.is_(None),
+            WarehouseSyncCursor.next_sync_at <= now,
+        ))
+        .order_by(WarehouseSyncCursor.last_changed_at.desc(), Warehouse.id)
+        .all()
+    )
+
+
+def _get_or_create_cursor(db: Session, warehouse_id: int) -> WarehouseSyncCursor:
+    cursor = db.query(WarehouseSyncCursor).filter_by(warehouse_id=warehouse_id).first()
+    if not cursor:
+        cursor = WarehouseSyncCursor(warehouse_id=warehouse_id, unchanged_runs=0)
+        db.add(cursor)
+        # Сессии без autoflush: следующий запрос в той же транзакции должен увидеть курсор
+        db.flush()
+    return cursor
+
+
+def record_warehouse_sync(
+    db: Session,
+    warehouse_id: int,
+    pages: int,
+    items: int,
+    checksum: str,
+    now: Optional[datetime] = None,
+    run_id: Optional[int] = None,
+) -> WarehouseSyncCursor:
+    """Записать успешный прогон склада в курсор и запланировать следующий. Коммит за вызывающим."""
+    now = now or datetime.utcnow()
+    cursor = _get_or_create_cursor(db, warehouse_id)
+    if run_id is not None:
+        cursor.run_id = run_id
+        cursor.run_finished = True
+    if cursor.checksum == checksum and cursor.status == "success":
+        cursor.unchanged_runs = (cursor.unchanged_runs or 0) + 1
+    else:
+        cursor.unchanged_runs = 0
+        cursor.last_changed_at = now
+    cursor.checksum = checksum
+    cursor.pages = pages
+    cursor.items = items
+    cursor.status = "success"
+    cursor.error_message = None
+    cursor.last_synced_at = now
+    cursor.next_sync_at = now + next_sync_interval(cursor)
+    return cursor
+
+
+def record_warehouse_failure(db: Session, warehouse_id: int, error: str, now: Optional[datetime] = None) -> WarehouseSyncCursor:
+    """Отметить неудачный прогон: склад попадёт в следующий цикл, контрольная сумма не меняется."""
+    now = now or datetime.utcnow()
+    cursor = _get_or_create_cursor(db, warehouse_id)
+    cursor.status = "error"
+    cursor.error_message = error
+    cursor.next_sync_at = now
+    return cursor
+
+
+def record_page_checkpoint(
+    db: Session,
+    warehouse_id: int,
+    run_id: int,
+    page: int,
+    pages: int,
+    items: int,
+    checksum: Optional[str],
+) -> WarehouseSyncCursor:
+    """Сохранить чекпоинт склада в прогоне полной синхронизации вместе со страницей. Коммит за вызывающим."""
+    cursor = _get_or_create_cursor(db, warehouse_id)
+    cursor.run_id = run_id
+    cursor.run_page = page
+    cursor.run_pages = pages
+    cursor.run_items = items
+    cursor.run_checksum = checksum
+    cursor.run_finished = False
+    return cursor
+
+
+def load_run_checkpoints(db: Session, run_id: int) -> Dict[int, WarehouseSyncCursor]:
+    """Чекпоинты складов прогона: {warehouses.id: курсор}."""
+    return {
+        cursor.warehouse_id: cursor
+        for cursor in db.query(WarehouseSyncCursor).filter(WarehouseSyncCursor.run_id == run_id)
+    }
@@ -0,0 +1,205 @@
+import asyncio
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..models import SyncRun, Warehouse, run_db, run_sync_write
+from ..models.database import SessionLocal
+from .locks import SYNC_LEADER_LOCK, default_owner, service_lock
+from .remonline_service import RemonlineService
+from .sync_engine import StockSyncEngine
+from .sync_jobs import attach_run, claim_next_job, finish_job, heartbeat, release_job
+
+
+def _start_run(db: Session, run_id: Optional[int]) -> Tuple[SyncRun, List[Warehouse]]:
+    """Активные склады и прогон SyncRun (новый или продолжаемый)."""
+    warehouses: List[Warehouse] = db.query(Warehouse).filter_by(is_active=True).all()
+    run = db.get(SyncRun, run_id) if run_id is not None else None
+    if run is None:
+        run = SyncRun(status="running", warehouses_total=len(warehouses))
+        db.add(run)
+    run.status = "running"
+    run.warehouses_total = len(warehouses)
+    db.commit()
+    return run, warehouses
+
+
+def _finish_run(db: Session, run: SyncRun, status: str, message: Optional[str]) -> None:
+    run.status = status
+    run.finished_at = datetime.utcnow()
+    run.message = message
+    db.commit()
+
+
+class SyncWorker:
+    """Воркер синхронизации: забирает задания из `sync_jobs` под аренду и выполняет их.
+
+    Работает отдельным процессом (`python flow.py worker`) или встроенной задачей API-процесса
+    (SYNC_WORKER_EMBEDDED). Пока задание выполняется, heartbeat раз в SYNC_JOB_HEARTBEAT_SECONDS
+    продлевает аренду и пишет прогресс; потеряв аренду, воркер прекращает работу над заданием.
+    Полное задание ведётся как прогон `SyncRun`: воркер, забравший задание после сбоя,
+    продолжает его с чекпоинтов складов.
+
+    Задания берёт только лидер — воркер, держащий блокировку SYNC_LEADER_LOCK (advisory-блокировка
+    PostgreSQL или аренда в `service_locks`), поэтому лимит запросов Remonline в каждый момент
+    тратит один узел. Остальные воркеры ждут; если лидер умер, блокировку берёт один из них.
+    """
+
+    def __init__(
+        self,
+        owner: Optional[str] = None,
+        session_factory: Callable[..., Session] = SessionLocal,
+        service_factory: Callable[[], Any] = RemonlineService,
+        poll_seconds: Optional[float] = None,
+        lease_seconds: Optional[float] = None,
+        heartbeat_seconds: Optional[float] = None,
+        bind: Optional[Engine] = None,
+    ):
+        self.owner = owner or default_owner()
+        self.session_factory = session_factory
+        self.service_factory = service_factory
+        self.poll_seconds = poll_seconds or settings.SYNC_WORKER_POLL_SECONDS
+        self.lease_seconds = lease_seconds or settings.SYNC_JOB_LEASE_SECONDS
+        self.heartbeat_seconds = heartbeat_seconds or settings.SYNC_JOB_HEARTBEAT_SECONDS
+        self.leadership = service_lock(SYNC_LEADER_LOCK, owner=self.owner, ttl_seconds=self.lease_seconds, bind=bind)
+
+    async def _db(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Короткая операция с таблицей заданий в своей сессии, в пуле потоков БД."""
+        def call():
+            db = self.session_factory()
+            try:
+                return fn(db, *args)
+            finally:
+                db.close()
+        return await run_db(call)
+
+    async def run_forever(self) -> None:
+        """Стать лидером и забирать задания, пока задачу не отменят; при остановке отдать лидерство."""
+        logger.info(f"Sync worker {self.owner} started (poll every {self.poll_seconds}s)")
+        try:
+            while True:
+                job_id = None
+                try:
+                    if await run_db(self.leadership.acquire):
+                        job_id = await self.run_once()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.exception(f"Sync worker {self.owner} failed to process a job: {e}")
+                if job_id is None:
+                    await asyncio.sleep(self.poll_seconds)
+        finally:
+            await asyncio.shield(run_db(self.leadership.release))
+
+    async def run_once(self) -> Optional[int]:
+        """Забрать одно задание и выполнить его. Возвращает id задания или None, если очередь пуста."""
+        def claim(db: Session):
+            job = claim_next_job(db, self.owner, self.lease_seconds)
+            return (job.id, job.kind, job.run_id) if job is not None else None
+
+        claimed = await self._db(claim)
+        if claimed is None:
+            return None
+        job_id, kind, run_id = claimed
+        logger.info(f"Sync worker {self.owner} took job {job_id} ({kind})")
+        await self._run_job(job_id, kind, run_id)
+        return job_id
+
+    async def _run_job(self, job_id: int, kind: str, run_id: Optional[int]) -> None:
+        progress = {"processed": 0, "total": 0}
+        task = asyncio.create_task(self._execute(job_id, kind, run_id, progress))
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=self.heartbeat_seconds)
+                if done:
+                    break
+                alive = await self._db(
+                    heartbeat, job_id, self.owner, self.lease_seconds, progress["processed"], progress["total"]
+                )
+                if not alive:
+                    logger.warning(f"Sync worker {self.owner} lost the lease on job {job_id}; stopping it")
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    return
+                if self.leadership.held and not await run_db(self.leadership.renew):
+                    # Лидерство перешло к другому узлу: задание возвращается в очередь для него
+                    logger.warning(f"Sync worker {self.owner} lost leadership; releasing job {job_id}")
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    await self._db(release_job, job_id, self.owner)
+                    return
+        except asyncio.CancelledError:
+            # Остановка воркера: прогон остаётся running, задание возвращается в очередь
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await asyncio.shield(self._db(release_job, job_id, self.owner))
+            raise
+
+        try:
+            status, message, stats = task.result()
+        except Exception as e:
+            logger.exception(f"Sync job {job_id} failed: {e}")
+            status, message, stats = "failed", str(e), None
+        await self._db(finish_job, job_id, self.owner, status, message, stats, progress["processed"])
+        logger.info(f"Sync job {job_id} {status}" + (f": {message}" if message else ""))
+
+    async def _execute(
+        self, job_id: int, kind: str, run_id: Optional[int], progress: Dict[str, int]
+    ) -> Tuple[str, Optional[str], Optional[Dict[str, Any]]]:
+        if kind == "incremental":
+            return await self._execute_incremental()
+        return await self._execute_full(job_id, run_id, progress)
+
+    async def _execute_full(
+        self, job_id: int, run_id: Optional[int], progress: Dict[str, int]
+    ) -> Tuple[str, Optional[str], Optional[Dict[str, Any]]]:
+        """Полная синхронизация как прогон `SyncRun`; с `run_id` — продолжение с чекпоинтов складов.
+
+        Вся работа с БД идёт в потоке писателя синхронизации (`run_sync_write`), а не на event loop.
+        """
+        # Без expire_on_commit: прогон и склады читаются на event loop, пока поток писателя коммитит
+        db = self.session_factory(expire_on_commit=False)
+        run = None
+        try:
+            run, warehouses = await run_sync_write(_start_run, db, run_id)
+            if run.id != run_id:
+                await self._db(attach_run, job_id, self.owner, run.id)
+            progress["total"] = len(warehouses)
+
+            def on_progress(processed: int, total: int):
+                progress["processed"] = processed
+
+            # Конвейер: пул воркеров по складам, темп — общий token bucket, пакетные апсерты одним писателем.
+            # Чекпоинты складов коммитятся вместе со страницами — после сбоя прогон продолжается с них
+            async with self.service_factory() as service:
+                stats = await StockSyncEngine(service, db, on_progress=on_progress, run_id=run.id).run(warehouses)
+
+            message = f"Failed warehouses: {stats['warehouses_failed']}" if stats["warehouses_failed"] else None
+            status = "failed" if stats["warehouses_failed"] else "finished"
+            await run_sync_write(_finish_run, db, run, status, message)
+            return status, message or "Sync completed", stats
+        except asyncio.CancelledError:
+            # Остановка или потеря аренды: прогон остаётся running и продолжится со следующим воркером
+            raise
+        except Exception as e:
+            await run_sync_write(db.rollback)
+            if run is not None:
+                await run_sync_write(_finish_run, db, run, "failed", str(e))
+            raise
+        finally:
+            await run_sync_write(db.close)
+
+    async def _execute_incremental(self) -> Tuple[str, Optional[str], Optional[Dict[str, Any]]]:
+        """Склады из API и инкрементальная синхронизация складов, которым пора по курсорам."""
+        db = self.session_factory()
+        try:
+            async with self.service_factory() as service:
+                await service.sync_warehouses(db)
+                stats = await service.sync_products_and_stocks(db, incremental=True)
+            return "finished", "Sync completed", stats
+        finally:
+            await run_sync_write(db.close)
@@ -454,14 +454,16 @@ document.getElementById('reloadBtn').addEventListener('click', () => {
   loadPage();
 });
 
-// Автосинхронизация всех складов
+// Автосинхронизация всех складов: прогресс и дельты остатков приходят по SSE (/stocks/events),
+// поллинг — только запасной вариант для браузеров без EventSource
 let autoSyncPollTimer = null;
 let autoSyncStatusTimer = null;
+let syncEventSource = null;
 autoSyncBtn?.addEventListener('click', async () => {
   try {
     autoSyncBtn.disabled = true;
     await fetch(`${API_BASE}/stocks/sync_all`, { method: 'POST' });
-    startAutoSyncPolling();
+    if (!syncEventSource) startAutoSyncPolling();
   } catch (e) {
     console.error(e);
     alert('Не удалось запустить синхронизацию');
@@ -473,28 +475,34 @@ function formatStatusText(st) {
   const status = st?.status || 'idle';
   const total = Number(st?.total || 0);
   const processed = Number(st?.processed || 0);
+  if (status === 'queued') return 'Синхронизация: в очереди';
   if (status === 'running') return `Синхронизация: ${processed}/${total}`;
   if (status === 'finished') return 'Синхронизация завершена';
   if (status === 'failed') return 'Синхронизация упала';
   return 'Синхронизация: не запущена';
 }
 
+function renderSyncProgress(st) {
+  const processed = Number(st.processed || 0);
+  const total = Number(st.total || 0) || 1;
+  const pct = Math.max(0, Math.min(100, Math.round((processed / total) * 100)));
+  if (autoSyncProgress) {
+    autoSyncProgress.style.width = pct + '%';
+    autoSyncProgress.setAttribute('aria-valuenow', String(pct));
+  }
+  if (statusEl) statusEl.textContent = formatStatusText(st);
+  const running = st.status === 'running' || st.status === 'queued';
+  if (autoSyncBtn) autoSyncBtn.disabled = !!running;
+  return running;
+}
+
 async function pollSyncProgressOnce() {
   try {
     const resp = await fetch(`${API_BASE}/stocks/sync_progress`);
     if (!resp.ok) throw new Error('progress http');
     const json = await resp.json();
     const st = json?.data || {};
-    const processed = Number(st.processed || 0);
-    const total = Number(st.total || 0) || 1;
-    const pct = Math.max(0, Math.min(100, Math.round((processed / total) * 100)));
-    if (autoSyncProgress) {
-      autoSyncProgress.style.width = pct + '%';
-      autoSyncProgress.setAttribute('aria-valuenow', String(pct));
-    }
-    if (statusEl) statusEl.textContent = formatStatusText(st);
-    const running = st.status === 'running';
-    if (autoSyncBtn) autoSyncBtn.disabled = !!running;
+    const running = renderSyncProgress(st);
     // если синхронизация уже шла до перезагрузки, включим частый поллинг
     if (running && !autoSyncPollTimer) {
       startAutoSyncPolling();
@@ -513,6 +521,7 @@ function startAutoSyncPolling() {
     if (!st) return;
     if (st.status === 'finished' || st.status === 'failed') {
       clearInterval(autoSyncPollTimer);
+      autoSyncPollTimer = null;
       autoSyncBtn && (autoSyncBtn.disabled = false);
       state.page = 1; await loadPage();
     }
@@ -524,9 +533,59 @@ function startPermanentStatusPolling() {
   autoSyncStatusTimer = setInterval(pollSyncProgressOnce, 5000);
 }
 
-startPermanentStatusPolling();
+function applyStockDeltas(deltas) {
+  // deltas: [[remonline_id товара, remonline_id склада, количество], ...] — правим только изменившиеся ячейки
+  const products = new Map((state.allProducts || []).map(p => [String(p.remonline_id), p]));
+  const touched = new Set();
+  for (const [productRemId, whRemId, qty] of deltas || []) {
+    const product = products.get(String(productRemId));
+    if (!product || product.is_missing) continue;
+    product.stocks[whRemId] = Number(qty) || 0;
+    touched.add(product);
+    const cell = bodyEl.querySelector(`tr[data-remonline-id="${productRemId}"] td.warehouse-col[data-wh="${whRemId}"]`);
+    if (cell) cell.textContent = product.stocks[whRemId];
+  }
+  const warehousesToCount = state.filters.warehouses.length > 0
+    ? state.filters.warehouses
+    : TARGET_WAREHOUSES.map(w => w.remonline_id);
+  for (const product of touched) {
+    product.totalStock = warehousesToCount.reduce((sum, whId) => sum + (Number(product.stocks[whId]) || 0), 0);
+    const totalCell = bodyEl.querySelector(`tr[data-remonline-id="${product.remonline_id}"] td[data-total]`);
+    if (totalCell) totalCell.textContent = formatPrice(product.totalStock);
+  }
+}
+
+function startSyncEvents() {
+  if (!window.EventSource) return false;
+  syncEventSource = new EventSource(`${API_BASE}/stocks/events`);
+  let wasRunning = false;
+  syncEventSource.addEventListener('progress', async (e) => {
+    const st = JSON.parse(e.data || '{}');
+    const running = renderSyncProgress(st);
+    // Как и при поллинге: по завершении синхронизации перечитываем таблицу целиком
+    if (wasRunning && (st.status === 'finished' || st.status === 'failed')) {
+      wasRunning = false;
+      state.page = 1; await loadPage();
+    }
+    wasRunning = wasRunning || running;
+  });
+  syncEventSource.addEventListener('stocks', (e) => {
+    const payload = JSON.parse(e.data || '{}');
+    applyStockDeltas(payload.deltas);
+  });
+  syncEventSource.addEventListener('resync', async () => {
+    // Клиент отстал от потока — перечитываем текущую страницу целиком
+    await loadPage();
+  });
+  // Переподключение после обрыва EventSource выполняет сам (retry из потока)
+  return true;
+}
+
 // Первичная инициализация статуса сразу после загрузки страницы
-pollSyncProgressOnce();
+if (!startSyncEvents()) {
+  startPermanentStatusPolling();
+  pollSyncProgressOnce();
+}
 
 // Инициализация модального окна при открытии
 const columnsModalEl = document.getElementById('columnsModal');
@@ -632,6 +691,8 @@ function renderTable(productsWithStocks) {
   
   for (const p of productsWithStocks) {
     const tr = document.createElement('tr');
+    // RemID строки — по нему дельты остатков из SSE находят ячейки
+    if (p.remonline_id != null) tr.dataset.remonlineId = p.remonline_id;
     // Добавляем класс для отсутствующих товаров
     if (p.is_missing) {
       tr.classList.add('table-warning');
@@ -667,7 +728,7 @@ function renderTable(productsWithStocks) {
       <td class="price-col" data-price="97150" data-col="price-97150">${p.is_missing ? '-' : formatPrice(p.prices['97150'])}</td>
       <td class="price-col" data-price="377836" data-col="price-377836">${p.is_missing ? '-' : formatPrice(p.prices['377836'])}</td>
       <td class="price-col" data-price="555169" data-col="price-555169">${p.is_missing ? '-' : formatPrice(p.prices['555169'])}</td>
-      <td class="total-col" data-col="total">${p.is_missing ? '-' : formatPrice(p.totalStock)}</td>
+      <td class="total-col" data-col="total" data-total>${p.is_missing ? '-' : formatPrice(p.totalStock)}</td>
       ${warehousesToShow.map(w => `<td class="warehouse-col" data-wh="${w.remonline_id}" data-col="wh-${w.remonline_id}">${p.is_missing ? '-' : (p.stocks[w.remonline_id] ?? 0)}</td>`).join('')}
     `;
     fragment.appendChild(tr);
@@ -779,6 +840,10 @@ function formatDate(iso) {
 async function loadPage(useFilters = false) {
   // Обычная пагинация - skip рассчитывается по номеру страницы
   const skip = (state.page - 1) * state.size;
+  // Keyset-пагинация: курсор страницы известен, если к ней пришли со страницы раньше.
+  // Первая страница (смена фильтров/поиска/сортировки) сбрасывает курсоры
+  if (state.page === 1 || !state.pageCursors) state.pageCursors = {};
+  const pageCursor = state.pageCursors[state.page] || null;
   const name = encodeURIComponent(document.getElementById('searchInput').value.trim());
   
   // Если активна подвкладка, загружаем больше товаров чтобы найти все нужные
@@ -789,7 +854,11 @@ async function loadPage(useFilters = false) {
   if (useFilters || isSubtabActive) {
     // Используем новый endpoint с фильтрами (или принудительно для подвкладок)
     const params = new URLSearchParams();
-    params.append('skip', isSubtabActive ? 0 : skip);
+    if (pageCursor && !isSubtabActive) {
+      params.append('cursor', pageCursor);
+    } else {
+      params.append('skip', isSubtabActive ? 0 : skip);
+    }
     params.append('limit', isSubtabActive ? 10000 : loadLimit); // Увеличиваем лимит для подвкладок
     
     if (name) params.append('name', name);
@@ -852,13 +921,16 @@ async function loadPage(useFilters = false) {
       params.append('is_active', 'true');
     }
     
-    url = `${API_BASE}/products/filtered?${params.toString()}`;
+    url = `${API_BASE}/products/matrix?${params.toString()}`;
   } else {
-    // Используем старый endpoint без фильтров
+    // Без фильтров: та же матрица товаров с остатками, только базовые параметры.
+    // Порядок как у прежнего /products/: по релевантности при поиске по названию, иначе по id
     const nameQuery = name ? `&name=${name}` : '';
+    const sortQuery = name ? '&sort_by=relevance&sort_order=desc' : '&sort_by=id&sort_order=asc';
     const currentSkip = skip;
     const activeFilter = '&is_active=true';
-    url = `${API_BASE}/products/?skip=${currentSkip}&limit=${loadLimit}${nameQuery}${activeFilter}`;
+    const pageQuery = pageCursor ? `cursor=${encodeURIComponent(pageCursor)}` : `skip=${currentSkip}`;
+    url = `${API_BASE}/products/matrix?${pageQuery}&limit=${loadLimit}${nameQuery}${sortQuery}${activeFilter}`;
   }
   
   console.log('Загружаем товары с URL:', url);
@@ -870,6 +942,7 @@ async function loadPage(useFilters = false) {
   try {
     const productsResp = await fetchJson(url);
     let products = (productsResp?.data) || [];
+    state.pageCursors[state.page + 1] = productsResp?.next_cursor || null;
     
     console.log('Получено товаров с сервера:', products.length);
     console.log('ID товаров с сервера:', products.map(p => p.remonline_id));
@@ -1018,16 +1091,11 @@ async function loadPage(useFilters = false) {
       }
     }
 
-    // Ограничение конкурентности при загрузке остатков
-    const concurrency = 6;
-    const queue = products.map(p => async () => {
-      // Для отсутствующих товаров не загружаем остатки
-      if (p.is_missing) {
-        return { product: p, stocks: {} };
-      }
-      return { product: p, stocks: await loadStocksForProduct(p.id) };
-    });
-    const results = await runLimited(queue, concurrency);
+    // Остатки уже пришли в ответе /products/matrix — отдельные запросы по товарам не нужны
+    const results = products.map(p => ({
+      product: p,
+      stocks: p.is_missing ? {} : stocksMapFromMatrix(p.stocks),
+    }));
 
     const productsWithStocks = results.map(({ product, stocks }) => {
       // Определяем какие склады учитывать для общего остатка
@@ -1068,7 +1136,9 @@ async function loadPage(useFilters = false) {
     
     if (useFilters) {
       // При использовании фильтров, hasMore определяется по total из ответа
-      const total = productsResp?.total || 0;
+      // На страницах по курсору total не считается — используем значение с первой страницы
+      if (productsResp?.total != null) state.lastTotal = productsResp.total;
+      const total = state.lastTotal || 0;
       state.hasMore = (skip + products.length) < total;
       state.totalPages = Math.ceil(total / state.size);
     } else {
@@ -1423,45 +1493,31 @@ function attachProductMenus() {
 }
 
 async function refreshProductWithProgress(productId, buttonEl) {
-  // Получаем активные склады
-  const resp = await fetch(`${API_BASE}/warehouses/?active_only=true&limit=1000`);
-  if (!resp.ok) throw new Error('warehouses fetch failed');
-  const data = await resp.json();
-  const warehouses = (data?.data || []).filter(w => w?.remonline_id);
-  const total = warehouses.length || 1;
-  let done = 0;
+  // Один запрос: сервер сам опрашивает все склады параллельно и возвращает результат по каждому.
+  // Пока запрос идёт, прогресс плавно растёт к 90% — точное время зависит от числа складов и лимита API
   const start = Date.now();
-  let lastEtaTimeout = null;
-
-  // Обработка пачками по 3 запроса в секунду
-  const batchSize = 3;
-  for (let i = 0; i < warehouses.length; i += batchSize) {
-    const batch = warehouses.slice(i, i + batchSize);
-    const requests = batch.map(async (wh) => {
-      try {
-        await fetch(`${API_BASE}/products/${productId}/refresh?warehouse_id=${encodeURIComponent(wh.remonline_id)}`, { method: 'POST' });
-      } catch {}
-      // По факту завершения запроса — увеличиваем прогресс и ETA
-      done += 1;
-      const pct = Math.min(100, Math.round((done / total) * 100));
-      buttonEl.style.setProperty('--progress', pct + '%');
-
-      const elapsedMs = Date.now() - start;
-      const avgPerItem = elapsedMs / Math.max(1, done);
-      const remaining = Math.max(0, Math.round(avgPerItem * (total - done)));
-      const mm = String(Math.floor(remaining / 60000)).padStart(2, '0');
-      const ss = String(Math.floor((remaining % 60000) / 1000)).padStart(2, '0');
-      buttonEl.setAttribute('data-eta', `${mm}:${ss}`);
-    });
+  buttonEl.style.setProperty('--progress', '0%');
+  const timer = setInterval(() => {
+    const elapsed = (Date.now() - start) / 1000;
+    const pct = Math.round(90 * (1 - Math.exp(-elapsed / 5)));
+    buttonEl.style.setProperty('--progress', pct + '%');
+  }, 250);
 
-    await Promise.all(requests);
-    // Пауза 1 секунда между пачками, если ещё остались склады
-    if (i + batchSize < warehouses.length) {
-      await new Promise(r => setTimeout(r, 1000));
+  try {
+    const resp = await fetch(`${API_BASE}/products/${productId}/refresh`, { method: 'POST' });
+    if (!resp.ok) throw new Error(`refresh failed: ${resp.status}`);
+    const data = await resp.json();
+    const result = data?.data || {};
+    const failed = (result.warehouses || []).filter(w => w.status === 'error');
+    if (failed.length) {
+      console.warn(`⚠️ Не удалось опросить склады: ${failed.map(w => w.name || w.warehouse_id).join(', ')}`);
     }
+    buttonEl.style.setProperty('--progress', '100%');
+    return result;
+  } finally {
+    clearInterval(timer);
+    buttonEl.removeAttribute('data-eta');
   }
-  // По завершении ETA убираем
-  buttonEl.removeAttribute('data-eta');
 }
 
 async function refreshMissingProduct(remonlineId, buttonEl) {
@@ -1571,16 +1627,11 @@ async function refreshMissingProduct(remonlineId, buttonEl) {
   }
 }
 
-async function loadStocksForProduct(productId) {
-  const url = `${API_BASE}/stocks/product/${productId}?include_details=true`;
-  const resp = await fetchJson(url);
-  const items = resp?.data || [];
+function stocksMapFromMatrix(stocks) {
+  // stocks: {warehouse_remonline_id: available_quantity} из /products/matrix
   const map = {};
-  for (const it of items) {
-    const whRemId = it?.warehouse?.remonline_id;
-    if (!whRemId) continue;
-    // Загружаем все остатки, не фильтруя по TARGET_WAREHOUSES
-    map[whRemId] = (map[whRemId] || 0) + (it.available_quantity ?? 0);
+  for (const [whRemId, qty] of Object.entries(stocks || {})) {
+    map[whRemId] = Number(qty) || 0;
   }
   // Убеждаемся что у всех целевых складов есть значения (даже если 0)
   for (const w of TARGET_WAREHOUSES) {
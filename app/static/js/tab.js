@@ -1,3 +1,6 @@
+// Размер страницы доступных товаров в окне управления товарами листа
+const PICKER_PAGE_SIZE = 100;
+
 /**
  * Класс для управления подвкладкой
  */
@@ -245,6 +248,20 @@ class Subtab {
         return modal;
     }
 
+    /**
+     * Загружает страницу кандидатов для подвкладки с сервера (поиск и признак «на листе» считает сервер)
+     */
+    async fetchPickerPage({ query = '', inSubtab = null, skip = 0, limit = PICKER_PAGE_SIZE } = {}) {
+        const params = new URLSearchParams({ skip, limit });
+        if (query) params.set('q', query);
+        if (inSubtab !== null) params.set('in_subtab', inSubtab);
+        const response = await fetch(`/api/v1/tabs/subtabs/${this.id}/picker?${params}`);
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        return response.json();
+    }
+
     /**
      * Загружает товары для модального окна
      */
@@ -255,27 +272,23 @@ class Subtab {
         const addButton = modal.querySelector('#addSelectedProducts');
         
         try {
-            // Загружаем все товары (увеличен лимит для корректной работы с подвкладками)
-            const response = await fetch('/api/v1/products/?limit=50000');
-            const data = await response.json();
-            const allProducts = data.data || [];
-            
-            // Сохраняем ссылку на исходные данные для отображения оригиналов
-            this.originalProductsData = allProducts;
-            
             // Загружаем товары подвкладки с полными данными (включая custom поля)
             const subtabProductsResponse = await fetch(`/api/v1/tabs/subtabs/${this.id}/products`);
             const subtabProductsData = await subtabProductsResponse.json();
             
-            // Получаем ID товаров уже добавленных в подвкладку
-            const subtabProductIds = subtabProductsData.map(sp => sp.product_remonline_id);
+            // Данные каталога только для товаров листа — одним запросом вместо загрузки всего каталога
+            const inSubtabPage = await this.fetchPickerPage({ inSubtab: true, limit: 1000 });
+            const productsByRemonlineId = new Map(inSubtabPage.data.map(p => [p.remonline_id, p]));
             
-            // Обогащаем данные товаров в подвкладке информацией из общего списка
+            // Сохраняем ссылку на исходные данные для отображения оригиналов
+            this.originalProductsData = inSubtabPage.data;
+            
+            // Обогащаем данные товаров в подвкладке информацией из каталога
             const currentProducts = subtabProductsData.map(subtabProduct => {
-                const fullProduct = allProducts.find(p => p.remonline_id === subtabProduct.product_remonline_id);
+                const fullProduct = productsByRemonlineId.get(subtabProduct.product_remonline_id);
                 
                 if (fullProduct) {
-                    // Товар найден в общем списке
+                    // Товар найден в каталоге
                     return {
                         ...fullProduct,
                         id: subtabProduct.id, // ID записи SubTabProduct для редактирования
@@ -285,7 +298,7 @@ class Subtab {
                         order_index: subtabProduct.order_index // Сохраняем порядок
                     };
                 } else {
-                    // Товар не найден в общем списке - создаем заглушку
+                    // Товар не найден в каталоге - создаем заглушку
                     return {
                         id: subtabProduct.id,
                         remonline_id: subtabProduct.product_remonline_id,
@@ -307,26 +320,50 @@ class Subtab {
             // Обновляем данные подвкладки с правильным порядком
             this.products = subtabProductsData;
             
-            // Разделяем на доступные товары
-            const availableProducts = allProducts.filter(p => !subtabProductIds.includes(p.remonline_id));
-            
-            // Отрисовываем списки товаров
-            this.renderProductsList(availableContainer, availableProducts, 'available');
             this.renderProductsList(subtabContainer, currentProducts, 'current');
             
+            // Доступные товары (ещё не на листе) — постранично с сервера с учётом поиска
+            const picker = { query: searchInput.value.trim(), items: [], total: 0 };
+            const loadAvailable = async (append = false) => {
+                const page = await this.fetchPickerPage({
+                    query: picker.query,
+                    inSubtab: false,
+                    skip: append ? picker.items.length : 0,
+                });
+                picker.items = append ? picker.items.concat(page.data) : page.data;
+                picker.total = page.total || 0;
+                this.renderProductsList(availableContainer, picker.items, 'available');
+                if (picker.items.length < picker.total) {
+                    const moreButton = document.createElement('button');
+                    moreButton.type = 'button';
+                    moreButton.className = 'btn btn-sm btn-outline-secondary w-100';
+                    moreButton.textContent = `Показать ещё (${picker.items.length} из ${picker.total})`;
+                    moreButton.addEventListener('click', () => {
+                        moreButton.disabled = true;
+                        loadAvailable(true);
+                    });
+                    availableContainer.appendChild(moreButton);
+                }
+            };
+            modal.loadAvailableProducts = loadAvailable;
+            modal.pickerState = picker;
+            await loadAvailable();
+            
+            // Обработчики вешаем один раз: окно перезагружает списки после каждого добавления
+            if (modal.dataset.pickerBound) {
+                return;
+            }
+            modal.dataset.pickerBound = 'true';
+            
             // Настраиваем поиск
             let searchTimeout;
             searchInput.addEventListener('input', (e) => {
                 clearTimeout(searchTimeout);
                 searchTimeout = setTimeout(() => {
-                    const query = e.target.value.toLowerCase();
-                    const filtered = allProducts.filter(p => 
-                        !subtabProductIds.includes(p.remonline_id) &&
-                        (p.name.toLowerCase().includes(query) || 
-                         (p.custom_name && p.custom_name.toLowerCase().includes(query)) ||
-                         (p.remonline_id && p.remonline_id.toString().includes(query)))
-                    );
-                    this.renderProductsList(availableContainer, filtered, 'available');
+                    modal.pickerState.query = e.target.value.trim();
+                    modal.loadAvailableProducts().catch(error => {
+                        console.error('Ошибка поиска товаров:', error);
+                    });
                 }, 300);
             });
             
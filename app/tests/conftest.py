@@ -13,7 +13,8 @@ sys.path.insert(0, str(project_root))
 
 from app.models import Base, get_db
 from main import app
-from app.services import BackgroundService
+from app.core.config import settings
+from app.services import BackgroundService, catalog_index, ensure_search_index, products_cache
 
 # Тестовая база данных
 TEST_DATABASE_URL = "sqlite:///./test.db"
@@ -47,10 +48,35 @@ def db():
     Base.metadata.drop_all(bind=engine)
 
 @pytest.fixture(scope="function")
-def client():
-    """Фикстура для тестового клиента"""
-    with TestClient(app) as test_client:
-        yield test_client
+def client(db, monkeypatch):
+    """Фикстура для тестового клиента
+
+    Приложение работает с тестовой базой: get_db и SessionLocal маршрутов смотрят на
+    TestingSessionLocal, данные для запросов сидируются через фикстуру db. Встроенный воркер
+    не запускается — задания остаются в очереди (воркер проверяется в test_sync_jobs).
+    """
+    def override_get_db():
+        session = TestingSessionLocal()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    for module in ("app.models.database", "app.api.routes.products", "app.api.routes.stocks"):
+        monkeypatch.setattr(f"{module}.SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(settings, "SYNC_WORKER_EMBEDDED", False)
+    ensure_search_index(engine)
+
+    # Поколения тестовой базы начинаются заново — кэши процесса не должны отдавать чужие данные
+    products_cache.clear()
+    catalog_index.rebuild(db)
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        with TestClient(app) as test_client:
+            yield test_client
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+        products_cache.clear()
 
 @pytest.fixture(scope="function")
 def background_service():
@@ -0,0 +1,14 @@
+"""Общие построители данных для тестов."""
+
+
+def make_good(good_id, title, residue, price=10):
+    """Товар в формате ответа Remonline /warehouse/goods."""
+    return {
+        "id": good_id,
+        "title": title,
+        "article": f"ART-{good_id}",
+        "residue": residue,
+        "price": {"1": price},
+        "category": {"title": "Phones"},
+        "barcodes": [{"code": f"BC{good_id}"}],
+    }
@@ -2,6 +2,8 @@ import pytest
 from fastapi.testclient import TestClient
 from loguru import logger
 
+from app.tests.helpers import make_good
+
 def test_root_endpoint(client: TestClient):
     """Тест корневого endpoint"""
     response = client.get("/")
@@ -33,6 +35,32 @@ def test_get_products_empty_db(client: TestClient):
     assert data["success"] == True
     assert isinstance(data["data"], list)
 
+def test_get_products_matrix_returns_stocks_by_warehouse(client: TestClient, db):
+    """Тест матрицы товаров: остатки каждого товара по RemID складов и общий total"""
+    from app.models import Warehouse
+    from app.services.bulk_upsert import upsert_goods
+
+    wh1 = Warehouse(remonline_id=951, name="A")
+    wh2 = Warehouse(remonline_id=952, name="B")
+    db.add_all([wh1, wh2])
+    db.commit()
+    upsert_goods(db, [
+        (wh1.id, [make_good(1, "Matrix A", 3), make_good(2, "Matrix B", 5)]),
+        (wh2.id, [make_good(1, "Matrix A", 7)]),
+    ])
+    db.commit()
+
+    response = client.get("/api/v1/products/matrix?sort_by=name&sort_order=asc&limit=10")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["success"] == True
+    assert data["total"] == 2
+    assert [(item["remonline_id"], item["stocks"]) for item in data["data"]] == [
+        (1, {"951": 3.0, "952": 7.0}),
+        (2, {"951": 5.0}),
+    ]
+
+
 def test_get_stocks_empty_db(client: TestClient):
     """Тест получения остатков из пустой базы данных"""
     response = client.get("/api/v1/stocks/")
@@ -55,3 +83,208 @@ def test_stock_not_found(client: TestClient):
     """Тест получения несуществующего остатка"""
     response = client.get("/api/v1/stocks/99999")
     assert response.status_code == 404
+
+
+def test_sync_progress_has_per_warehouse_detail(client):
+    """Тест: прогресс синхронизации содержит детализацию по складам"""
+    response = client.get("/api/v1/stocks/sync_progress")
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert "status" in data
+    assert isinstance(data["warehouses"], list)
+
+
+def test_sync_all_only_enqueues_job(client: TestClient, db):
+    """Тест: /stocks/sync_all ставит задание в очередь, повторный вызов его не дублирует"""
+    from app.models import SyncJob
+
+    # Встроенный воркер в тестах не запущен — задание остаётся в очереди
+    first = client.post("/api/v1/stocks/sync_all").json()
+    second = client.post("/api/v1/stocks/sync_all").json()
+    progress = client.get("/api/v1/stocks/sync_progress").json()["data"]
+
+    job_id = first["data"]["job"]["id"]
+    assert first["data"]["status"] == "queued"
+    assert second["message"] == "Already queued"
+    assert second["data"]["job"]["id"] == job_id
+    assert progress["status"] == "queued" and progress["job"]["id"] == job_id
+    assert db.query(SyncJob).count() == 1
+
+
+def test_products_filtered_cache_hits_and_invalidation(client: TestClient, db):
+    """Тест: повтор тех же фильтров отдаётся из кэша, коммит по товарам сбрасывает кэш"""
+    from prometheus_client import REGISTRY
+    from app.models import Product
+    from app.services import products_cache
+    from app.tests.conftest import engine
+
+    def hits():
+        return REGISTRY.get_sample_value("response_cache_hits_total", {"cache": "products_filtered"}) or 0
+
+    products_cache.clear()
+    first = client.get("/api/v1/products/filtered?remonline_ids=2,1&sort_order=ASC&limit=5")
+    before = hits()
+    second = client.get("/api/v1/products/filtered?remonline_ids=1, 2&sort_order=asc&limit=5")
+    assert second.status_code == 200
+    assert second.json() == first.json()
+    assert hits() == before + 1
+
+    product = Product(remonline_id=987654321, name="Cache probe")
+    db.add(product)
+    db.commit()
+    db.delete(product)
+    db.commit()
+
+    client.get("/api/v1/products/filtered?remonline_ids=1,2&sort_order=asc&limit=5")
+    assert hits() == before + 1
+
+    # Коммит другого процесса (отдельный воркер) виден только через счётчик в БД
+    from sqlalchemy import update
+    from app.models import ChangeCounter
+    with engine.begin() as conn:
+        conn.execute(
+            update(ChangeCounter.__table__)
+            .where(ChangeCounter.name == "catalog")
+            .values(value=ChangeCounter.value + 1)
+        )
+    client.get("/api/v1/products/filtered?remonline_ids=1,2&sort_order=asc&limit=5")
+    assert hits() == before + 1
+
+    metrics = client.get("/metrics")
+    assert "response_cache_misses_total" in metrics.text
+
+
+def test_products_filtered_total_stock_uses_aggregate(client: TestClient):
+    """Тест: фильтр и сортировка по общему остатку читают product_stock_totals"""
+    response = client.get("/api/v1/products/filtered?sort_by=total_stock&sort_order=desc&stock_min=1&limit=5")
+    assert response.status_code == 200
+    assert response.json()["success"] == True
+
+
+def test_export_products_streams_csv_and_ndjson(client: TestClient):
+    """Тест: потоковая выгрузка отдаёт заголовок CSV и валидный NDJSON"""
+    response = client.get("/api/v1/products/export?format=csv&name=__no_such_product__")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.text.splitlines()[0].startswith("id,remonline_id,name,sku,category,price,is_active,total_stock")
+
+    response = client.get("/api/v1/products/export?format=ndjson&limit=1")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    assert client.get("/api/v1/products/export?format=xml").status_code == 400
+
+
+def test_export_pivots_warehouse_columns(db):
+    """Тест: выгрузка разворачивает остатки по складам в колонки wh_{remonline_id}"""
+    import json
+    from app.api.routes import products as products_routes
+    from app.models import Warehouse, Product
+    from app.services.bulk_upsert import upsert_goods
+
+    wh1 = Warehouse(remonline_id=901, name="A")
+    wh2 = Warehouse(remonline_id=902, name="B")
+    db.add_all([wh1, wh2])
+    db.commit()
+    upsert_goods(db, [(wh1.id, [make_good(i, f"G{i}", i) for i in range(1, 6)]), (wh2.id, [make_good(1, "G1", 10)])])
+    db.commit()
+
+    original_batch = products_routes.EXPORT_BATCH_SIZE
+    products_routes.EXPORT_BATCH_SIZE = 2
+    try:
+        body = "".join(products_routes._stream_export(db, db.query(Product), [wh1, wh2], "ndjson"))
+    finally:
+        products_routes.EXPORT_BATCH_SIZE = original_batch
+
+    rows = [json.loads(line) for line in body.splitlines()]
+    assert len(rows) == 5
+    first = next(r for r in rows if r["remonline_id"] == 1)
+    assert first["wh_901"] == 1 and first["wh_902"] == 10 and first["total_stock"] == 11
+    assert next(r for r in rows if r["remonline_id"] == 5)["wh_902"] == 0
+
+
+def test_products_search_ranked_by_relevance(client: TestClient):
+    """Тест: поиск по name идёт через поисковый индекс, /filtered поддерживает sort_by=relevance"""
+    response = client.get("/api/v1/products/?name=__no_such_product__")
+    assert response.status_code == 200
+    assert response.json()["data"] == []
+
+    response = client.get("/api/v1/products/filtered?name=__no_such_product__&sort_by=relevance&limit=5")
+    assert response.status_code == 200
+    assert response.json()["total"] == 0
+
+
+def test_products_autocomplete(client: TestClient):
+    """Тест: автодополнение отвечает из индекса каталога и требует непустой запрос"""
+    response = client.get("/api/v1/products/autocomplete?q=__no_such_product__")
+    assert response.status_code == 200
+    assert response.json()["data"] == []
+    assert client.get("/api/v1/products/autocomplete?q=").status_code == 422
+
+
+def test_subtab_picker_flags_products_on_sheet(client: TestClient, db):
+    """Тест: picker отдаёт страницу кандидатов с признаком «уже на листе»"""
+    from app.models import Product
+
+    db.add_all([Product(remonline_id=880001 + i, name=f"Picker probe {i}") for i in range(3)])
+    db.commit()
+
+    tab = client.post("/api/v1/tabs/", json={"name": "Picker tab"}).json()
+    subtab = client.post(f"/api/v1/tabs/{tab['id']}/subtabs", json={"name": "Picker sheet", "tab_id": tab["id"]}).json()
+    client.post(f"/api/v1/tabs/subtabs/{subtab['id']}/products", json={"product_remonline_ids": [880002]})
+
+    page = client.get(f"/api/v1/tabs/subtabs/{subtab['id']}/picker?q=Picker probe&limit=10").json()
+    flags = {p["remonline_id"]: p["in_subtab"] for p in page["data"]}
+    assert flags == {880001: False, 880002: True, 880003: False}
+
+    available = client.get(f"/api/v1/tabs/subtabs/{subtab['id']}/picker?q=Picker probe&in_subtab=false&limit=1").json()
+    assert available["total"] == 2 and available["count"] == 1
+
+    on_sheet = client.get(f"/api/v1/tabs/subtabs/{subtab['id']}/picker?in_subtab=true").json()
+    assert [p["remonline_id"] for p in on_sheet["data"]] == [880002]
+    assert on_sheet["data"][0]["subtab_product_id"] is not None
+
+    assert client.get("/api/v1/tabs/subtabs/999999/picker").status_code == 404
+
+
+def test_bulk_refresh_requires_products(client: TestClient):
+    """Тест: массовое обновление без товаров и по несуществующей подвкладке"""
+    response = client.post("/api/v1/products/refresh", json={})
+    assert response.status_code == 400
+    response = client.post("/api/v1/products/refresh", json={"subtab_id": 999999})
+    assert response.status_code == 404
+
+
+def test_conditional_get_returns_304_until_data_changes(client: TestClient):
+    """Тест: ETag по поколению данных — повтор с If-None-Match получает 304, правка вкладок меняет ETag"""
+    urls = (
+        "/api/v1/warehouses/", "/api/v1/tabs/list",
+        "/api/v1/products/filtered?limit=5", "/api/v1/products/matrix?limit=5",
+    )
+    for url in urls:
+        response = client.get(url)
+        assert response.status_code == 200
+        etag = response.headers["etag"]
+        assert etag.startswith('W/"')
+        assert "must-revalidate" in response.headers["cache-control"]
+        # Ответ из in-process кэша несёт тот же ETag
+        assert client.get(url).headers["etag"] == etag
+
+        cached = client.get(url, headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.content == b""
+        assert cached.headers["etag"] == etag
+
+    etag = client.get("/api/v1/tabs/").headers["etag"]
+    tab = client.post("/api/v1/tabs/", json={"name": "ETag probe"}).json()
+    changed = client.get("/api/v1/tabs/", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert any(t["id"] == tab["id"] for t in changed.json())
+
+    client.delete(f"/api/v1/tabs/{tab['id']}")
+    # Удаление — тоже изменение
+    assert client.get("/api/v1/tabs/", headers={"If-None-Match": changed.headers["etag"]}).status_code == 200
+
+    # Отсутствующий товар — 404 даже с совпадающим If-None-Match
+    assert client.get("/api/v1/stocks/product/999999999", headers={"If-None-Match": "*"}).status_code == 404
@@ -0,0 +1,153 @@
+from sqlalchemy import event
+
+from app.models import Warehouse, Product, Stock
+from app.services.bulk_upsert import upsert_goods
+from app.tests.helpers import make_good
+
+
+def test_upsert_goods_inserts_and_updates_with_few_statements(db):
+    """Тест: страница из 50 товаров — несколько set-based запросов вместо ~100 SELECT
+
+    SELECT отпечатков, INSERT товаров, INSERT остатков, пересчёт агрегатов, отметка расположения
+    (плюс UPDATE счётчика поколений ленты изменений — один на транзакцию).
+    """
+    wh = Warehouse(remonline_id=501, name="Main")
+    db.add(wh)
+    db.commit()
+    warehouse_id = wh.id
+
+    statements = []
+    bind = db.get_bind()
+
+    def count_statements(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(bind, "before_cursor_execute", count_statements)
+    try:
+        page = [make_good(i, f"Good {i}", residue=i) for i in range(1, 51)]
+        result = upsert_goods(db, [(warehouse_id, page)])
+        db.commit()
+    finally:
+        event.remove(bind, "before_cursor_execute", count_statements)
+
+    assert result["products"] == 50
+    assert result["stocks"] == 50
+    assert len([s for s in statements if "change_counters" not in s]) <= 5
+    assert db.query(Product).count() == 50
+    product = db.query(Product).filter_by(remonline_id=7).one()
+    assert product.category == "Phones"
+    assert product.barcode == "BC7"
+    assert product.price == 10
+
+    # Повторный апсерт обновляет существующие строки и не создаёт дублей
+    updated_page = [make_good(7, "Renamed", residue=99, price=20), make_good(51, "New", residue=1)]
+    result = upsert_goods(db, [(wh.id, updated_page)])
+    db.commit()
+    db.expire_all()
+
+    assert result["product_ids"][7] == product.id
+    assert db.query(Product).count() == 51
+    assert db.query(Stock).count() == 51
+    product = db.query(Product).filter_by(remonline_id=7).one()
+    assert product.name == "Renamed"
+    assert product.price == 20
+    stock = db.query(Stock).filter_by(warehouse_id=wh.id, product_id=product.id).one()
+    assert stock.available_quantity == 99
+
+
+def test_upsert_goods_deduplicates_product_across_warehouses(db):
+    """Тест: один товар на нескольких складах в одной пачке"""
+    wh1 = Warehouse(remonline_id=601, name="A")
+    wh2 = Warehouse(remonline_id=602, name="B")
+    db.add_all([wh1, wh2])
+    db.commit()
+
+    upsert_goods(db, [(wh1.id, [make_good(1, "Same", 2)]), (wh2.id, [make_good(1, "Same", 5)])])
+    db.commit()
+
+    assert db.query(Product).count() == 1
+    assert sorted(s.available_quantity for s in db.query(Stock).all()) == [2, 5]
+
+
+def test_upsert_goods_skips_unchanged_rows(db):
+    """Тест: повторная страница без изменений не перезаписывает товары и остатки"""
+    wh = Warehouse(remonline_id=701, name="Main")
+    db.add(wh)
+    db.commit()
+
+    page = [make_good(i, f"Good {i}", residue=i) for i in range(1, 11)]
+    result = upsert_goods(db, [(wh.id, page)])
+    db.commit()
+    assert result["products_changed"] == 10
+    assert result["stocks_changed"] == 10
+    first_hash = db.query(Product).filter_by(remonline_id=3).one().content_hash
+    assert first_hash
+
+    # Та же страница, изменился только товар 3 (цена) и остаток товара 4
+    page[2] = make_good(3, "Good 3", residue=3, price=99)
+    page[3] = make_good(4, "Good 4", residue=40)
+    result = upsert_goods(db, [(wh.id, page)])
+    db.commit()
+    db.expire_all()
+
+    assert result["products"] == 10
+    assert result["products_changed"] == 1
+    assert result["products_unchanged"] == 9
+    assert result["stocks_changed"] == 1
+    product = db.query(Product).filter_by(remonline_id=3).one()
+    assert product.price == 99
+    assert product.content_hash != first_hash
+    assert db.query(Stock).filter_by(product_id=result["product_ids"][4]).one().available_quantity == 40
+
+
+def test_upsert_goods_sparse_payload_keeps_stored_values(db):
+    """Тест: неполный ответ API (пустое название, нет цены и описания) не затирает сохранённые поля"""
+    wh = Warehouse(remonline_id=701, name="Main")
+    db.add(wh)
+    db.commit()
+
+    full = {**make_good(5, "Full name", residue=3, price=42), "description": "Desc", "image": ["a.jpg"]}
+    upsert_goods(db, [(wh.id, [full])])
+    db.commit()
+
+    result = upsert_goods(db, [(wh.id, [{"id": 5, "title": "", "residue": 1}])])
+    db.commit()
+    db.expire_all()
+
+    assert result["products_changed"] == 1
+    product = db.query(Product).filter_by(remonline_id=5).one()
+    assert product.name == "Full name"
+    assert product.sku == "ART-5"
+    assert product.description == "Desc"
+    assert product.images_json == ["a.jpg"]
+    assert product.price == 42
+    assert product.barcode == "BC5"
+    assert db.query(Stock).filter_by(product_id=product.id).one().available_quantity == 1
+
+
+def test_upsert_goods_maintains_stock_totals(db):
+    """Тест: агрегат остатков по товару пересчитывается только для изменённых товаров"""
+    from app.models import ProductStockTotal
+
+    wh1 = Warehouse(remonline_id=801, name="A")
+    wh2 = Warehouse(remonline_id=802, name="B")
+    db.add_all([wh1, wh2])
+    db.commit()
+
+    upsert_goods(db, [(wh1.id, [make_good(1, "One", 2), make_good(2, "Two", 0)]), (wh2.id, [make_good(1, "One", 5)])])
+    db.commit()
+
+    totals = {t.product_id: t for t in db.query(ProductStockTotal).all()}
+    ids = {p.remonline_id: p.id for p in db.query(Product).all()}
+    assert totals[ids[1]].total_available == 7
+    assert totals[ids[1]].warehouses_in_stock == 2
+    assert totals[ids[2]].total_available == 0
+    assert totals[ids[2]].warehouses_in_stock == 0
+
+    result = upsert_goods(db, [(wh2.id, [make_good(1, "One", 1)])])
+    db.commit()
+    db.expire_all()
+
+    assert result["stocks_changed"] == 1
+    assert db.get(ProductStockTotal, ids[1]).total_available == 3
+
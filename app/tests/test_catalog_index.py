@@ -0,0 +1,110 @@
+from types import SimpleNamespace
+
+import pytest
+
+from sqlalchemy import update
+
+from app.models import Product, Warehouse
+from app.services.bulk_upsert import upsert_goods
+from app.services.catalog_index import SORT_CANDIDATES_LIMIT, CatalogIndex, catalog_index, normalize
+from app.services.change_feed import CATALOG_COUNTER, _next_generation
+from app.tests.conftest import engine
+from app.tests.helpers import make_good
+
+
+@pytest.fixture
+def shared_index(db):
+    """Глобальный индекс каталога, построенный по тестовой БД; после теста сбрасывается"""
+    catalog_index.rebuild(db)
+    yield catalog_index
+    catalog_index._built = False
+
+
+def _row(product_id, name, sku=None, code=None, barcode=None, is_active=True):
+    return SimpleNamespace(
+        id=product_id, remonline_id=100000 + product_id, name=name, sku=sku, code=code,
+        barcode=barcode, barcodes_json=None, is_active=is_active,
+    )
+
+
+def test_normalize_folds_case_yo_and_script():
+    """Тест: регистр, ё→е и транслитерация приводят написания к одному виду"""
+    assert normalize("Ёлка") == normalize("елка") == "elka"
+    assert normalize("САМСУНГ") == normalize("samsung")
+
+
+def test_prefix_search_and_ranking():
+    """Тест: все токены запроса — префиксы, точные совпадения выше, артикул ищется целиком"""
+    index = CatalogIndex()
+    index.load([
+        _row(1, "Дисплей iPhone 12 Pro Max", sku="DSP-12PM"),
+        _row(2, "Дисплей iPhone 12", sku="DSP-12"),
+        _row(3, "Аккумулятор Samsung Galaxy", barcode="4601234567890"),
+        _row(4, "Чехол Самсунг", is_active=False),
+    ])
+
+    assert [p["id"] for p in index.search("дисп ipho 12")] == [2, 1]
+    assert [p["id"] for p in index.search("samsung")] == [4, 3]
+    assert [p["id"] for p in index.search("самсунг", active_only=True)] == [3]
+    assert [p["id"] for p in index.search("dsp12pm")] == [1]
+    assert [p["id"] for p in index.search("460123")] == [3]
+    assert index.search("nokia") == []
+
+
+def test_index_refreshes_only_committed_changes(db, shared_index):
+    """Тест: после коммита синхронизации индекс перечитывает только изменённые товары"""
+    wh = Warehouse(remonline_id=801, name="Main")
+    db.add(wh)
+    db.commit()
+    upsert_goods(db, [(wh.id, [make_good(1, "Шлейф Xiaomi", 1), make_good(2, "Стекло Redmi", 1)])])
+    db.rollback()
+    assert shared_index.refresh(db) == 0
+
+    upsert_goods(db, [(wh.id, [make_good(1, "Шлейф Xiaomi", 1), make_good(2, "Стекло Redmi", 1)])])
+    db.commit()
+    assert shared_index.refresh(db) == 2
+    assert [p["remonline_id"] for p in shared_index.search("шлейф")] == [1]
+
+    upsert_goods(db, [(wh.id, [make_good(1, "Шлейф Poco", 1), make_good(2, "Стекло Redmi", 1)])])
+    db.commit()
+    assert shared_index.refresh(db) == 1
+    assert shared_index.search("xiaomi") == []
+    assert [p["remonline_id"] for p in shared_index.search("poco")] == [1]
+
+
+def test_index_sees_commits_of_another_process(db, shared_index):
+    """Тест: запись без событий сессии этого процесса (как у отдельного воркера) попадает в индекс по change_gen"""
+    wh = Warehouse(remonline_id=802, name="Main")
+    db.add(wh)
+    db.commit()
+    upsert_goods(db, [(wh.id, [make_good(1, "Шлейф Xiaomi", 1)])])
+    db.commit()
+    shared_index.refresh(db)
+
+    with engine.begin() as conn:
+        conn.execute(
+            update(Product.__table__)
+            .where(Product.remonline_id == 1)
+            .values(name="Шлейф Honor", change_gen=_next_generation(conn, CATALOG_COUNTER))
+        )
+    assert shared_index.refresh(db) == 1
+    assert shared_index.search("xiaomi") == []
+    assert [p["remonline_id"] for p in shared_index.search("honor")] == [1]
+    assert shared_index.refresh(db) == 0
+
+
+def test_wide_and_long_prefix_queries_keep_ranking():
+    """Тест: широкий запрос (больше SORT_CANDIDATES_LIMIT кандидатов) и длинный префикс ранжируются так же:
+    точные совпадения токенов выше, затем короче название, затем id. Время поиска — benchmark_catalog_index.py"""
+    index = CatalogIndex()
+    index.load(_row(i, f"Чехол Samsung {i}", is_active=i % 2 == 0) for i in range(3000))
+    index.load([_row(5000, "Чех силиконовый прозрачный усиленный")])
+    assert len(index.search("ч", limit=5000)) > SORT_CANDIDATES_LIMIT
+
+    # Префикс короче PREFIX_POSTINGS_LENGTH: единственное точное совпадение «чех» первым, дальше короткие названия
+    assert [p["id"] for p in index.search("чех")] == [5000] + list(range(9))
+    # Длинный префикс ищется диапазоном по словарю, порядок тот же
+    assert [p["id"] for p in index.search("чехо", limit=5)] == [0, 1, 2, 3, 4]
+    # Несколько токенов: точный «12» выше, затем префиксы по длине названия
+    assert [p["id"] for p in index.search("samsung 12", limit=5)] == [12, 120, 121, 122, 123]
+    assert [p["id"] for p in index.search("samsu 12", active_only=True, limit=4)] == [12, 120, 122, 124]
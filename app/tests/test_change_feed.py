@@ -0,0 +1,111 @@
+import pytest
+from fastapi import HTTPException
+
+from app.api.routes.changes import get_changes
+from app.models import Product, Stock, Warehouse
+from app.services import current_generation, read_changes
+from app.services.bulk_upsert import upsert_goods
+
+
+def _good(good_id, title, residue):
+    return {"id": good_id, "title": title, "residue": residue}
+
+
+def _page(db, entity, since, limit=500, cursor=None):
+    return get_changes(since=since, entity=entity, limit=limit, cursor=cursor, db=db)
+
+
+def test_sync_writes_are_stamped_with_increasing_generations(db):
+    """Тест: каждая транзакция синхронизации получает новое поколение, неизменённые строки его не меняют"""
+    wh = Warehouse(remonline_id=801, name="Main")
+    db.add(wh)
+    db.commit()
+    assert current_generation(db) == 0
+
+    upsert_goods(db, [(wh.id, [_good(i, f"Good {i}", i) for i in range(1, 6)])])
+    db.commit()
+    first = current_generation(db)
+    assert first > 0
+    assert {p.change_gen for p in db.query(Product)} == {first}
+
+    # Изменились только название товара 2 и остаток товара 3
+    upsert_goods(db, [(wh.id, [_good(1, "Good 1", 1), _good(2, "Renamed", 2), _good(3, "Good 3", 30)])])
+    db.commit()
+    second = current_generation(db)
+    assert second > first
+
+    products = read_changes(db, "products", first, 100)
+    assert [p["remonline_id"] for p in products] == [2]
+    stocks = read_changes(db, "stocks", first, 100)
+    assert [(s["product_remonline_id"], s["warehouse_remonline_id"], s["available_quantity"]) for s in stocks] == [
+        (3, 801, 30.0)
+    ]
+    assert read_changes(db, "products", second, 100) == []
+
+    # Откаченная транзакция строк в ленте не оставляет
+    upsert_goods(db, [(wh.id, [_good(4, "Gone", 4)])])
+    db.rollback()
+    assert read_changes(db, "products", second, 100) == []
+
+
+def test_orm_writes_get_generation(db):
+    """Тест: товар, созданный и изменённый через ORM, тоже попадает в ленту"""
+    product = Product(remonline_id=901, name="Manual")
+    db.add(product)
+    db.commit()
+    created = product.change_gen
+    assert created == current_generation(db)
+
+    product.name = "Manual 2"
+    db.commit()
+    assert product.change_gen > created
+    assert [p["name"] for p in read_changes(db, "products", created, 10)] == ["Manual 2"]
+
+
+def test_changes_endpoint_pages_by_cursor(db):
+    """Тест: /changes листает строки одного поколения по курсору и отдаёт generation для следующего запроса"""
+    wh = Warehouse(remonline_id=802, name="Main")
+    db.add(wh)
+    db.commit()
+    upsert_goods(db, [(wh.id, [_good(i, f"Good {i}", i) for i in range(1, 8)])])
+    db.commit()
+
+    seen, cursor = [], None
+    while True:
+        page = _page(db, "stocks", since=0, limit=3, cursor=cursor)
+        seen += [row["product_remonline_id"] for row in page.data["items"]]
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+    assert sorted(seen) == list(range(1, 8)) and len(seen) == 7
+    generation = page.data["generation"]
+    assert _page(db, "stocks", since=generation).data["items"] == []
+
+    # Курсор одной сущности не подходит к другой; неизвестная сущность — 400
+    cursor = _page(db, "stocks", since=0, limit=3).next_cursor
+    with pytest.raises(HTTPException):
+        _page(db, "products", since=0, cursor=cursor)
+    with pytest.raises(HTTPException):
+        _page(db, "warehouses", since=0)
+
+
+def test_entity_counters_follow_their_tables(db):
+    """Тест: запись складов увеличивает только счётчик складов; запись тех же значений — ничего"""
+    from app.services import current_generations
+
+    warehouse = Warehouse(remonline_id=803, name="Main")
+    db.add(warehouse)
+    db.commit()
+    before = current_generations(db, ["catalog", "warehouses", "tabs"])
+    assert before["warehouses"] > 0 and before["catalog"] == 0
+
+    # Как синхронизация складов: загруженный склад, те же значения
+    warehouse = db.query(Warehouse).filter_by(remonline_id=803).one()
+    warehouse.name = "Main"
+    db.commit()
+    assert current_generations(db, ["warehouses"])["warehouses"] == before["warehouses"]
+
+    db.query(Warehouse).filter_by(id=warehouse.id).update({"name": "Renamed"})
+    db.commit()
+    after = current_generations(db, ["catalog", "warehouses", "tabs"])
+    assert after == {**before, "warehouses": before["warehouses"] + 1}
@@ -0,0 +1,81 @@
+import gzip
+import json
+
+from starlette.requests import Request
+
+from app.api import fast_json
+from app.api.routes.products import get_products
+from app.api.routes.stocks import get_stocks
+from app.api.schemas import APIResponse, ProductResponse, StockResponse
+from app.core.config import settings
+from app.models import Product, Stock, Warehouse
+
+
+def _request(accept_encoding: str = "") -> Request:
+    headers = [(b"accept-encoding", accept_encoding.encode())] if accept_encoding else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers, "query_string": b""})
+
+
+def _seed(db, count=5):
+    warehouse = Warehouse(remonline_id=990, name="Main")
+    db.add(warehouse)
+    products = [
+        Product(
+            remonline_id=5000 + i, name=f"Товар {i}", sku=f"SKU{i}", price=10.5 * i,
+            images_json=[{"url": f"https://img/{i}.png"}], prices_json={"1": 10.5 * i},
+        )
+        for i in range(count)
+    ]
+    db.add_all(products)
+    db.flush()
+    db.add_all([Stock(warehouse_id=warehouse.id, product_id=p.id, quantity=i, available_quantity=i) for i, p in enumerate(products)])
+    db.commit()
+
+
+def test_product_list_matches_api_response_path(db):
+    """Тест: быстрый путь отдаёт то же, что APIResponse с ProductResponse.from_orm"""
+    _seed(db)
+    response = get_products(_request(), skip=0, limit=3, name=None, sku=None, category=None, is_active=None, cursor=None, db=db)
+    fast = json.loads(response.body)
+
+    products = db.query(Product).order_by(Product.id).limit(3).all()
+    reference = APIResponse(
+        data=[ProductResponse.from_orm(p) for p in products], count=3, next_cursor=fast["next_cursor"]
+    )
+    assert fast == json.loads(reference.model_dump_json())
+    assert fast["next_cursor"] is not None
+
+    # Курсор быстрого пути ведёт на следующую страницу
+    second = get_products(_request(), skip=0, limit=3, name=None, sku=None, category=None, is_active=None, cursor=fast["next_cursor"], db=db)
+    assert [p["remonline_id"] for p in json.loads(second.body)["data"]] == [5003, 5004]
+
+
+def test_stock_list_matches_api_response_path(db):
+    """Тест: остатки со складом и товаром одним запросом — то же, что from_orm с ленивой загрузкой связей"""
+    _seed(db)
+    response = get_stocks(
+        _request(), skip=0, limit=100, warehouse_id=None, product_id=None,
+        min_quantity=None, max_quantity=None, include_details=False, cursor=None, db=db,
+    )
+    fast = json.loads(response.body)
+    stocks = db.query(Stock).order_by(Stock.id).all()
+    reference = APIResponse(data=[StockResponse.from_orm(s) for s in stocks], count=len(stocks))
+    assert fast == json.loads(reference.model_dump_json())
+
+
+def test_large_bodies_are_gzipped_when_accepted(monkeypatch):
+    """Тест: тело больше порога сжимается только для клиента с Accept-Encoding: gzip"""
+    monkeypatch.setattr(settings, "FAST_JSON_GZIP_MIN_BYTES", 100)
+    data = [{"id": i, "name": "Дисплей iPhone"} for i in range(50)]
+
+    compressed = fast_json.api_json_response(_request("gzip, br"), data=data, count=50)
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.headers["vary"] == "Accept-Encoding"
+    assert json.loads(gzip.decompress(compressed.body))["data"] == data
+
+    plain = fast_json.api_json_response(_request(), data=data, count=50)
+    assert "content-encoding" not in plain.headers
+    assert json.loads(plain.body)["count"] == 50
+
+    small = fast_json.api_json_response(_request("gzip"), data=[], count=0)
+    assert "content-encoding" not in small.headers
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from app.services import RemonlineService
+from app.services.http_client import RemonlineHTTPClient, remonline_http
+
+
+async def _start_keepalive_server():
+    """Минимальный HTTP/1.1 сервер с keep-alive: считает принятые TCP-соединения"""
+    accepted = []
+
+    async def handle(reader, writer):
+        accepted.append(writer)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                if not head:
+                    break
+                body = b'{"data": []}'
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, port, accepted
+
+
+@pytest.mark.asyncio
+async def test_shared_client_reuses_connections():
+    """Тест: последовательные запросы идут по одному keep-alive соединению, метрики это отражают"""
+    server, port, accepted = await _start_keepalive_server()
+    manager = RemonlineHTTPClient()
+    try:
+        client = await manager.start()
+        for _ in range(5):
+            response = await client.get(f"http://127.0.0.1:{port}/warehouse/")
+            assert response.json() == {"data": []}
+        stats = manager.pool_stats()
+        assert len(accepted) == 1
+        assert stats["requests"] == 5 and stats["connections_opened"] == 1
+        assert stats["connections"] == 1 and stats["idle"] == 1
+    finally:
+        await manager.stop()
+        server.close()
+        await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_services_share_application_client():
+    """Тест: все экземпляры RemonlineService используют общий клиент и не закрывают его"""
+    async with RemonlineService() as first:
+        client = first.client
+    async with RemonlineService() as second:
+        assert second.client is client
+    assert not client.is_closed
+    await remonline_http.stop()
+    assert client.is_closed
@@ -0,0 +1,135 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine
+
+from app.models import ServiceLock, SyncJob
+from app.services import SyncWorker
+from app.services.locks import AdvisoryLock, TableLock, advisory_key, exclusive, service_lock
+
+from .conftest import engine as test_engine, TestingSessionLocal
+
+
+def _expire(db, name):
+    db.query(ServiceLock).filter_by(name=name).update({"expires_at": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+
+
+def test_table_lock_single_holder_and_failover(db):
+    """Тест: блокировку держит один узел; после истечения аренды её забирает другой"""
+    leader = TableLock("sync", owner="node-a", ttl_seconds=60, bind=test_engine)
+    follower = TableLock("sync", owner="node-b", ttl_seconds=60, bind=test_engine)
+
+    assert leader.acquire()
+    assert not follower.acquire()
+    # Повторный захват владельцем — продление
+    assert leader.acquire() and leader.renew()
+
+    # Лидер «умер»: аренда истекла
+    _expire(db, "sync")
+    assert follower.acquire()
+    assert not leader.renew() and not leader.held
+
+    # Бывший лидер не может снять чужую блокировку
+    leader.release()
+    assert not leader.acquire()
+    follower.release()
+    assert leader.acquire()
+
+
+def test_exclusive_waits_and_times_out(db):
+    """Тест: занятая критическая секция не пускает второго до таймаута"""
+    with exclusive("enqueue", timeout=1, bind=test_engine):
+        with pytest.raises(TimeoutError):
+            with exclusive("enqueue", timeout=0.2, bind=test_engine):
+                pass
+    with exclusive("enqueue", timeout=0.2, bind=test_engine):
+        pass
+
+
+def test_service_lock_picks_backend_by_dialect():
+    """Тест: PostgreSQL — advisory-блокировка, SQLite — таблица service_locks"""
+    assert isinstance(service_lock("x", bind=test_engine), TableLock)
+    # Соединение не открывается до acquire(), достаточно диалекта
+    pg_engine = SimpleNamespace(dialect=SimpleNamespace(name="postgresql"))
+    assert isinstance(service_lock("x", bind=pg_engine), AdvisoryLock)
+    key = advisory_key("remonline-sync-leader")
+    assert key == advisory_key("remonline-sync-leader") and -2**63 <= key < 2**63
+
+
+@pytest.mark.skipif(not os.getenv("TEST_POSTGRES_URL"), reason="needs TEST_POSTGRES_URL")
+def test_advisory_lock_single_holder_and_failover():
+    """Тест: advisory-блокировку держит одно соединение; закрытие соединения освобождает её"""
+    pg_engine = create_engine(os.environ["TEST_POSTGRES_URL"])
+    leader = AdvisoryLock("test-leader", owner="node-a", bind=pg_engine)
+    follower = AdvisoryLock("test-leader", owner="node-b", bind=pg_engine)
+    try:
+        assert leader.acquire()
+        assert not follower.acquire()
+        assert leader.renew()
+        # Процесс лидера умер — соединение закрыто, PostgreSQL снимает блокировку
+        leader._drop()
+        assert follower.acquire()
+    finally:
+        leader.release()
+        follower.release()
+        pg_engine.dispose()
+
+
+class IncrementalFakeService:
+    """Подмена RemonlineService для инкрементального задания."""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    async def sync_warehouses(self, db):
+        pass
+
+    async def sync_products_and_stocks(self, db, incremental=False):
+        return {"incremental": incremental}
+
+
+@pytest.mark.asyncio
+async def test_only_leader_worker_takes_jobs(db):
+    """Тест: воркер без лидерства не забирает задания; после ухода лидера задание выполняет он"""
+    from app.services import enqueue_sync_job
+
+    job, _ = enqueue_sync_job(db, "incremental")
+    leader = TableLock("remonline-sync-leader", owner="node-a", ttl_seconds=60, bind=test_engine)
+    assert leader.acquire()
+
+    worker = SyncWorker(
+        owner="node-b",
+        session_factory=TestingSessionLocal,
+        service_factory=IncrementalFakeService,
+        poll_seconds=0.02,
+        bind=test_engine,
+    )
+    task = asyncio.create_task(worker.run_forever())
+    try:
+        await asyncio.sleep(0.2)
+        db.expire_all()
+        assert db.get(SyncJob, job.id).status == "queued"
+
+        # Лидер умер: аренда блокировки истекла, лидерство и задание переходят к воркеру
+        _expire(db, "remonline-sync-leader")
+        for _ in range(100):
+            await asyncio.sleep(0.02)
+            db.expire_all()
+            if db.get(SyncJob, job.id).status == "finished":
+                break
+        done = db.get(SyncJob, job.id)
+        assert done.status == "finished" and done.lease_owner == "node-b"
+        assert done.stats == {"incremental": True}
+        assert worker.leadership.held and not leader.renew()
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    # При остановке воркер отдаёт лидерство
+    assert leader.acquire()
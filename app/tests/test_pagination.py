@@ -0,0 +1,59 @@
+import pytest
+from fastapi import HTTPException
+
+from app.models import Product
+from app.api.routes.products import _paginate_products
+
+
+def _walk(db, sort_by, sort_order, limit):
+    """Пройти все страницы по next_cursor и вернуть id товаров по порядку."""
+    ids, cursor = [], None
+    while True:
+        products, cursor = _paginate_products(db.query(Product), db, sort_by, sort_order, 0, limit, cursor)
+        ids.extend(p["id"] for p in products)
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize("sort_by,sort_order", [
+    ("name", "asc"), ("id", "asc"), ("price", "desc"), ("price", "asc"), ("category", "desc"), ("total_stock", "desc"),
+])
+def test_keyset_pages_match_offset_order(db, sort_by, sort_order):
+    """Тест: обход по курсорам совпадает с offset-порядком, включая NULL и повторяющиеся значения"""
+    prices = [10, None, 10, 5, None, 7, 10, 3, None, 5, 8]
+    db.add_all([
+        Product(remonline_id=100 + i, name=f"Item {i % 4}", price=price, category=None if price is None else f"C{i % 3}")
+        for i, price in enumerate(prices)
+    ])
+    db.commit()
+
+    # skip > 0 — OFFSET по единому ORDER BY ... NULLS LAST, id; курсоры — сегменты «значения, затем NULL»
+    offset_ids = [p["id"] for p in _paginate_products(db.query(Product), db, sort_by, sort_order, 1, 100)[0]]
+    walked = _walk(db, sort_by, sort_order, limit=3)
+    assert walked[1:] == offset_ids
+    assert len(walked) == len(prices)
+
+
+def test_cursor_from_other_sort_is_rejected(db):
+    """Тест: курсор другой сортировки — 400"""
+    db.add_all([Product(remonline_id=i, name=f"P{i}") for i in range(1, 4)])
+    db.commit()
+    _, cursor = _paginate_products(db.query(Product), db, "name", "asc", 0, 2)
+    with pytest.raises(HTTPException) as exc:
+        _paginate_products(db.query(Product), db, "price", "asc", 0, 2, cursor)
+    assert exc.value.status_code == 400
+
+
+@pytest.mark.parametrize("column", [Product.name, Product.price, Product.category])
+@pytest.mark.parametrize("descending", [False, True])
+def test_cursor_page_runs_on_index(db, column, descending):
+    """Тест: страница по курсору — диапазон индекса без сортировки во временном B-дереве"""
+    from sqlalchemy import text
+    from app.api.pagination import after_cursor
+
+    direction = (lambda c: c.desc()) if descending else (lambda c: c.asc())
+    query = after_cursor(db.query(Product).filter(column.isnot(None)), column, Product.id, descending, "x", 10)
+    query = query.order_by(direction(column), direction(Product.id)).limit(3)
+    sql = str(query.statement.compile(db.get_bind(), compile_kwargs={"literal_binds": True}))
+    plan = " ".join(row[-1] for row in db.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+    assert "USING INDEX" in plan and "TEMP B-TREE" not in plan
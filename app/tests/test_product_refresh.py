@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+
+from app.models import Warehouse, Product, Stock, ProductStockTotal
+from app.services import refresh_products
+
+
+class FakeRemonlineService:
+    """Подмена RemonlineService: остатки по складам для запросов `ids[]`, считает параллельные запросы."""
+
+    def __init__(self, goods_by_warehouse, failing=()):
+        self.goods_by_warehouse = goods_by_warehouse
+        self.failing = set(failing)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = []
+
+    async def fetch_goods_by_ids(self, warehouse_rem_id, good_ids):
+        self.calls.append((warehouse_rem_id, list(good_ids)))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            if warehouse_rem_id in self.failing:
+                raise RuntimeError("503 Service Unavailable")
+            goods = self.goods_by_warehouse.get(warehouse_rem_id, [])
+            return [g for g in goods if g["id"] in good_ids]
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.mark.asyncio
+async def test_refresh_fans_out_and_writes_one_transaction(db):
+    """Тест: склады опрашиваются параллельно, остатки пишутся разом, пропавший остаток обнуляется"""
+    warehouses = [Warehouse(remonline_id=7000 + i, name=f"WH {i}") for i in range(4)]
+    product = Product(remonline_id=555, name="Old name")
+    db.add_all(warehouses + [product])
+    db.flush()
+    # Остаток на складе, который товар больше не возвращает
+    db.add(Stock(warehouse_id=warehouses[2].id, product_id=product.id, quantity=4, available_quantity=4))
+    db.commit()
+
+    service = FakeRemonlineService({
+        7000: [{"id": 555, "title": "New name", "residue": 2}],
+        7001: [{"id": 555, "title": "New name", "residue": 5}],
+        7002: [],
+    }, failing=[7003])
+
+    result = await refresh_products(service, db, [555], warehouses)
+
+    assert service.max_in_flight == 4
+    assert all(ids == [555] for _, ids in service.calls)
+    statuses = {r["warehouse_id"]: r["status"] for r in result["warehouses"]}
+    assert statuses == {7000: "found", 7001: "found", 7002: "absent", 7003: "error"}
+    assert result["warehouses_failed"] == [7003]
+    assert result["stocks_zeroed"] == 1
+
+    db.expire_all()
+    assert db.query(Product).filter_by(remonline_id=555).one().name == "New name"
+    quantities = {s.warehouse_id: s.quantity for s in db.query(Stock).filter_by(product_id=product.id)}
+    assert quantities == {warehouses[0].id: 2, warehouses[1].id: 5, warehouses[2].id: 0}
+    total = db.query(ProductStockTotal).filter_by(product_id=product.id).one()
+    assert total.total_available == 7
+    assert total.warehouses_in_stock == 2
+
+
+@pytest.mark.asyncio
+async def test_refresh_packs_ids_into_batches(db, monkeypatch):
+    """Тест: товары пакуются в запросы `ids[]` по REMONLINE_IDS_PER_REQUEST, недостающие создаются"""
+    from app.core.config import settings
+    monkeypatch.setattr(settings, "REMONLINE_IDS_PER_REQUEST", 3)
+    warehouses = [Warehouse(remonline_id=7100 + i, name=f"WH {i}") for i in range(2)]
+    db.add_all(warehouses)
+    db.commit()
+
+    good_ids = list(range(900, 907))
+    service = FakeRemonlineService({
+        7100: [{"id": i, "title": f"Good {i}", "residue": 1} for i in good_ids],
+        7101: [{"id": 900, "title": "Good 900", "residue": 2}],
+    })
+
+    result = await refresh_products(service, db, good_ids, warehouses)
+
+    # 7 товаров → 3 пачки на каждый из 2 складов
+    assert result["requests"] == 6
+    assert sorted(len(ids) for _, ids in service.calls) == [1, 1, 3, 3, 3, 3]
+    assert result["products_found"] == 7
+    assert db.query(Product).filter(Product.remonline_id.in_(good_ids)).count() == 7
+    totals = {
+        t.product_id: t.total_available for t in db.query(ProductStockTotal).join(
+            Product, Product.id == ProductStockTotal.product_id
+        ).filter(Product.remonline_id == 900)
+    }
+    assert list(totals.values()) == [3]
+
+
+@pytest.mark.asyncio
+async def test_locate_good_checks_known_warehouses_first(db):
+    """Тест: поиск сначала идёт по складам из product_locations, иначе — по всем складам"""
+    from app.models import ProductLocation
+    from app.services.product_refresh import locate_good
+
+    warehouses = [Warehouse(remonline_id=7200 + i, name=f"WH {i}") for i in range(5)]
+    db.add_all(warehouses)
+    db.flush()
+    db.add(ProductLocation(remonline_id=801, warehouse_id=warehouses[3].id))
+    db.commit()
+
+    item = {"id": 801, "title": "Located", "residue": 1}
+    service = FakeRemonlineService({7203: [item], 7204: [item]})
+    wh, found = await locate_good(service, db, 801, warehouses)
+    assert wh.remonline_id == 7203 and found["title"] == "Located"
+    assert service.calls == [(7203, [801])]
+
+    # Товара нет в индексе — параллельный обход всех складов
+    service = FakeRemonlineService({7201: [{"id": 802, "title": "Elsewhere"}]})
+    wh, _ = await locate_good(service, db, 802, warehouses)
+    assert wh.remonline_id == 7201
+    assert await locate_good(FakeRemonlineService({}), db, 803, warehouses) is None
+
+
+@pytest.mark.asyncio
+async def test_locations_follow_sync_and_refresh(db):
+    """Тест: апсерт синхронизации записывает расположение, обновление удаляет пропавшее"""
+    from app.models import ProductLocation
+    from app.services.bulk_upsert import upsert_goods
+
+    warehouses = [Warehouse(remonline_id=7300 + i, name=f"WH {i}") for i in range(2)]
+    db.add_all(warehouses)
+    db.commit()
+    upsert_goods(db, [(wh.id, [{"id": 811, "title": "Good", "residue": 1}]) for wh in warehouses])
+    db.commit()
+
+    def located():
+        return {wh_id for (wh_id,) in db.query(ProductLocation.warehouse_id).filter_by(remonline_id=811)}
+
+    assert located() == {warehouses[0].id, warehouses[1].id}
+    service = FakeRemonlineService({7300: [{"id": 811, "title": "Good", "residue": 1}]})
+    await refresh_products(service, db, [811], warehouses)
+    assert located() == {warehouses[0].id}
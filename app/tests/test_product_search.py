@@ -0,0 +1,83 @@
+import pytest
+from sqlalchemy import text
+
+from app.models import Warehouse, Product
+from app.services import product_search
+from app.services.bulk_upsert import upsert_goods
+from app.services.product_search import apply_product_search, ensure_search_index
+from app.tests.helpers import make_good
+
+
+@pytest.fixture
+def search_db(db):
+    """Тестовая БД с FTS5-индексом товаров; индекс удаляется после теста"""
+    bind = db.get_bind()
+    assert ensure_search_index(bind) == "fts5"
+    yield db
+    db.rollback()
+    with bind.begin() as conn:
+        for trigger in ("products_fts_ai", "products_fts_ad", "products_fts_au"):
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+        conn.execute(text("DROP TABLE IF EXISTS products_fts"))
+    product_search._backends.pop(id(bind), None)
+
+
+def _search(db, term):
+    query, rank = apply_product_search(db.query(Product), db, term)
+    if rank is not None:
+        query = query.order_by(rank.desc(), Product.id)
+    return [p.remonline_id for p in query.all()]
+
+
+def test_search_index_follows_upsert(search_db):
+    """Тест: апсерт товаров обновляет FTS5-индекс в той же транзакции, поиск регистронезависим"""
+    db = search_db
+    wh = Warehouse(remonline_id=701, name="Main")
+    db.add(wh)
+    db.commit()
+    upsert_goods(db, [(wh.id, [
+        make_good(123456, "Дисплей iPhone 12", 1),
+        make_good(223344, "Аккумулятор iPhone 12 Pro", 2),
+        make_good(777001, "Чехол Samsung", 3),
+    ])])
+    db.commit()
+
+    assert set(_search(db, "iphone 12")) == {123456, 223344}
+    assert _search(db, "ДИСПЛЕЙ") == [123456]
+    assert _search(db, "3344") == [223344]
+
+    # Переименование в Remonline: старое название больше не находится
+    upsert_goods(db, [(wh.id, [make_good(777001, "Чехол Xiaomi", 3)])])
+    db.commit()
+    assert _search(db, "Samsung") == []
+    assert _search(db, "xiaomi") == [777001]
+
+
+def test_short_query_falls_back_to_ilike(search_db):
+    """Тест: запрос короче триграммы ищется через ilike без ранжирования"""
+    db = search_db
+    db.add(Product(remonline_id=42, name="AB adapter"))
+    db.commit()
+    query, rank = apply_product_search(db.query(Product), db, "ab")
+    assert rank is None
+    assert [p.remonline_id for p in query.all()] == [42]
+
+
+def test_orm_writes_are_indexed_and_rebuild_restores_rows(search_db):
+    """Тест: триггеры индексируют ORM-запись товара; перестройка на старте восстанавливает потерянные строки"""
+    db = search_db
+    product = Product(remonline_id=5001, name="Кабель Lightning")
+    db.add(product)
+    db.commit()
+    assert _search(db, "lightning") == [5001]
+
+    product.name = "Кабель USB-C"
+    db.commit()
+    assert _search(db, "lightning") == []
+    assert _search(db, "usb-c") == [5001]
+
+    db.execute(text("DELETE FROM products_fts"))
+    db.commit()
+    assert _search(db, "usb-c") == []
+    ensure_search_index(db.get_bind())
+    assert _search(db, "usb-c") == [5001]
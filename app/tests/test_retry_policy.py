@@ -0,0 +1,92 @@
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.services import RemonlineService
+from app.services.rate_limiter import AdaptiveTokenBucket
+from app.services.retry_policy import backoff_delay, parse_retry_after, retry_reason
+
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(settings, "REMONLINE_RETRY_BASE_DELAY", 0.0)
+    monkeypatch.setattr(settings, "REMONLINE_RETRY_ATTEMPTS", 3)
+
+
+def _service(responses, limiter):
+    """RemonlineService поверх MockTransport, отдающего ответы по очереди"""
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.params.get("page"))
+        return responses.pop(0)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return RemonlineService(rate_limiter=limiter, client=client), calls
+
+
+def test_retry_classification_and_retry_after():
+    """Тест: 429/5xx/таймауты повторяются, остальные 4xx — нет; Retry-After в секундах и HTTP-дате"""
+    request = httpx.Request("GET", "https://api.test/")
+
+    def status_error(code):
+        return httpx.HTTPStatusError("err", request=request, response=httpx.Response(code, request=request))
+
+    assert retry_reason(status_error(429)) == "429"
+    assert retry_reason(status_error(503)) == "503"
+    assert retry_reason(status_error(404)) is None
+    assert retry_reason(httpx.ReadTimeout("slow", request=request)) == "timeout"
+    assert retry_reason(ValueError("bad json")) is None
+
+    assert parse_retry_after(httpx.Response(429, headers={"Retry-After": "2"})) == 2.0
+    assert parse_retry_after(httpx.Response(429, headers={"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0.0
+    assert parse_retry_after(httpx.Response(429)) is None
+    assert backoff_delay(1, retry_after=1.5) >= 1.5
+
+
+@pytest.mark.asyncio
+async def test_request_retries_throttling_and_slows_down(fast_retries):
+    """Тест: 429 и 503 повторяются, лимитер снижает темп, успешный ответ возвращается"""
+    limiter = AdaptiveTokenBucket(rate=100, capacity=10, min_rate=1, max_rate=200)
+    service, calls = _service([
+        httpx.Response(429, headers={"Retry-After": "0"}),
+        httpx.Response(503),
+        httpx.Response(200, json={"data": [{"id": 1}]}),
+    ], limiter)
+
+    assert await service.fetch_goods_page(7, 1) == [{"id": 1}]
+    assert len(calls) == 3
+    # Два отказа подряд попадают в одно окно: темп уменьшен один раз, затем чуть вырос после успеха
+    assert 50 <= limiter.rate < 51
+
+
+@pytest.mark.asyncio
+async def test_request_does_not_retry_client_errors(fast_retries):
+    """Тест: 404 не повторяется, исчерпанные повторы пробрасывают ошибку"""
+    limiter = AdaptiveTokenBucket(rate=100, capacity=10)
+    service, calls = _service([httpx.Response(404)], limiter)
+    with pytest.raises(httpx.HTTPStatusError):
+        await service.fetch_goods_page(7, 1)
+    assert len(calls) == 1
+
+    service, calls = _service([httpx.Response(502)] * 3, limiter)
+    with pytest.raises(httpx.HTTPStatusError):
+        await service.fetch_goods_page(7, 1)
+    assert len(calls) == 3
+
+
+def test_aimd_rate_bounds():
+    """Тест: быстрые ответы прибавляют темп до потолка, медленные не меняют, отказы делят пополам до минимума"""
+    limiter = AdaptiveTokenBucket(rate=3, min_rate=1, max_rate=3.2, increase_step=0.1, latency_target=0.5)
+    limiter.on_success(0.1)
+    limiter.on_success(2.0)
+    assert limiter.rate == pytest.approx(3.1)
+    for _ in range(5):
+        limiter.on_success(0.1)
+    assert limiter.rate == pytest.approx(3.2)
+
+    limiter.on_throttle()
+    assert limiter.rate == pytest.approx(1.6)
+    limiter._last_decrease = 0
+    limiter.on_throttle()
+    assert limiter.rate == 1
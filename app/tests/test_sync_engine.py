@@ -0,0 +1,236 @@
+import asyncio
+import time
+
+import pytest
+
+from app.models import Warehouse, Product, Stock, engine, run_db, run_sync_write
+from app.services import TokenBucket, StockSyncEngine
+
+
+class FakeRemonlineService:
+    """Подмена RemonlineService: отдаёт заранее заданные страницы и считает параллельные запросы."""
+
+    def __init__(self, pages_by_warehouse, rate_limiter=None):
+        self.pages_by_warehouse = pages_by_warehouse
+        self.rate_limiter = rate_limiter
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = []
+
+    async def fetch_goods_page(self, warehouse_rem_id, page):
+        if self.rate_limiter:
+            await self.rate_limiter.acquire()
+        self.calls.append((warehouse_rem_id, page))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            pages = self.pages_by_warehouse.get(warehouse_rem_id, [])
+            return pages[page - 1] if page <= len(pages) else []
+        finally:
+            self.in_flight -= 1
+
+
+def _goods(start, count, residue=1):
+    return [{"id": start + i, "title": f"Good {start + i}", "residue": residue} for i in range(count)]
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_limits_rate():
+    """Тест: после всплеска токены выдаются с заданной скоростью"""
+    bucket = TokenBucket(rate=20, capacity=2)
+    started = time.monotonic()
+    for _ in range(6):
+        await bucket.acquire()
+    elapsed = time.monotonic() - started
+    # 2 токена сразу, ещё 4 по 50 мс
+    assert elapsed >= 0.18
+
+
+@pytest.mark.asyncio
+async def test_engine_syncs_warehouses_concurrently(db):
+    """Тест: конвейер обходит все страницы всех складов параллельно и пишет остатки"""
+    warehouses = [Warehouse(remonline_id=1000 + i, name=f"WH {i}") for i in range(4)]
+    db.add_all(warehouses)
+    db.commit()
+
+    pages = {
+        1000: [_goods(1, 50), _goods(51, 10)],
+        1001: [_goods(1, 5, residue=3)],
+        1002: [],
+        1003: [_goods(200, 50), _goods(250, 50), _goods(300, 1)],
+    }
+    service = FakeRemonlineService(pages)
+    progress = []
+    engine = StockSyncEngine(service, db, workers=4, on_progress=lambda done, total: progress.append((done, total)))
+
+    stats = await engine.run(warehouses)
+
+    assert stats["warehouses_finished"] == 4
+    assert stats["items"] == 60 + 5 + 101
+    assert service.max_in_flight > 1
+    assert progress[-1] == (4, 4)
+    assert db.query(Product).count() == 60 + 101
+    assert db.query(Stock).count() == 60 + 5 + 101
+    wh_1001 = warehouses[1]
+    assert {s.available_quantity for s in db.query(Stock).filter(Stock.warehouse_id == wh_1001.id)} == {3}
+
+
+@pytest.mark.asyncio
+async def test_engine_records_cursors_and_backs_off_unchanged_warehouses(db):
+    """Тест: курсоры складов — неизменённый склад уходит на больший интервал, пустой — на редкий"""
+    from datetime import datetime, timedelta
+
+    from app.core.config import settings
+    from app.models import WarehouseSyncCursor
+    from app.services.sync_scheduler import select_due_warehouses
+
+    hot = Warehouse(remonline_id=2000, name="Hot")
+    cold = Warehouse(remonline_id=2001, name="Cold")
+    empty = Warehouse(remonline_id=2002, name="Empty")
+    db.add_all([hot, cold, empty])
+    db.commit()
+
+    pages = {2000: [_goods(1, 3)], 2001: [_goods(10, 3)], 2002: []}
+    service = FakeRemonlineService(pages)
+    await StockSyncEngine(service, db, workers=3).run([hot, cold, empty])
+
+    # Остатки «горячего» склада изменились, «холодного» — нет
+    pages[2000] = [_goods(1, 3, residue=5)]
+    stats = await StockSyncEngine(service, db, workers=3).run([hot, cold, empty])
+    assert stats["warehouses_unchanged"] == 2
+
+    cursors = {c.warehouse_id: c for c in db.query(WarehouseSyncCursor).all()}
+    assert cursors[hot.id].unchanged_runs == 0
+    assert cursors[hot.id].items == 3 and cursors[hot.id].pages == 1
+    assert cursors[cold.id].unchanged_runs == 1
+    assert cursors[cold.id].next_sync_at - cursors[cold.id].last_synced_at == timedelta(minutes=2 * settings.UPDATE_INTERVAL_MINUTES)
+    assert cursors[empty.id].next_sync_at - cursors[empty.id].last_synced_at == timedelta(minutes=settings.SYNC_EMPTY_INTERVAL_MINUTES)
+
+    # Через базовый интервал пора только «горячему» складу
+    later = datetime.utcnow() + timedelta(minutes=settings.UPDATE_INTERVAL_MINUTES, seconds=1)
+    assert [wh.remonline_id for wh in select_due_warehouses(db, now=later)] == [2000]
+
+
+class FlakyRemonlineService(FakeRemonlineService):
+    """Падает на заданной странице склада один раз — имитация обрыва прогона."""
+
+    def __init__(self, pages_by_warehouse, fail_on):
+        super().__init__(pages_by_warehouse)
+        self.fail_on = set(fail_on)
+
+    async def fetch_goods_page(self, warehouse_rem_id, page):
+        if (warehouse_rem_id, page) in self.fail_on:
+            self.fail_on.discard((warehouse_rem_id, page))
+            raise RuntimeError("connection reset")
+        return await super().fetch_goods_page(warehouse_rem_id, page)
+
+
+@pytest.mark.asyncio
+async def test_engine_resumes_run_from_checkpoints(db):
+    """Тест: повторный запуск прогона продолжает склад со следующей страницы после чекпоинта"""
+    from app.models import SyncRun, WarehouseSyncCursor
+
+    done = Warehouse(remonline_id=3000, name="Done")
+    broken = Warehouse(remonline_id=3001, name="Broken")
+    db.add_all([done, broken])
+    run = SyncRun(status="running", warehouses_total=2)
+    db.add(run)
+    db.commit()
+
+    pages = {3000: [_goods(1, 2)], 3001: [_goods(100, 50), _goods(150, 50), _goods(200, 3)]}
+    service = FlakyRemonlineService(pages, fail_on={(3001, 2)})
+    stats = await StockSyncEngine(service, db, workers=2, run_id=run.id).run([done, broken])
+    assert stats["warehouses_failed"] == [3001]
+    # Склад с упавшей страницей не считается завершённым
+    assert stats["warehouses_finished"] == 1
+
+    checkpoint = db.query(WarehouseSyncCursor).filter_by(warehouse_id=broken.id).one()
+    assert checkpoint.run_page == 1 and not checkpoint.run_finished
+
+    service.calls.clear()
+    stats = await StockSyncEngine(service, db, workers=2, run_id=run.id).run([done, broken])
+
+    # Завершённый склад не запрашивается, упавший продолжает со 2-й страницы
+    assert service.calls == [(3001, 2), (3001, 3)]
+    assert stats["warehouses_resumed"] == 1
+    assert stats["warehouses_finished"] == 2
+    db.expire_all()
+    cursor = db.query(WarehouseSyncCursor).filter_by(warehouse_id=broken.id).one()
+    assert cursor.run_finished and cursor.items == 103 and cursor.pages == 3
+
+    # Контрольная сумма совпадает с непрерывным прогоном
+    fresh = await StockSyncEngine(FakeRemonlineService(pages), db, workers=2).run([broken])
+    assert fresh["warehouses_unchanged"] == 1
+
+
+class FailingWriteEngine(StockSyncEngine):
+    """Падает при записи пакета с заданной страницей склада один раз — имитация ошибки БД."""
+
+    def __init__(self, *args, fail_on, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail_on = fail_on
+
+    def _write_batch(self, batch):
+        if any((wh.remonline_id, page) == self.fail_on for wh, page, _items, _last, _state in batch):
+            self.fail_on = None
+            raise RuntimeError("database is locked")
+        return super()._write_batch(batch)
+
+
+@pytest.mark.asyncio
+async def test_failed_write_does_not_advance_checkpoint(db):
+    """Тест: склад незаписанного пакета — с ошибкой, чекпоинт не уходит дальше потерянной страницы"""
+    from app.models import SyncRun, WarehouseSyncCursor
+
+    broken = Warehouse(remonline_id=3101, name="Broken")
+    db.add(broken)
+    run = SyncRun(status="running", warehouses_total=1)
+    db.add(run)
+    db.commit()
+
+    pages = {3101: [_goods(100, 50), _goods(150, 50), _goods(200, 3)]}
+    service = FakeRemonlineService(pages)
+    stats = await FailingWriteEngine(service, db, run_id=run.id, fail_on=(3101, 2)).run([broken])
+    assert stats["warehouses_failed"] == [3101]
+    assert stats["warehouses_finished"] == 0
+
+    db.expire_all()
+    checkpoint = db.query(WarehouseSyncCursor).filter_by(warehouse_id=broken.id).one()
+    assert checkpoint.status == "error"
+    assert not checkpoint.run_finished
+    resume_page = (checkpoint.run_page or 0) + 1
+    assert resume_page <= 2
+
+    # Повторный запуск перечитывает потерянную страницу и завершает склад
+    service.calls.clear()
+    stats = await StockSyncEngine(service, db, run_id=run.id).run([broken])
+    assert service.calls[0] == (3101, resume_page)
+    assert stats["warehouses_finished"] == 1 and stats["warehouses_failed"] == []
+    db.expire_all()
+    cursor = db.query(WarehouseSyncCursor).filter_by(warehouse_id=broken.id).one()
+    assert cursor.run_finished and cursor.items == 103 and cursor.pages == 3
+    assert db.query(Stock).filter_by(warehouse_id=broken.id).count() == 103
+
+
+@pytest.mark.asyncio
+async def test_db_work_runs_off_event_loop():
+    """Тест: блокирующая запись синхронизации и запросы UI в потоках не останавливают event loop"""
+    started = time.monotonic()
+    ticks = []
+
+    async def ticker():
+        for _ in range(5):
+            await asyncio.sleep(0.02)
+            ticks.append(time.monotonic() - started)
+
+    await asyncio.gather(run_sync_write(time.sleep, 0.3), run_db(time.sleep, 0.3), ticker())
+    assert ticks[-1] < 0.25
+
+
+def test_sqlite_uses_wal_for_concurrent_reads():
+    """Тест: SQLite в WAL — чтение не ждёт коммитов писателя"""
+    if engine.dialect.name != "sqlite":
+        pytest.skip("WAL only applies to SQLite")
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
@@ -0,0 +1,135 @@
+import asyncio
+import importlib
+import json
+import threading
+
+import pytest
+from sqlalchemy import update
+
+from app.core.config import settings
+from app.models import Stock, Warehouse
+from app.services import SyncEventBroadcaster
+from app.services.bulk_upsert import upsert_goods
+from app.services.change_feed import CATALOG_COUNTER, _next_generation
+from app.services.sync_events import format_sse, read_stock_deltas
+from app.services.sync_jobs import sync_progress
+from app.tests.conftest import TestingSessionLocal, engine
+
+
+def _parse(frame):
+    event_line, data_line = frame.strip().split("\n")
+    return event_line[len("event: "):], json.loads(data_line[len("data: "):])
+
+
+def test_format_sse_frame():
+    """Тест: кадр SSE — имя события и однострочный JSON"""
+    assert format_sse("stocks", {"deltas": [[1, 2, 3.0]]}) == 'event: stocks\ndata: {"deltas":[[1,2,3.0]]}\n\n'
+
+
+@pytest.mark.asyncio
+async def test_broadcaster_fans_out_from_other_threads():
+    """Тест: событие, опубликованное из потока БД, получают все подписчики"""
+    broadcaster = SyncEventBroadcaster(queue_size=8)
+    first, second = broadcaster.subscribe(), broadcaster.subscribe()
+
+    thread = threading.Thread(target=broadcaster.publish, args=("progress", {"processed": 1}))
+    thread.start()
+    thread.join()
+
+    for queue in (first, second):
+        frame = await asyncio.wait_for(queue.get(), timeout=1)
+        assert _parse(frame) == ("progress", {"processed": 1})
+
+    broadcaster.unsubscribe(first)
+    broadcaster.unsubscribe(second)
+    assert broadcaster.clients == 0
+    # Без подписчиков публикация ничего не делает
+    broadcaster.publish("progress", {"processed": 2})
+
+
+@pytest.mark.asyncio
+async def test_slow_client_gets_resync():
+    """Тест: отставшему клиенту очередь очищается и приходит resync"""
+    broadcaster = SyncEventBroadcaster(queue_size=2)
+    queue = broadcaster.subscribe()
+    for i in range(3):
+        broadcaster.publish("stocks", {"deltas": [[i, 1, 1.0]]})
+    await asyncio.sleep(0.01)
+
+    assert queue.qsize() == 1
+    assert _parse(queue.get_nowait())[0] == "resync"
+
+
+def test_stock_deltas_come_from_change_feed(db, monkeypatch):
+    """Тест: дельты (товар, склад, количество) в RemID читаются из ленты изменений после поколения"""
+    warehouse = Warehouse(remonline_id=7000, name="WH")
+    db.add(warehouse)
+    db.commit()
+    generation, deltas = read_stock_deltas(db, None)
+    assert deltas == []
+
+    upsert_goods(db, [(warehouse.id, [{"id": 11, "title": "A", "residue": 2}, {"id": 12, "title": "B", "residue": 0}])])
+    db.commit()
+    generation, deltas = read_stock_deltas(db, generation)
+    assert sorted(deltas) == [[11, 7000, 2.0], [12, 7000, 0.0]]
+
+    # Неизменившиеся остатки и откаченные транзакции дельт не дают
+    upsert_goods(db, [(warehouse.id, [{"id": 11, "title": "A", "residue": 2}])])
+    db.commit()
+    upsert_goods(db, [(warehouse.id, [{"id": 11, "title": "A", "residue": 5}])])
+    db.rollback()
+    generation, deltas = read_stock_deltas(db, generation)
+    assert deltas == []
+
+    # Слишком много изменений — вместо дельт resync
+    monkeypatch.setattr(importlib.import_module("app.services.sync_events"), "STOCK_DELTAS_LIMIT", 1)
+    upsert_goods(db, [(warehouse.id, [{"id": 11, "title": "A", "residue": 3}, {"id": 12, "title": "B", "residue": 4}])])
+    db.commit()
+    assert read_stock_deltas(db, generation)[1] is None
+
+
+@pytest.mark.asyncio
+async def test_poller_publishes_commits_of_another_process(db, monkeypatch):
+    """Тест: опросчик рассылает `stocks` и для записи без событий сессии этого процесса (отдельный воркер)"""
+    monkeypatch.setattr(settings, "SSE_PROGRESS_INTERVAL_SECONDS", 0.01)
+    warehouse = Warehouse(remonline_id=7001, name="WH")
+    db.add(warehouse)
+    db.commit()
+    upsert_goods(db, [(warehouse.id, [{"id": 21, "title": "A", "residue": 1}])])
+    db.commit()
+
+    def read_stocks(since):
+        session = TestingSessionLocal()
+        try:
+            return read_stock_deltas(session, since)
+        finally:
+            session.close()
+
+    broadcaster = SyncEventBroadcaster(queue_size=8)
+    queue = broadcaster.subscribe()
+    try:
+        broadcaster.ensure_progress_poller(lambda: {"status": "idle"}, read_stocks)
+        assert _parse(await asyncio.wait_for(queue.get(), timeout=1)) == ("progress", {"status": "idle"})
+        # Первый опрос только запоминает поколение — история клиентам не рассылается
+        while broadcaster._stocks_generation is None:
+            await asyncio.sleep(0.01)
+
+        with engine.begin() as conn:
+            conn.execute(
+                update(Stock.__table__)
+                .where(Stock.warehouse_id == warehouse.id)
+                .values(quantity=7, available_quantity=7, change_gen=_next_generation(conn, CATALOG_COUNTER))
+            )
+        event_name, payload = _parse(await asyncio.wait_for(queue.get(), timeout=1))
+        assert event_name == "stocks"
+        assert payload["deltas"] == [[21, 7001, 7.0]]
+    finally:
+        broadcaster.unsubscribe(queue)
+        await asyncio.sleep(0.05)
+
+
+def test_sync_progress_without_warehouse_detail(db):
+    """Тест: компактный прогресс для SSE не содержит детализации по складам"""
+    assert sync_progress(db, with_warehouses=False)["status"] == "idle"
+    assert "warehouses" not in sync_progress(db, with_warehouses=False)
+    assert sync_progress(db)["warehouses"] == []
@@ -0,0 +1,152 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import SyncJob, SyncRun, Warehouse, Stock
+from app.services import SyncWorker, claim_next_job, enqueue_sync_job, finish_job, heartbeat
+from app.services.sync_jobs import release_job
+
+from .conftest import TestingSessionLocal
+from .test_sync_engine import FakeRemonlineService, _goods
+
+
+class ContextFakeService(FakeRemonlineService):
+    """FakeRemonlineService как async-контекст — так воркер открывает RemonlineService."""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+def test_enqueue_deduplicates_active_job(db):
+    """Тест: повторная постановка полного задания возвращает уже стоящее в очереди"""
+    job, created = enqueue_sync_job(db, "full")
+    again, created_again = enqueue_sync_job(db, "full")
+    assert created and not created_again
+    assert again.id == job.id
+
+    # Задание другого вида ставится отдельно
+    incremental, created_incremental = enqueue_sync_job(db, "incremental")
+    assert created_incremental and incremental.id != job.id
+
+
+def test_enqueue_resumes_orphan_run(db):
+    """Тест: прогон, оставшийся running без задания, продолжает новое полное задание"""
+    run = SyncRun(status="running", warehouses_total=3)
+    db.add(run)
+    db.commit()
+
+    job, created = enqueue_sync_job(db, "full")
+    assert created and job.run_id == run.id
+
+
+def test_claim_is_exclusive_and_lease_can_be_taken_over(db):
+    """Тест: задание забирает один воркер; после истечения аренды его перехватывает другой"""
+    job, _ = enqueue_sync_job(db, "full")
+
+    claimed = claim_next_job(db, "worker-a", lease_seconds=60)
+    assert claimed.id == job.id and claimed.lease_owner == "worker-a" and claimed.attempts == 1
+    # Аренда действует — второму воркеру брать нечего
+    assert claim_next_job(db, "worker-b", lease_seconds=60) is None
+    assert heartbeat(db, job.id, "worker-a", lease_seconds=60, processed=2, total=5)
+
+    # Воркер A «умер»: аренда истекла
+    db.query(SyncJob).filter_by(id=job.id).update({"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    taken = claim_next_job(db, "worker-b", lease_seconds=60)
+    assert taken.id == job.id and taken.lease_owner == "worker-b" and taken.attempts == 2
+    assert taken.processed == 2
+
+    # Старый владелец узнаёт о потере аренды и не может завершить задание
+    assert not heartbeat(db, job.id, "worker-a")
+    assert not finish_job(db, job.id, "worker-a", "finished")
+    assert finish_job(db, job.id, "worker-b", "finished")
+    db.expire_all()
+    assert db.get(SyncJob, job.id).status == "finished"
+
+
+def test_job_fails_after_max_lease_expirations(db, monkeypatch):
+    """Тест: задание, у которого аренда истекала слишком часто, помечается failed"""
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "SYNC_JOB_MAX_ATTEMPTS", 1)
+    job, _ = enqueue_sync_job(db, "full")
+    claim_next_job(db, "worker-a")
+    db.query(SyncJob).filter_by(id=job.id).update({"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+
+    assert claim_next_job(db, "worker-b") is None
+    db.expire_all()
+    assert db.get(SyncJob, job.id).status == "failed"
+
+
+def test_released_job_is_requeued(db):
+    """Тест: при остановке воркера задание возвращается в очередь и сразу доступно другому"""
+    job, _ = enqueue_sync_job(db, "full")
+    claim_next_job(db, "worker-a")
+    assert release_job(db, job.id, "worker-a")
+    assert claim_next_job(db, "worker-b").lease_owner == "worker-b"
+
+
+@pytest.mark.asyncio
+async def test_worker_runs_full_job(db):
+    """Тест: воркер забирает полное задание, синхронизирует склады и завершает задание и прогон"""
+    warehouses = [Warehouse(remonline_id=4000 + i, name=f"WH {i}") for i in range(2)]
+    db.add_all(warehouses)
+    db.commit()
+    job, _ = enqueue_sync_job(db, "full")
+
+    service = ContextFakeService({4000: [_goods(1, 3)], 4001: [_goods(10, 2, residue=4)]})
+    worker = SyncWorker(
+        owner="test-worker",
+        session_factory=TestingSessionLocal,
+        service_factory=lambda: service,
+        heartbeat_seconds=0.01,
+    )
+    assert await worker.run_once() == job.id
+    assert await worker.run_once() is None
+
+    db.expire_all()
+    done = db.get(SyncJob, job.id)
+    assert done.status == "finished"
+    assert done.processed == 2 and done.total == 2
+    assert done.stats["warehouses_finished"] == 2
+    assert db.get(SyncRun, done.run_id).status == "finished"
+    assert db.query(Stock).count() == 5
+
+
+@pytest.mark.asyncio
+async def test_worker_stops_job_when_lease_is_lost(db):
+    """Тест: воркер, у которого забрали аренду, останавливает работу и не трогает задание"""
+    db.add(Warehouse(remonline_id=5000, name="Slow"))
+    db.commit()
+    job, _ = enqueue_sync_job(db, "full")
+
+    class SlowService(ContextFakeService):
+        async def fetch_goods_page(self, warehouse_rem_id, page):
+            # Пока воркер ждёт страницу, аренду забирает другой воркер
+            session = TestingSessionLocal()
+            try:
+                session.query(SyncJob).filter_by(id=job.id).update({"lease_owner": "worker-b"})
+                session.commit()
+            finally:
+                session.close()
+            await asyncio.sleep(1)
+            return []
+
+    worker = SyncWorker(
+        owner="worker-a",
+        session_factory=TestingSessionLocal,
+        service_factory=lambda: SlowService({}),
+        heartbeat_seconds=0.05,
+    )
+    await asyncio.wait_for(worker.run_once(), timeout=5)
+
+    db.expire_all()
+    stolen = db.get(SyncJob, job.id)
+    assert stolen.status == "running" and stolen.lease_owner == "worker-b"
+    # Прогон не завершён: новый владелец продолжит его с чекпоинтов
+    assert db.get(SyncRun, stolen.run_id).status == "running"
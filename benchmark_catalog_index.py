@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк индекса каталога для автодополнения (`catalog_index`): время построения и перцентили поиска.
+
+Строит индекс в памяти по синтетическому каталогу (без БД) и замеряет p50/p99 запросов
+`/products/autocomplete`: короткие префиксы, несколько токенов, артикул.
+Запуск: python benchmark_catalog_index.py [кол-во товаров]
+"""
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+from loguru import logger
+
+from app.services.catalog_index import CatalogIndex
+
+WORDS = [
+    "Дисплей", "Аккумулятор", "Чехол", "Стекло", "Шлейф", "Камера", "iPhone", "Samsung",
+    "Xiaomi", "Redmi", "Galaxy", "Pro", "Max", "Lite", "оригинал", "копия",
+]
+QUERIES = ["дисп", "iphone 12", "galaxy pro", "a1234", "чехол сам", "xiaomi redmi lite 5"]
+REPEATS = 50
+
+
+def _rows(count: int):
+    rnd = random.Random(7)
+    for i in range(count):
+        yield SimpleNamespace(
+            id=i, remonline_id=10_000_000 + i,
+            name=" ".join(rnd.choice(WORDS) for _ in range(4)) + f" {rnd.randint(1, 99)}",
+            sku=f"A{i}", code=None, barcode=None, barcodes_json=None, is_active=True,
+        )
+
+
+def _percentile(timings, share: float) -> float:
+    return timings[max(0, int(len(timings) * share) - 1)] * 1000
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    index = CatalogIndex()
+    started = time.perf_counter()
+    index.load(_rows(count))
+    build_s = time.perf_counter() - started
+
+    timings = []
+    for _ in range(REPEATS):
+        for q in QUERIES:
+            started = time.perf_counter()
+            index.search(q, limit=10)
+            timings.append(time.perf_counter() - started)
+    timings.sort()
+
+    logger.info(f"Товаров: {count}, построение индекса: {build_s:.2f} с")
+    logger.info(f"Запросов: {len(QUERIES)} × {REPEATS}")
+    logger.info(f"p50: {_percentile(timings, 0.5):6.2f} мс")
+    logger.info(f"p99: {_percentile(timings, 0.99):6.2f} мс")
+
+
+if __name__ == "__main__":
+    main()
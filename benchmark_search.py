@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк поиска товаров: исходный ilike '%q%' против поискового индекса (FTS5 trigram).
+
+Создаёт временную SQLite-базу с синтетическим каталогом и замеряет среднее время запроса.
+Запуск: python benchmark_search.py [кол-во товаров]
+"""
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from loguru import logger
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Base, Product
+from app.services.product_search import apply_ilike_search, apply_product_search, ensure_search_index
+
+WORDS = [
+    "Дисплей", "Аккумулятор", "Чехол", "Стекло", "Шлейф", "Камера", "Динамик", "Разъём",
+    "iPhone", "Samsung", "Xiaomi", "Redmi", "Galaxy", "Pro", "Max", "Lite", "Plus", "оригинал",
+]
+QUERIES = ["iphone 12", "аккумулятор", "galaxy s2", "12345", "шлейф разъём"]
+REPEATS = 20
+
+
+def _fill(session, count: int) -> None:
+    rnd = random.Random(42)
+    rows = [
+        {
+            "remonline_id": 10_000_000 + i,
+            "name": " ".join(rnd.choice(WORDS) for _ in range(4)) + f" {rnd.randint(1, 30)}",
+        }
+        for i in range(count)
+    ]
+    session.bulk_insert_mappings(Product, rows)
+    session.commit()
+
+
+def _measure(session, apply) -> float:
+    started = time.perf_counter()
+    for _ in range(REPEATS):
+        for q in QUERIES:
+            apply(session, q).limit(100).all()
+    return (time.perf_counter() - started) / (REPEATS * len(QUERIES)) * 1000
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'bench.db'}")
+        Base.metadata.create_all(bind=engine)
+        session = sessionmaker(bind=engine)()
+        _fill(session, count)
+
+        ilike_ms = _measure(session, lambda db, q: apply_ilike_search(db.query(Product), q))
+        backend = ensure_search_index(engine)
+
+        def indexed(db, q):
+            query, rank = apply_product_search(db.query(Product), db, q)
+            return query.order_by(rank.desc()) if rank is not None else query
+
+        index_ms = _measure(session, indexed)
+        session.close()
+
+    logger.info(f"Товаров: {count}, запросов: {len(QUERIES)} × {REPEATS}")
+    logger.info(f"ilike:          {ilike_ms:8.2f} мс/запрос")
+    logger.info(f"{backend:<15} {index_ms:8.2f} мс/запрос (ранжированный)")
+    logger.info(f"Ускорение: ×{ilike_ms / index_ms:.1f}")
+
+
+if __name__ == "__main__":
+    main()
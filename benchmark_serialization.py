@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк сериализации списков: APIResponse + `from_orm` на строку против быстрого пути `fast_json`
+(кортежи колонок, orjson/msgspec/json, опционально gzip).
+
+Создаёт временную SQLite-базу с синтетическим каталогом и замеряет строк в секунду для страниц
+по 1000 строк `/products/` и `/stocks/` (со складом и товаром — как отдаёт API).
+Запуск: python benchmark_serialization.py [кол-во товаров]
+"""
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from loguru import logger
+from sqlalchemy import create_engine
+from sqlalchemy.orm import joinedload, sessionmaker
+from starlette.requests import Request
+
+from app.api.fast_json import JSON_BACKEND, api_json_response
+from app.api.routes.products import PRODUCT_ROWS
+from app.api.routes.stocks import STOCK_ROWS
+from app.api.schemas import APIResponse, ProductResponse, StockResponse
+from app.models import Base, Product, Stock, Warehouse
+
+PAGE = 1000
+REPEATS = 20
+WAREHOUSES = 10
+
+
+def _fill(session, count: int) -> None:
+    rnd = random.Random(42)
+    session.bulk_insert_mappings(Warehouse, [
+        {"remonline_id": 1000 + i, "name": f"Склад {i}", "is_active": True} for i in range(WAREHOUSES)
+    ])
+    session.bulk_insert_mappings(Product, [
+        {
+            "remonline_id": 10_000_000 + i,
+            "name": f"Дисплей iPhone {rnd.randint(6, 16)} Pro Max оригинал {i}",
+            "sku": f"ART-{i}",
+            "price": round(rnd.uniform(100, 5000), 2),
+            "category": "Дисплеи",
+            "is_active": True,
+            "images_json": [{"url": f"https://cdn.example.com/goods/{i}.jpg"}],
+            "prices_json": {"1": round(rnd.uniform(100, 5000), 2), "2": round(rnd.uniform(100, 5000), 2)},
+        }
+        for i in range(count)
+    ])
+    session.bulk_insert_mappings(Stock, [
+        {"warehouse_id": 1 + i % WAREHOUSES, "product_id": 1 + i, "quantity": i % 7, "available_quantity": i % 7}
+        for i in range(count)
+    ])
+    session.commit()
+
+
+def _request(accept_encoding: str = "") -> Request:
+    headers = [(b"accept-encoding", accept_encoding.encode())] if accept_encoding else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers, "query_string": b""})
+
+
+def _rows_per_second(render) -> float:
+    render()  # прогрев
+    started = time.perf_counter()
+    for _ in range(REPEATS):
+        render()
+    return PAGE * REPEATS / (time.perf_counter() - started)
+
+
+def _api_response_body(data) -> bytes:
+    """Как FastAPI отдаёт `response_model=APIResponse`: jsonable_encoder и JSONResponse."""
+    return JSONResponse(jsonable_encoder(APIResponse(success=True, data=data, count=len(data)))).body
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'bench.db'}")
+        Base.metadata.create_all(bind=engine)
+        session = sessionmaker(bind=engine)()
+        _fill(session, count)
+        plain, gzipped = _request(), _request("gzip")
+
+        def products_orm():
+            products = session.query(Product).order_by(Product.id).limit(PAGE).all()
+            body = _api_response_body([ProductResponse.from_orm(p) for p in products])
+            session.expunge_all()
+            return body
+
+        def products_fast(request=plain):
+            rows = session.query(Product).order_by(Product.id).with_entities(*PRODUCT_ROWS.columns).limit(PAGE).all()
+            return api_json_response(request, data=PRODUCT_ROWS.dicts(rows), count=len(rows)).body
+
+        def stocks_orm():
+            stocks = (
+                session.query(Stock).options(joinedload(Stock.warehouse), joinedload(Stock.product))
+                .order_by(Stock.id).limit(PAGE).all()
+            )
+            body = _api_response_body([StockResponse.from_orm(s) for s in stocks])
+            session.expunge_all()
+            return body
+
+        def stocks_fast(request=plain):
+            rows = (
+                session.query(Stock).join(Stock.warehouse).join(Stock.product)
+                .with_entities(*STOCK_ROWS.columns).order_by(Stock.id).limit(PAGE).all()
+            )
+            return api_json_response(request, data=STOCK_ROWS.dicts(rows), count=len(rows)).body
+
+        results = []
+        for name, orm_path, fast_path in (("products", products_orm, products_fast), ("stocks", stocks_orm, stocks_fast)):
+            results.append((
+                name,
+                _rows_per_second(orm_path),
+                _rows_per_second(fast_path),
+                _rows_per_second(lambda: fast_path(gzipped)),
+                len(fast_path()),
+                len(fast_path(gzipped)),
+            ))
+        session.close()
+
+    logger.info(f"Товаров: {count}, страница: {PAGE} строк × {REPEATS}, JSON: {JSON_BACKEND}")
+    for name, orm_rps, fast_rps, gzip_rps, raw_size, gzip_size in results:
+        logger.info(f"/{name}/")
+        logger.info(f"  APIResponse + from_orm: {orm_rps:10.0f} строк/с")
+        logger.info(f"  fast_json:              {fast_rps:10.0f} строк/с (×{fast_rps / orm_rps:.1f})")
+        logger.info(
+            f"  fast_json + gzip:       {gzip_rps:10.0f} строк/с (×{gzip_rps / orm_rps:.1f}), "
+            f"тело {raw_size // 1024} → {gzip_size // 1024} КБ"
+        )
+
+
+if __name__ == "__main__":
+    main()
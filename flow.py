@@ -1,9 +1,12 @@
 import asyncio
+import sys
 from loguru import logger
 
 from app.core.config import settings
-from app.services import RemonlineService
-from app.models import Base, engine
+from app.services import RemonlineService, StockSyncEngine, SyncWorker, remonline_http
+from app.services.bulk_upsert import refresh_stock_totals
+from app.services.product_search import ensure_search_index
+from app.models import Base, engine, configure_db_threadpool
 from app.models.database import SessionLocal
 from sqlalchemy import text
 
@@ -28,11 +31,10 @@ async def sync_warehouses_to_db() -> None:
 
 
 def _ensure_products_extended_columns() -> None:
-    """Лёгкая миграция: добавить недостающие колонки в products перед синхронизацией."""
-    with engine.begin() as conn:
-        rows = conn.execute(text("PRAGMA table_info(products)")).fetchall()
-        existing = {row[1] for row in rows}
-        columns_spec = [
+    """Лёгкая миграция: добавить недостающие колонки в products и stocks перед синхронизацией."""
+    # change_gen существующих строк — 1, как в migrations/012_change_feed.sql: лента с since=0 отдаст их целиком
+    columns_by_table = {
+        "products": [
             ("code", "TEXT", None),
             ("uom_json", "JSON", None),
             ("images_json", "JSON", None),
@@ -43,14 +45,30 @@ def _ensure_products_extended_columns() -> None:
             ("is_serial", "INTEGER", "0"),
             ("warranty", "INTEGER", None),
             ("warranty_period", "INTEGER", None),
-        ]
-        for name, type_sql, default in columns_spec:
-            if name not in existing:
-                sql = f"ALTER TABLE products ADD COLUMN {name} {type_sql}"
-                if default is not None:
-                    sql += f" DEFAULT {default}"
-                conn.execute(text(sql))
-                logger.info(f"Added missing column products.{name}")
+            ("content_hash", "TEXT", None),
+            ("change_gen", "INTEGER", "1"),
+        ],
+        "stocks": [
+            ("change_gen", "INTEGER", "1"),
+        ],
+    }
+    change_gen_indexes = {"products": "idx_product_change_gen", "stocks": "idx_stock_change_gen"}
+    with engine.begin() as conn:
+        for table, columns_spec in columns_by_table.items():
+            rows = conn.execute(text(f"PRAGMA table_info({table})")).fetchall()
+            existing = {row[1] for row in rows}
+            for name, type_sql, default in columns_spec:
+                if name not in existing:
+                    sql = f"ALTER TABLE {table} ADD COLUMN {name} {type_sql}"
+                    if default is not None:
+                        sql += f" DEFAULT {default}"
+                    conn.execute(text(sql))
+                    logger.info(f"Added missing column {table}.{name}")
+                    if name == "change_gen":
+                        conn.execute(text(
+                            f"CREATE INDEX IF NOT EXISTS {change_gen_indexes[table]} ON {table} (change_gen, id)"
+                        ))
+                        conn.execute(text("INSERT OR IGNORE INTO change_counters (name, value) VALUES ('catalog', 1)"))
 
 
 async def sync_stocks_for_warehouse_37746() -> None:
@@ -59,12 +77,13 @@ async def sync_stocks_for_warehouse_37746() -> None:
 
     Base.metadata.create_all(bind=engine)
     _ensure_products_extended_columns()
+    ensure_search_index(engine)
 
     db = SessionLocal()
     try:
         async with RemonlineService() as service:
             # Убедимся, что склад существует в БД
-            from app.models import Warehouse, Product, Stock, LastUpdate
+            from app.models import Warehouse, LastUpdate
 
             warehouse = db.query(Warehouse).filter(Warehouse.remonline_id == 37746).first()
             if not warehouse:
@@ -73,126 +92,9 @@ async def sync_stocks_for_warehouse_37746() -> None:
                 db.add(warehouse)
                 db.flush()
 
-            async for goods_page in service._iterate_paginated(f"warehouse/goods/{37746}"):
-                logger.info(f"Processing page with {len(goods_page)} goods for warehouse 37746")
-
-                for good_data in goods_page:
-                    # ID товара (обязателен)
-                    good_id = good_data.get("id")
-                    if not good_id:
-                        logger.error(f"Skip good without id: {good_data}")
-                        continue
-
-                # Основные поля
-                product_name = good_data.get("title", "")
-                product_sku = good_data.get("article", "")
-                product_code = good_data.get("code")
-                barcodes_list = good_data.get("barcodes", []) or []
-                product_barcode = None
-                if isinstance(barcodes_list, list) and barcodes_list:
-                    first_barcode = barcodes_list[0]
-                    if isinstance(first_barcode, dict):
-                        product_barcode = first_barcode.get("code")
-
-                # Композитные/доп. поля
-                uom_json = good_data.get("uom")
-                images_json = good_data.get("image")
-                prices_json = good_data.get("price")
-                category_json = good_data.get("category")
-                custom_fields_json = good_data.get("custom_fields")
-                is_serial = bool(good_data.get("is_serial", False))
-                warranty = good_data.get("warranty")
-                warranty_period = good_data.get("warranty_period")
-                description = good_data.get("description")
-
-                # Одно число цены (если нужно агрегировать)
-                price_value = None
-                if isinstance(prices_json, dict) and prices_json:
-                    non_zero = [v for v in prices_json.values() if isinstance(v, (int, float)) and v]
-                    price_value = (non_zero[0] if non_zero else list(prices_json.values())[0])
-
-                # Апсерт товара
-                product = db.query(Product).filter_by(remonline_id=good_id).first()
-                if not product:
-                    product = Product(
-                        remonline_id=good_id,
-                        name=product_name,
-                        sku=product_sku,
-                        barcode=product_barcode,
-                        code=product_code,
-                        uom_json=uom_json,
-                        images_json=images_json,
-                        prices_json=prices_json,
-                        category_json=category_json,
-                        category=(category_json.get("title") if isinstance(category_json, dict) else None),
-                        custom_fields_json=custom_fields_json,
-                        barcodes_json=barcodes_list,
-                        is_serial=is_serial,
-                        warranty=warranty,
-                        warranty_period=warranty_period,
-                        description=description,
-                        price=price_value,
-                    )
-                    db.add(product)
-                    db.flush()
-                else:
-                    product.name = product_name or product.name
-                    product.sku = product_sku or product.sku
-                    if product_barcode:
-                        product.barcode = product_barcode
-                    if product_code:
-                        product.code = product_code
-                    if uom_json is not None:
-                        product.uom_json = uom_json
-                    if images_json is not None:
-                        product.images_json = images_json
-                    if prices_json is not None:
-                        product.prices_json = prices_json
-                    if category_json is not None:
-                        product.category_json = category_json
-                        if isinstance(category_json, dict):
-                            title_value = category_json.get("title")
-                            if title_value:
-                                product.category = title_value
-                    if custom_fields_json is not None:
-                        product.custom_fields_json = custom_fields_json
-                    if barcodes_list is not None:
-                        product.barcodes_json = barcodes_list
-                    product.is_serial = is_serial
-                    if warranty is not None:
-                        product.warranty = warranty
-                    if warranty_period is not None:
-                        product.warranty_period = warranty_period
-                    if description is not None:
-                        product.description = description
-                    if price_value is not None:
-                        product.price = price_value
-
-                # Количество
-                quantity = good_data.get("residue", 0.0) or 0.0
-
-                # Апсерт остатков
-                stock = db.query(Stock).filter_by(
-                    warehouse_id=warehouse.id,
-                    product_id=product.id,
-                ).first()
-
-                if not stock:
-                    stock = Stock(
-                        warehouse_id=warehouse.id,
-                        product_id=product.id,
-                        quantity=quantity,
-                        reserved_quantity=0,
-                        available_quantity=quantity,
-                    )
-                    db.add(stock)
-                else:
-                    stock.quantity = quantity
-                    stock.available_quantity = quantity
-
-                # Коммит после страницы
-                db.commit()
-                logger.info("Committed goods page for warehouse 37746")
+            # Товары и остатки — через общий конвейер с set-based апсертами
+            stats = await StockSyncEngine(service, db).run([warehouse])
+            logger.info(f"Warehouse 37746 sync stats: {stats}")
 
             # отметка обновления
             last_update = db.query(LastUpdate).filter_by(entity_type="products_stocks").first()
@@ -209,8 +111,27 @@ async def sync_stocks_for_warehouse_37746() -> None:
         db.close()
 
 
+async def run_sync_worker() -> None:
+    """Отдельный процесс-воркер: забирать задания синхронизации из очереди `sync_jobs` и выполнять их.
+
+    API-процессы только ставят задания и читают прогресс; воркеров может быть несколько —
+    задание берёт один из них под аренду, а после падения воркера его продолжает другой.
+    """
+    Base.metadata.create_all(bind=engine)
+    ensure_search_index(engine)
+    configure_db_threadpool(settings.DB_THREADPOOL_SIZE)
+    worker = SyncWorker()
+    try:
+        await worker.run_forever()
+    finally:
+        await remonline_http.stop()
+
+
 def main() -> None:
     logger.info(f"Database URL: {settings.DATABASE_URL}")
+    if sys.argv[1:] == ["worker"]:
+        asyncio.run(run_sync_worker())
+        return
     asyncio.run(sync_warehouses_to_db())
     # asyncio.run(sync_stocks_for_warehouse_37746())
     # asyncio.run(update_first_product_and_stocks())
@@ -227,6 +148,7 @@ async def update_first_product_and_stocks() -> None:
     logger.info("Starting update_first_product_and_stocks flow")
     Base.metadata.create_all(bind=engine)
     _ensure_products_extended_columns()
+    ensure_search_index(engine)
 
     db = SessionLocal()
     try:
@@ -357,6 +279,8 @@ async def update_first_product_and_stocks() -> None:
                                     stock.available_quantity = quantity
 
                                 found_on_wh = True
+                                db.flush()
+                                refresh_stock_totals(db, [first_product.id])
                                 break
 
                         db.commit()
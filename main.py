@@ -6,13 +6,16 @@ from fastapi.responses import FileResponse
 from loguru import logger
 import asyncio
 
-from app.models import Base, engine
+from app.models import Base, engine, configure_db_threadpool, run_db
 from app.api import api_router
-from app.services import BackgroundService
+from app.api.routes.stocks import resume_interrupted_full_sync
+from app.services import BackgroundService, SyncWorker, ensure_search_index, remonline_http
 from app.core.config import settings
 from prometheus_fastapi_instrumentator import Instrumentator
 # Создаем таблицы в базе данных
 Base.metadata.create_all(bind=engine)
+# Поисковый индекс товаров (FTS5 в SQLite, pg_trgm в PostgreSQL) не описан в моделях
+ensure_search_index(engine)
 
 # Создаем FastAPI приложение
 app = FastAPI(
@@ -35,6 +38,9 @@ app.include_router(api_router, prefix="/api/v1")
 
 # Создаем экземпляр сервиса фоновых задач
 background_service = BackgroundService()
+# Встроенный воркер синхронизации (SYNC_WORKER_EMBEDDED); отдельный процесс — `python flow.py worker`
+sync_worker = SyncWorker()
+sync_worker_task = None
 
 @app.on_event("startup")
 async def startup_event():
@@ -43,14 +49,34 @@ async def startup_event():
     # logger.info(f"Database URL: {settings.DATABASE_URL}")
     logger.info(f"Update interval: {settings.UPDATE_INTERVAL_MINUTES} minutes")
 
+    # Пул потоков для работы с БД: `def`-маршруты, get_db и run_db
+    configure_db_threadpool(settings.DB_THREADPOOL_SIZE)
+
+    # Общий HTTP-клиент Remonline живёт столько же, сколько приложение
+    await remonline_http.start()
+
     # Запускаем фоновые задачи
     # await background_service.start_background_tasks()
 
+    # Продолжаем полную синхронизацию, прерванную рестартом или деплоем
+    if settings.SYNC_RESUME_ON_STARTUP:
+        await run_db(resume_interrupted_full_sync)
+
+    # API только ставит задания синхронизации в очередь; выполняет их воркер
+    global sync_worker_task
+    if settings.SYNC_WORKER_EMBEDDED:
+        sync_worker_task = asyncio.create_task(sync_worker.run_forever())
+
 @app.on_event("shutdown")
 async def shutdown_event():
     """Действия при остановке приложения"""
     logger.info("Shutting down Remonline Adminer API")
     await background_service.stop_background_tasks()
+    if sync_worker_task is not None:
+        # Задание в работе возвращается в очередь и продолжится с чекпоинтов
+        sync_worker_task.cancel()
+        await asyncio.gather(sync_worker_task, return_exceptions=True)
+    await remonline_http.stop()
 
 @app.get("/")
 async def root():
@@ -75,7 +101,10 @@ async def health_check():
     return {
         "status": "healthy",
         "database": "connected",
-        "background_tasks": background_service.is_running
+        "background_tasks": background_service.is_running,
+        "sync_worker": sync_worker_task is not None and not sync_worker_task.done(),
+        # Лидер синхронизации — единственный процесс, который сейчас тратит лимит запросов Remonline
+        "sync_leader": sync_worker.leadership.held
     }
 
 def main():
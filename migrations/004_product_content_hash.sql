@@ -0,0 +1,5 @@
+-- Миграция: отпечаток данных товара для пропуска неизменённых UPDATE при синхронизации
+-- Создано: 2026-10-17
+-- Описание: products.content_hash — sha256 нормализованного payload Remonline
+
+ALTER TABLE products ADD COLUMN content_hash VARCHAR(64);
@@ -0,0 +1,22 @@
+-- Миграция: курсоры синхронизации складов
+-- Создано: 2026-10-17
+-- Описание: итог последнего прогона по складу и время следующего для инкрементальной синхронизации
+
+CREATE TABLE IF NOT EXISTS warehouse_sync_cursors (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    warehouse_id INTEGER NOT NULL UNIQUE,
+    last_synced_at DATETIME,
+    last_changed_at DATETIME,
+    next_sync_at DATETIME,
+    pages INTEGER DEFAULT 0,
+    items INTEGER DEFAULT 0,
+    checksum VARCHAR(64),
+    unchanged_runs INTEGER DEFAULT 0,
+    status VARCHAR DEFAULT 'success',
+    error_message VARCHAR,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (warehouse_id) REFERENCES warehouses(id)
+);
+
+-- Выбор складов, которым пора синхронизироваться
+CREATE INDEX IF NOT EXISTS idx_warehouse_sync_cursors_next ON warehouse_sync_cursors(next_sync_at);
@@ -0,0 +1,23 @@
+-- Миграция: возобновляемая полная синхронизация
+-- Создано: 2026-10-17
+-- Описание: прогоны полной синхронизации и постраничные чекпоинты складов
+
+CREATE TABLE IF NOT EXISTS sync_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    status VARCHAR DEFAULT 'running',
+    warehouses_total INTEGER DEFAULT 0,
+    started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    finished_at DATETIME,
+    message VARCHAR
+);
+
+CREATE INDEX IF NOT EXISTS idx_sync_runs_status ON sync_runs(status);
+
+ALTER TABLE warehouse_sync_cursors ADD COLUMN run_id INTEGER REFERENCES sync_runs(id);
+ALTER TABLE warehouse_sync_cursors ADD COLUMN run_page INTEGER DEFAULT 0;
+ALTER TABLE warehouse_sync_cursors ADD COLUMN run_pages INTEGER DEFAULT 0;
+ALTER TABLE warehouse_sync_cursors ADD COLUMN run_items INTEGER DEFAULT 0;
+ALTER TABLE warehouse_sync_cursors ADD COLUMN run_checksum VARCHAR(64);
+ALTER TABLE warehouse_sync_cursors ADD COLUMN run_finished BOOLEAN DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_warehouse_sync_cursors_run ON warehouse_sync_cursors(run_id);
@@ -0,0 +1,24 @@
+-- Миграция: агрегат остатков по товарам
+-- Создано: 2026-10-17
+-- Описание: product_stock_totals поддерживается синхронизацией; фильтр/сортировка по общему остатку без GROUP BY
+
+CREATE TABLE IF NOT EXISTS product_stock_totals (
+    product_id INTEGER PRIMARY KEY,
+    total_available FLOAT NOT NULL DEFAULT 0,
+    total_quantity FLOAT NOT NULL DEFAULT 0,
+    warehouses_in_stock INTEGER NOT NULL DEFAULT 0,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (product_id) REFERENCES products(id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_product_stock_totals_total_available ON product_stock_totals(total_available);
+
+-- Начальное заполнение из текущих остатков
+INSERT INTO product_stock_totals (product_id, total_available, total_quantity, warehouses_in_stock)
+SELECT product_id,
+       SUM(available_quantity),
+       SUM(quantity),
+       SUM(CASE WHEN available_quantity > 0 THEN 1 ELSE 0 END)
+FROM stocks
+WHERE product_id NOT IN (SELECT product_id FROM product_stock_totals)
+GROUP BY product_id;
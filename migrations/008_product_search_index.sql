@@ -0,0 +1,23 @@
+-- Миграция: поисковый индекс товаров по названию и RemID
+-- Создано: 2026-10-17
+-- Описание: SQLite — теневая FTS5-таблица products_fts (trigram, rowid = products.id),
+-- поддерживается триггерами на products; PostgreSQL — pg_trgm GIN-индексы (блок ниже).
+-- Приложение создаёт индекс само при старте (product_search.ensure_search_index).
+
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(name, remonline_id, tokenize = 'trigram');
+
+CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN INSERT INTO products_fts (rowid, name, remonline_id) VALUES (new.id, new.name, CAST(new.remonline_id AS TEXT)); END;
+
+CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN DELETE FROM products_fts WHERE rowid = old.id; END;
+
+CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, remonline_id ON products BEGIN DELETE FROM products_fts WHERE rowid = old.id; INSERT INTO products_fts (rowid, name, remonline_id) VALUES (new.id, new.name, CAST(new.remonline_id AS TEXT)); END;
+
+DELETE FROM products_fts;
+
+INSERT INTO products_fts (rowid, name, remonline_id)
+SELECT id, name, CAST(remonline_id AS TEXT) FROM products;
+
+-- PostgreSQL:
+-- CREATE EXTENSION IF NOT EXISTS pg_trgm;
+-- CREATE INDEX IF NOT EXISTS idx_products_name_trgm ON products USING gin (name gin_trgm_ops);
+-- CREATE INDEX IF NOT EXISTS idx_products_remonline_id_trgm ON products USING gin ((CAST(remonline_id AS TEXT)) gin_trgm_ops);
@@ -0,0 +1,25 @@
+-- Миграция: индекс расположения товаров по складам
+-- Создано: 2026-10-17
+-- Описание: product_locations — на каких складах товар Remonline видели последний раз; поиск товара сначала идёт по этим складам
+
+CREATE TABLE IF NOT EXISTS product_locations (
+    remonline_id INTEGER NOT NULL,
+    warehouse_id INTEGER NOT NULL,
+    last_seen_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (remonline_id, warehouse_id),
+    FOREIGN KEY (warehouse_id) REFERENCES warehouses(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_product_locations_warehouse ON product_locations(warehouse_id);
+
+-- Начальное заполнение из текущих остатков
+INSERT INTO product_locations (remonline_id, warehouse_id, last_seen_at)
+SELECT p.remonline_id, s.warehouse_id, COALESCE(s.updated_at, CURRENT_TIMESTAMP)
+FROM stocks s
+JOIN products p ON p.id = s.product_id
+WHERE p.remonline_id IS NOT NULL
+  AND s.quantity > 0
+  AND NOT EXISTS (
+      SELECT 1 FROM product_locations l
+      WHERE l.remonline_id = p.remonline_id AND l.warehouse_id = s.warehouse_id
+  );
@@ -0,0 +1,26 @@
+-- Миграция: очередь заданий синхронизации
+-- Создано: 2026-10-17
+-- Описание: sync_jobs — задания, которые API ставит в очередь, а воркер синхронизации забирает под аренду с heartbeat
+
+CREATE TABLE IF NOT EXISTS sync_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind VARCHAR NOT NULL DEFAULT 'full',
+    status VARCHAR NOT NULL DEFAULT 'queued',
+    run_id INTEGER,
+    lease_owner VARCHAR,
+    lease_expires_at DATETIME,
+    heartbeat_at DATETIME,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER DEFAULT 0,
+    total INTEGER DEFAULT 0,
+    message VARCHAR,
+    stats JSON,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    started_at DATETIME,
+    finished_at DATETIME,
+    FOREIGN KEY (run_id) REFERENCES sync_runs(id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_sync_jobs_id ON sync_jobs(id);
+CREATE INDEX IF NOT EXISTS ix_sync_jobs_status ON sync_jobs(status);
+CREATE INDEX IF NOT EXISTS ix_sync_jobs_lease_expires_at ON sync_jobs(lease_expires_at);
@@ -0,0 +1,10 @@
+-- Миграция: блокировки сервисов с арендой
+-- Создано: 2026-10-17
+-- Описание: service_locks — выбор лидера синхронизации между процессами и узлами там, где нет advisory-блокировок PostgreSQL (SQLite)
+
+CREATE TABLE IF NOT EXISTS service_locks (
+    name VARCHAR PRIMARY KEY,
+    owner VARCHAR NOT NULL,
+    acquired_at DATETIME NOT NULL,
+    expires_at DATETIME NOT NULL
+);
@@ -0,0 +1,18 @@
+-- Миграция: лента изменений товаров и остатков
+-- Создано: 2026-10-17
+-- Описание: products.change_gen и stocks.change_gen — поколение последней записи (индексы по (change_gen, id) для /api/v1/changes), change_counters — счётчик поколений. Существующие строки получают поколение 1: клиент с since=0 загружает их целиком
+
+ALTER TABLE products ADD COLUMN change_gen BIGINT;
+ALTER TABLE stocks ADD COLUMN change_gen BIGINT;
+
+CREATE TABLE IF NOT EXISTS change_counters (
+    name VARCHAR PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0
+);
+
+UPDATE products SET change_gen = 1 WHERE change_gen IS NULL;
+UPDATE stocks SET change_gen = 1 WHERE change_gen IS NULL;
+INSERT INTO change_counters (name, value) VALUES ('catalog', 1);
+
+CREATE INDEX IF NOT EXISTS idx_product_change_gen ON products (change_gen, id);
+CREATE INDEX IF NOT EXISTS idx_stock_change_gen ON stocks (change_gen, id);
@@ -0,0 +1,7 @@
+-- Миграция: составные индексы сортировок списка товаров
+-- Создано: 2026-10-17
+-- Описание: индексы (name, id), (price, id), (category, id) для keyset-пагинации /api/v1/products/filtered и /matrix: условие (колонка, id) > (значение, id) и ORDER BY колонка, id идут по индексу в обе стороны
+
+CREATE INDEX IF NOT EXISTS idx_product_name_id ON products (name, id);
+CREATE INDEX IF NOT EXISTS idx_product_price_id ON products (price, id);
+CREATE INDEX IF NOT EXISTS idx_product_category_id ON products (category, id);